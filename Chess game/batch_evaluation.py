@@ -0,0 +1,219 @@
+"""Batched static evaluation with NumPy.
+
+Positions are encoded as an (N, 12, 64) array of piece planes, one plane per
+color and piece type in PLANES order, indexed by square row * 8 + col. The
+terms of evaluation.evaluate (material, piece-square tables, mobility and
+pawn structure, tapered by game phase) are computed for the whole batch
+with array operations and give exactly the same scores:
+
+    scores = evaluate_batch(*encode(boards))
+
+Evaluate every position of a PGN file in chunks:
+
+    for scores in evaluate_pgn('archive.pgn', chunk_size=8192):
+        ...
+
+NumPy is only needed by this module; the game and engine do not use it.
+eval_check.py compares its scores with evaluation.evaluate_full on random
+games whenever NumPy is installed.
+"""
+import numpy as np
+
+from evaluation import (PIECE_VALUES, PHASE_WEIGHTS, MAX_PHASE, PST_MIDDLEGAME, PST_ENDGAME,
+                        MOBILITY_MIDDLEGAME, MOBILITY_ENDGAME, DOUBLED_PAWN_MIDDLEGAME, DOUBLED_PAWN_ENDGAME,
+                        ISOLATED_PAWN_MIDDLEGAME, ISOLATED_PAWN_ENDGAME, PASSED_PAWN_MIDDLEGAME,
+                        PASSED_PAWN_ENDGAME, KNIGHT_TARGETS, ORTHOGONAL, DIAGONAL)
+from pgn import read_games, replay
+
+PLANES = [(color, symbol) for color in 'wb' for symbol in 'PNBRQK']
+PLANE_INDEX = {plane: index for index, plane in enumerate(PLANES)}
+WHITE_PAWN, BLACK_PAWN = PLANE_INDEX['w', 'P'], PLANE_INDEX['b', 'P']
+
+
+def square_weights(tables):
+    """Return the (12, 64) value plus piece-square weights, negated and mirrored for Black."""
+    weights = np.zeros((len(PLANES), 64), dtype=np.float64)
+    for index, (color, symbol) in enumerate(PLANES):
+        table = np.array(tables[symbol], dtype=np.float64) + PIECE_VALUES[symbol]
+        weights[index] = table if color == 'w' else -table.reshape(8, 8)[::-1].reshape(64)
+    return weights
+
+
+MIDDLEGAME_WEIGHTS = square_weights(PST_MIDDLEGAME)
+ENDGAME_WEIGHTS = square_weights(PST_ENDGAME)
+PHASE_VECTOR = np.array([PHASE_WEIGHTS[symbol] for _, symbol in PLANES], dtype=np.int64)
+
+# KNIGHT_MASK[s, t] is 1 when a knight on s attacks t. Weights and masks used in
+# matrix products are float64 so the products run on BLAS; every sum is an
+# integer far below 2 ** 53, so converting back to int64 is exact.
+KNIGHT_MASK = np.zeros((64, 64), dtype=np.float64)
+for square, targets in enumerate(KNIGHT_TARGETS):
+    for row, col in targets:
+        KNIGHT_MASK[square, row * 8 + col] = 1
+
+
+def ray_tables(direction):
+    """Return the target square and on-board mask of each step 1..7 along direction, per square."""
+    dr, dc = direction
+    targets = np.zeros((7, 64), dtype=np.int64)
+    valid = np.zeros((7, 64), dtype=bool)
+    for square in range(64):
+        row, col = divmod(square, 8)
+        for step in range(7):
+            r, c = row + dr * (step + 1), col + dc * (step + 1)
+            if 0 <= r < 8 and 0 <= c < 8:
+                targets[step, square] = r * 8 + c
+                valid[step, square] = True
+    return targets, valid
+
+
+RAYS = {direction: ray_tables(direction) for direction in ORTHOGONAL + DIAGONAL}
+
+# Passed pawn bonus by row for a pawn moving up the board (White's orientation)
+PASSED_MIDDLEGAME_BY_ROW = np.array(PASSED_PAWN_MIDDLEGAME[::-1], dtype=np.int64).reshape(8, 1)
+PASSED_ENDGAME_BY_ROW = np.array(PASSED_PAWN_ENDGAME[::-1], dtype=np.int64).reshape(8, 1)
+
+
+def encode_board(board, planes, turns, index):
+    """Write board into row index of preallocated planes and turns arrays."""
+    planes[index] = 0
+    for color in 'wb':
+        for piece in board.pieces[color]:
+            planes[index, PLANE_INDEX[color, piece.symbol], piece.row * 8 + piece.col] = 1
+    turns[index] = board.white_turn
+
+
+def encode(boards):
+    """Return (planes, white_turn) arrays for a sequence of boards."""
+    planes = np.zeros((len(boards), len(PLANES), 64), dtype=np.uint8)
+    turns = np.zeros(len(boards), dtype=bool)
+    for index, board in enumerate(boards):
+        encode_board(board, planes, turns, index)
+    return planes, turns
+
+
+def ray_mobility(empty, available, positions, squares, direction):
+    """Count the squares each slider reaches along direction.
+
+    The sliders stand on squares[i] of position positions[i]. empty marks
+    empty squares and available the squares a piece may move to (empty or
+    enemy), both as (N, 64) boolean arrays.
+    """
+    targets, valid = RAYS[direction]
+    count = np.zeros(len(positions), dtype=np.int64)
+    open_ray = np.ones(len(positions), dtype=bool)
+    for step in range(7):
+        target = targets[step, squares]
+        reach = open_ray & valid[step, squares]
+        count += reach & available[positions, target]
+        open_ray = reach & empty[positions, target]
+    return count
+
+
+def mobility_terms(planes, color, empty, available):
+    """Return the (middlegame, endgame) mobility of color's pieces for every position."""
+    knights = planes[:, PLANE_INDEX[color, 'N']]
+    moves = (knights * (available.astype(np.float64) @ KNIGHT_MASK.T)).sum(axis=1).astype(np.int64)
+    middlegame = MOBILITY_MIDDLEGAME['N'] * moves
+    endgame = MOBILITY_ENDGAME['N'] * moves
+    for symbol, directions in (('B', DIAGONAL), ('R', ORTHOGONAL), ('Q', ORTHOGONAL + DIAGONAL)):
+        positions, squares = np.nonzero(planes[:, PLANE_INDEX[color, symbol]])
+        piece_moves = sum(ray_mobility(empty, available, positions, squares, direction)
+                          for direction in directions)
+        moves = np.bincount(positions, weights=piece_moves, minlength=len(planes)).astype(np.int64)
+        middlegame += MOBILITY_MIDDLEGAME[symbol] * moves
+        endgame += MOBILITY_ENDGAME[symbol] * moves
+    return middlegame, endgame
+
+
+def pawn_terms(own, enemy):
+    """Return the (middlegame, endgame) pawn structure of own pawns moving up the board.
+
+    own and enemy are (N, 8, 8) pawn planes by row and column.
+    """
+    files = own.sum(axis=1)
+    doubled = np.clip(files - 1, 0, None).sum(axis=1)
+    padded = np.pad(files, ((0, 0), (1, 1)))
+    isolated = (files * ((padded[:, :-2] == 0) & (padded[:, 2:] == 0))).sum(axis=1)
+
+    # An enemy pawn on this or an adjacent file in a row above stops a passed pawn
+    guards = enemy.copy()
+    guards[:, :, 1:] |= enemy[:, :, :-1]
+    guards[:, :, :-1] |= enemy[:, :, 1:]
+    guarded = np.logical_or.accumulate(guards, axis=1)
+    ahead = np.zeros_like(guarded)
+    ahead[:, 1:] = guarded[:, :-1]
+    passed = (own & ~ahead).astype(np.int64)
+
+    middlegame = (DOUBLED_PAWN_MIDDLEGAME * doubled + ISOLATED_PAWN_MIDDLEGAME * isolated
+                  + (passed * PASSED_MIDDLEGAME_BY_ROW).sum(axis=(1, 2)))
+    endgame = (DOUBLED_PAWN_ENDGAME * doubled + ISOLATED_PAWN_ENDGAME * isolated
+               + (passed * PASSED_ENDGAME_BY_ROW).sum(axis=(1, 2)))
+    return middlegame, endgame
+
+
+def evaluate_batch(planes, white_turn):
+    """Return the evaluations of encoded positions in centipawns for the side to move."""
+    planes = np.asarray(planes)
+    n = len(planes)
+    flat = planes.reshape(n, -1).astype(np.float64)
+    middlegame = (flat @ MIDDLEGAME_WEIGHTS.reshape(-1)).astype(np.int64)
+    endgame = (flat @ ENDGAME_WEIGHTS.reshape(-1)).astype(np.int64)
+    phase = np.minimum(planes.sum(axis=2, dtype=np.int64) @ PHASE_VECTOR, MAX_PHASE)
+
+    white = planes[:, :6].any(axis=1)
+    black = planes[:, 6:].any(axis=1)
+    empty = ~(white | black)
+    for color, sign, own in (('w', 1, white), ('b', -1, black)):
+        mobility_middlegame, mobility_endgame = mobility_terms(planes, color, empty, ~own)
+        middlegame += sign * mobility_middlegame
+        endgame += sign * mobility_endgame
+
+    white_pawns = planes[:, WHITE_PAWN].reshape(n, 8, 8).astype(bool)
+    black_pawns = planes[:, BLACK_PAWN].reshape(n, 8, 8).astype(bool)
+    # Black's pawns are scored on the board flipped upside down
+    for sign, own, enemy in ((1, white_pawns, black_pawns), (-1, black_pawns[:, ::-1], white_pawns[:, ::-1])):
+        pawn_middlegame, pawn_endgame = pawn_terms(own, enemy)
+        middlegame += sign * pawn_middlegame
+        endgame += sign * pawn_endgame
+
+    score = (middlegame * phase + endgame * (MAX_PHASE - phase)) // MAX_PHASE
+    return np.where(white_turn, score, -score)
+
+
+def evaluate_boards(boards):
+    return evaluate_batch(*encode(boards))
+
+
+def evaluate_stream(boards, chunk_size=4096):
+    """Evaluate an iterable of boards in chunks, yielding an array of scores per chunk.
+
+    Each board is encoded as soon as it arrives, so the iterable may yield
+    the same Board object again after changing it, as pgn.replay does.
+    """
+    planes = np.zeros((chunk_size, len(PLANES), 64), dtype=np.uint8)
+    turns = np.zeros(chunk_size, dtype=bool)
+    count = 0
+    for board in boards:
+        encode_board(board, planes, turns, count)
+        count += 1
+        if count == chunk_size:
+            yield evaluate_batch(planes, turns)
+            count = 0
+    if count:
+        yield evaluate_batch(planes[:count], turns[:count])
+
+
+def pgn_positions(path):
+    """Yield the position after every move of every game in a PGN file, skipping illegal moves' games."""
+    for game in read_games(path):
+        try:
+            for _, _, board in replay(game):
+                yield board
+        except ValueError:
+            continue
+
+
+def evaluate_pgn(path, chunk_size=4096):
+    """Evaluate every position of a PGN file, yielding an array of scores per chunk."""
+    return evaluate_stream(pgn_positions(path), chunk_size)
@@ -0,0 +1,428 @@
+"""Bitboard position representation and move generator.
+
+Squares are numbered row * 8 + col with the same orientation as Board.board,
+so square 0 is a8 and square 63 is h1. Every piece type of every color is a
+64-bit Python integer, and each color also keeps an occupancy bitboard.
+"""
+from chess import Board, Pawn, Knight, Bishop, Rook, Queen, King, ROWS, COLS
+
+WHITE, BLACK = 0, 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+PIECE_SYMBOLS = 'PNBRQK'
+
+# Castling rights bits
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+
+# Shared (color, piece type) tuples stored in Position.squares
+PIECES = [[(color, piece_type) for piece_type in range(6)] for color in (WHITE, BLACK)]
+
+RANKS = [0xFF << (8 * row) for row in range(8)]
+FULL = (1 << 64) - 1
+
+
+def _leaper_attacks(offsets):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        attacks = 0
+        for dr, dc in offsets:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8:
+                attacks |= 1 << (r * 8 + c)
+        table.append(attacks)
+    return table
+
+
+def _ray_table(dr, dc):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        ray = 0
+        r, c = row + dr, col + dc
+        while 0 <= r < 8 and 0 <= c < 8:
+            ray |= 1 << (r * 8 + c)
+            r += dr
+            c += dc
+        table.append(ray)
+    return table
+
+
+KNIGHT_ATTACKS = _leaper_attacks([(2, 1), (2, -1), (-2, 1), (-2, -1),
+                                  (1, 2), (1, -2), (-1, 2), (-1, -2)])
+KING_ATTACKS = _leaper_attacks([(-1, -1), (-1, 0), (-1, 1), (0, -1),
+                                (0, 1), (1, -1), (1, 0), (1, 1)])
+# Squares attacked by a pawn of each color standing on a square
+PAWN_ATTACKS = [_leaper_attacks([(-1, -1), (-1, 1)]), _leaper_attacks([(1, -1), (1, 1)])]
+
+# Each ray is stored with whether it runs towards higher square numbers, which
+# decides whether its first blocker is the lowest or the highest set bit
+ROOK_RAYS = [(_ray_table(dr, dc), dr * 8 + dc > 0) for dr, dc in [(1, 0), (-1, 0), (0, 1), (0, -1)]]
+BISHOP_RAYS = [(_ray_table(dr, dc), dr * 8 + dc > 0) for dr, dc in [(1, 1), (1, -1), (-1, 1), (-1, -1)]]
+
+# Castling rights kept when a move touches a square (king or rook leaving, rook captured)
+CASTLING_MASK = [15] * 64
+CASTLING_MASK[60] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASK[63] = 15 & ~WHITE_KINGSIDE
+CASTLING_MASK[56] = 15 & ~WHITE_QUEENSIDE
+CASTLING_MASK[4] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASK[7] = 15 & ~BLACK_KINGSIDE
+CASTLING_MASK[0] = 15 & ~BLACK_QUEENSIDE
+
+
+def slider_attacks(sq, occupied, rays):
+    """Return the squares a slider on sq attacks along rays, stopping at the first blocker."""
+    attacks = 0
+    for table, positive in rays:
+        ray = table[sq]
+        blockers = ray & occupied
+        if blockers:
+            if positive:
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            ray ^= table[first]
+        attacks |= ray
+    return attacks
+
+
+def rook_attacks(sq, occupied):
+    return slider_attacks(sq, occupied, ROOK_RAYS)
+
+
+def bishop_attacks(sq, occupied):
+    return slider_attacks(sq, occupied, BISHOP_RAYS)
+
+
+def squares_of(bb):
+    """Yield the square numbers of the set bits of bb."""
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+
+def _line_tables():
+    """Return the BETWEEN and LINE tables of every pair of squares.
+
+    BETWEEN[a][b] holds the squares strictly between a and b, and LINE[a][b]
+    the whole rank, file or diagonal through both; both are 0 when a and b
+    are not on a common line.
+    """
+    between = [[0] * 64 for _ in range(64)]
+    line = [[0] * 64 for _ in range(64)]
+    for table, _ in ROOK_RAYS + BISHOP_RAYS:
+        for a in range(64):
+            for b in squares_of(table[a]):
+                between[a][b] = table[a] & ~table[b] & ~(1 << b)
+    for tables in ((ROOK_RAYS[0], ROOK_RAYS[1]), (ROOK_RAYS[2], ROOK_RAYS[3]),
+                   (BISHOP_RAYS[0], BISHOP_RAYS[3]), (BISHOP_RAYS[1], BISHOP_RAYS[2])):
+        for a in range(64):
+            full = tables[0][0][a] | tables[1][0][a] | (1 << a)
+            for b in squares_of(full & ~(1 << a)):
+                line[a][b] = full
+    return between, line
+
+
+BETWEEN, LINE = _line_tables()
+
+
+def encode_move(from_sq, to_sq, promotion=0):
+    """Pack a move into an int: from square, to square and promotion piece type (0 for none)."""
+    return from_sq | (to_sq << 6) | (promotion << 12)
+
+
+def decode_move(move):
+    return move & 63, (move >> 6) & 63, move >> 12
+
+
+class Position:
+    def __init__(self):
+        self.pieces = [[0] * 6, [0] * 6]
+        self.occupied = [0, 0]
+        self.squares = [None] * 64
+        self.side = WHITE
+        self.castling = 0
+        self.ep_square = -1
+
+    def put_piece(self, sq, color, piece_type):
+        bit = 1 << sq
+        self.pieces[color][piece_type] |= bit
+        self.occupied[color] |= bit
+        self.squares[sq] = PIECES[color][piece_type]
+
+    def remove_piece(self, sq):
+        color, piece_type = self.squares[sq]
+        bit = 1 << sq
+        self.pieces[color][piece_type] ^= bit
+        self.occupied[color] ^= bit
+        self.squares[sq] = None
+
+    def king_square(self, color):
+        return self.pieces[color][KING].bit_length() - 1
+
+    def attacked(self, sq, by):
+        """Return True if color by attacks square sq."""
+        pieces = self.pieces[by]
+        occupied = self.occupied[0] | self.occupied[1]
+        return bool(KNIGHT_ATTACKS[sq] & pieces[KNIGHT]
+                    or PAWN_ATTACKS[by ^ 1][sq] & pieces[PAWN]
+                    or KING_ATTACKS[sq] & pieces[KING]
+                    or bishop_attacks(sq, occupied) & (pieces[BISHOP] | pieces[QUEEN])
+                    or rook_attacks(sq, occupied) & (pieces[ROOK] | pieces[QUEEN]))
+
+    def in_check(self):
+        return self.attacked(self.king_square(self.side), self.side ^ 1)
+
+    def _leaves_king_safe(self, from_sq, to_sq, king_sq, captured_sq):
+        """Return True if moving from_sq to to_sq does not leave the side to move in check.
+
+        Works on the occupancy after the move without applying it; captured_sq is
+        the square of the captured piece (differs from to_sq for en passant).
+        """
+        us = self.side
+        enemy = self.pieces[us ^ 1]
+        occupied = (self.occupied[0] | self.occupied[1]) & ~(1 << from_sq) | (1 << to_sq)
+        keep = ~(1 << to_sq)
+        if captured_sq != to_sq:
+            occupied &= ~(1 << captured_sq)
+            keep &= ~(1 << captured_sq)
+        return not (KNIGHT_ATTACKS[king_sq] & enemy[KNIGHT] & keep
+                    or PAWN_ATTACKS[us][king_sq] & enemy[PAWN] & keep
+                    or KING_ATTACKS[king_sq] & enemy[KING]
+                    or bishop_attacks(king_sq, occupied) & (enemy[BISHOP] | enemy[QUEEN]) & keep
+                    or rook_attacks(king_sq, occupied) & (enemy[ROOK] | enemy[QUEEN]) & keep)
+
+    def checkers_and_pins(self):
+        """Return the pieces giving check to the side to move and the pieces pinned to its king.
+
+        checkers is a bitboard of the attacking pieces; pins maps the square of
+        each pinned piece to the line it may still move along (LINE through the
+        king and the pinner).
+        """
+        us = self.side
+        enemy = self.pieces[us ^ 1]
+        king_sq = self.king_square(us)
+        occupied = self.occupied[0] | self.occupied[1]
+        checkers = (KNIGHT_ATTACKS[king_sq] & enemy[KNIGHT]
+                    | PAWN_ATTACKS[us][king_sq] & enemy[PAWN]
+                    | bishop_attacks(king_sq, occupied) & (enemy[BISHOP] | enemy[QUEEN])
+                    | rook_attacks(king_sq, occupied) & (enemy[ROOK] | enemy[QUEEN]))
+
+        # Sliders that would attack the king on an empty board, blocked by exactly one own piece
+        own = self.occupied[us]
+        snipers = (slider_attacks(king_sq, 0, BISHOP_RAYS) & (enemy[BISHOP] | enemy[QUEEN])
+                   | slider_attacks(king_sq, 0, ROOK_RAYS) & (enemy[ROOK] | enemy[QUEEN]))
+        pins = {}
+        between = BETWEEN[king_sq]
+        for sniper in squares_of(snipers):
+            blockers = between[sniper] & occupied
+            if blockers and blockers & (blockers - 1) == 0 and blockers & own:
+                pins[blockers.bit_length() - 1] = LINE[king_sq][sniper]
+        return checkers, pins
+
+    def legal_moves(self):
+        """Return all legal moves of the side to move as encoded ints.
+
+        Checkers and pins are found once per position, so apart from king moves
+        and en passant a move only has to land on an allowed square: anywhere
+        when not in check, on the checker or between it and the king in a single
+        check, and nowhere in a double check; a pinned piece also has to stay on
+        its pin line.
+        """
+        us = self.side
+        them = us ^ 1
+        own = self.occupied[us]
+        enemy_occupied = self.occupied[them]
+        occupied = own | enemy_occupied
+        empty = ~occupied & FULL
+        pieces = self.pieces[us]
+        king_sq = self.king_square(us)
+        checkers, pins = self.checkers_and_pins()
+        if not checkers:
+            allowed = FULL
+        elif checkers & (checkers - 1):
+            allowed = 0
+        else:
+            allowed = checkers | BETWEEN[king_sq][checkers.bit_length() - 1]
+        moves = []
+
+        # Pawn pushes, done for all pawns at once
+        if us == WHITE:
+            single = (pieces[PAWN] >> 8) & empty
+            double = ((single & RANKS[5]) >> 8) & empty
+            step, promotion_rank = 8, RANKS[0]
+        else:
+            single = (pieces[PAWN] << 8) & empty
+            double = ((single & RANKS[2]) << 8) & empty
+            step, promotion_rank = -8, RANKS[7]
+        for to_sq in squares_of(single & allowed):
+            from_sq = to_sq + step
+            if from_sq in pins and not pins[from_sq] >> to_sq & 1:
+                continue
+            if (1 << to_sq) & promotion_rank:
+                for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                    moves.append(from_sq | (to_sq << 6) | (promotion << 12))
+            else:
+                moves.append(from_sq | (to_sq << 6))
+        for to_sq in squares_of(double & allowed):
+            from_sq = to_sq + 2 * step
+            if from_sq in pins and not pins[from_sq] >> to_sq & 1:
+                continue
+            moves.append(from_sq | (to_sq << 6))
+
+        # Pawn captures; en passant can uncover the king along the rank, so it
+        # is checked on the position after the capture
+        ep_bit = 1 << self.ep_square if self.ep_square >= 0 else 0
+        capture_targets = enemy_occupied & allowed
+        for from_sq in squares_of(pieces[PAWN]):
+            attacks = PAWN_ATTACKS[us][from_sq]
+            targets = attacks & capture_targets
+            if from_sq in pins:
+                targets &= pins[from_sq]
+            for to_sq in squares_of(targets):
+                if (1 << to_sq) & promotion_rank:
+                    for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                        moves.append(from_sq | (to_sq << 6) | (promotion << 12))
+                else:
+                    moves.append(from_sq | (to_sq << 6))
+            if attacks & ep_bit and self._leaves_king_safe(from_sq, self.ep_square, king_sq,
+                                                          self.ep_square + step):
+                moves.append(from_sq | (self.ep_square << 6))
+
+        # Pieces
+        targets = ~own & allowed
+        for from_sq in squares_of(pieces[KNIGHT]):
+            if from_sq in pins:
+                continue  # a pinned knight can never stay on its line
+            for to_sq in squares_of(KNIGHT_ATTACKS[from_sq] & targets):
+                moves.append(from_sq | (to_sq << 6))
+        for piece_type, rays in ((BISHOP, BISHOP_RAYS), (ROOK, ROOK_RAYS),
+                                 (QUEEN, BISHOP_RAYS), (QUEEN, ROOK_RAYS)):
+            for from_sq in squares_of(pieces[piece_type]):
+                attacks = slider_attacks(from_sq, occupied, rays) & targets
+                if from_sq in pins:
+                    attacks &= pins[from_sq]
+                for to_sq in squares_of(attacks):
+                    moves.append(from_sq | (to_sq << 6))
+        for to_sq in squares_of(KING_ATTACKS[king_sq] & ~own & FULL):
+            if self._leaves_king_safe(king_sq, to_sq, to_sq, to_sq):
+                moves.append(king_sq | (to_sq << 6))
+
+        # Castling: the king may not be in check or pass through an attacked square
+        if self.castling:
+            if us == WHITE:
+                sides = ((WHITE_KINGSIDE, 60, (61, 62), (61, 62)),
+                         (WHITE_QUEENSIDE, 60, (57, 58, 59), (59, 58)))
+            else:
+                sides = ((BLACK_KINGSIDE, 4, (5, 6), (5, 6)),
+                         (BLACK_QUEENSIDE, 4, (1, 2, 3), (3, 2)))
+            for right, start, between, passed in sides:
+                if (self.castling & right
+                        and not any(occupied >> sq & 1 for sq in between)
+                        and not self.attacked(start, them)
+                        and not any(self.attacked(sq, them) for sq in passed)):
+                    moves.append(start | (passed[-1] << 6))
+
+        return moves
+
+    def make_move(self, move):
+        """Apply an encoded move in place and return the record unmake_move needs."""
+        from_sq, to_sq, promotion = move & 63, (move >> 6) & 63, move >> 12
+        us = self.side
+        piece_type = self.squares[from_sq][1]
+        captured = self.squares[to_sq]
+        undo = (captured, self.castling, self.ep_square)
+
+        if captured is not None:
+            self.remove_piece(to_sq)
+        self.remove_piece(from_sq)
+        self.put_piece(to_sq, us, promotion or piece_type)
+
+        if piece_type == PAWN:
+            if to_sq == self.ep_square:
+                self.remove_piece(to_sq + 8 if us == WHITE else to_sq - 8)
+            self.ep_square = (from_sq + to_sq) // 2 if abs(to_sq - from_sq) == 16 else -1
+        else:
+            self.ep_square = -1
+            if piece_type == KING and abs(to_sq - from_sq) == 2:
+                rook_from, rook_to = (to_sq + 1, to_sq - 1) if to_sq > from_sq else (to_sq - 2, to_sq + 1)
+                self.remove_piece(rook_from)
+                self.put_piece(rook_to, us, ROOK)
+
+        self.castling &= CASTLING_MASK[from_sq] & CASTLING_MASK[to_sq]
+        self.side = us ^ 1
+        return undo
+
+    def unmake_move(self, move, undo):
+        """Take back a move applied by make_move."""
+        from_sq, to_sq, promotion = move & 63, (move >> 6) & 63, move >> 12
+        captured, self.castling, self.ep_square = undo
+        us = self.side ^ 1
+        self.side = us
+        piece_type = PAWN if promotion else self.squares[to_sq][1]
+
+        self.remove_piece(to_sq)
+        self.put_piece(from_sq, us, piece_type)
+        if captured is not None:
+            self.put_piece(to_sq, captured[0], captured[1])
+
+        if piece_type == PAWN and to_sq == self.ep_square:
+            self.put_piece(to_sq + 8 if us == WHITE else to_sq - 8, us ^ 1, PAWN)
+        elif piece_type == KING and abs(to_sq - from_sq) == 2:
+            rook_from, rook_to = (to_sq + 1, to_sq - 1) if to_sq > from_sq else (to_sq - 2, to_sq + 1)
+            self.remove_piece(rook_to)
+            self.put_piece(rook_from, us, ROOK)
+
+    def perft(self, depth):
+        """Count the leaf nodes of the legal move tree to the given depth."""
+        if depth == 0:
+            return 1
+        moves = self.legal_moves()
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for move in moves:
+            undo = self.make_move(move)
+            nodes += self.perft(depth - 1)
+            self.unmake_move(move, undo)
+        return nodes
+
+    @classmethod
+    def from_board(cls, board):
+        """Build a Position from a Board, taking castling rights from the moved flags."""
+        position = cls()
+        for row in range(8):
+            for col in range(8):
+                piece = board.board[row][col]
+                if piece != 0:
+                    color = WHITE if piece.color == 'w' else BLACK
+                    position.put_piece(row * 8 + col, color, PIECE_SYMBOLS.index(piece.symbol))
+        position.side = WHITE if board.white_turn else BLACK
+
+        for right, king_sq, rook_sq, color in ((WHITE_KINGSIDE, 60, 63, 'w'), (WHITE_QUEENSIDE, 60, 56, 'w'),
+                                               (BLACK_KINGSIDE, 4, 7, 'b'), (BLACK_QUEENSIDE, 4, 0, 'b')):
+            king = board.board[king_sq // 8][king_sq % 8]
+            rook = board.board[rook_sq // 8][rook_sq % 8]
+            if (king != 0 and king.symbol == 'K' and king.color == color and not king.moved
+                    and rook != 0 and rook.symbol == 'R' and rook.color == color and not rook.moved):
+                position.castling |= right
+
+        pawn = board.en_passant_pawn
+        if pawn is not None:
+            position.ep_square = (pawn.row - pawn.direction) * 8 + pawn.col
+        return position
+
+    def to_board(self):
+        """Build the equivalent Board; castling rights become the kings' and rooks' moved flags."""
+        classes = [Pawn, Knight, Bishop, Rook, Queen, King]
+        grid = [[0 for _ in range(COLS)] for _ in range(ROWS)]
+        for sq, piece in enumerate(self.squares):
+            if piece is not None:
+                color, piece_type = piece
+                row, col = divmod(sq, 8)
+                grid[row][col] = classes[piece_type](row, col, 'w' if color == WHITE else 'b')
+
+        board = Board()
+        board.set_position(grid, self.side == WHITE, self.castling,
+                           self.ep_square % 8 if self.ep_square >= 0 else -1)
+        return board
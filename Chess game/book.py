@@ -0,0 +1,190 @@
+"""Polyglot opening books.
+
+A book is a file of 16-byte big-endian entries (key, move, weight, learn)
+sorted by position key. It is memory-mapped and binary-searched, so a large
+book costs neither load time nor resident memory.
+
+Positions are keyed with the standard Polyglot hash (polyglot_key, over
+the Random64 table in polyglot.py), so books written by build_book work
+with other Polyglot tools and books made by them work here.
+
+Build a book from a PGN collection:
+
+    python book.py build games.pgn --out book.bin --plies 20 --min-games 3
+"""
+import argparse
+import mmap
+import random
+import struct
+import sys
+
+from chess import (Board, ROWS, COLS, START_FEN,
+                   WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE)
+from notation import legal_moves, move_to_san, parse_san, push
+from pgn import read_games
+from polyglot import RANDOM64, RANDOM_PIECE, RANDOM_CASTLE, RANDOM_EN_PASSANT, RANDOM_TURN
+
+ENTRY = struct.Struct('>QHHI')
+KEY = struct.Struct('>Q')
+
+# Polyglot promotion codes
+PROMOTIONS = {1: 'N', 2: 'B', 3: 'R', 4: 'Q'}
+PROMOTION_CODES = {piece: code for code, piece in PROMOTIONS.items()}
+
+# Piece kinds in the Polyglot random table: black pawn, white pawn, black knight, ...
+POLYGLOT_KINDS = {symbol + color: 2 * index + (color == 'w')
+                  for index, symbol in enumerate('PNBRQK') for color in 'bw'}
+
+# Results scored for the side to move when building a book
+RESULT_POINTS = {'1-0': (2, 0), '0-1': (0, 2), '1/2-1/2': (1, 1)}
+
+
+def polyglot_key(board):
+    """Return the standard Polyglot key of board's position."""
+    key = 0
+    for color in 'wb':
+        for piece in board.pieces[color]:
+            kind = POLYGLOT_KINDS[piece.symbol + color]
+            key ^= RANDOM64[RANDOM_PIECE + 64 * kind + 8 * (ROWS - 1 - piece.row) + piece.col]
+    for index, right in enumerate((WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE)):
+        if board.castling & right:
+            key ^= RANDOM64[RANDOM_CASTLE + index]
+    # Like Polyglot, the en passant file only counts when a pawn stands next to the pawn to take
+    en_passant_file = board.en_passant_file()
+    if en_passant_file >= 0:
+        key ^= RANDOM64[RANDOM_EN_PASSANT + en_passant_file]
+    if board.white_turn:
+        key ^= RANDOM64[RANDOM_TURN]
+    return key
+
+
+def encode_move(board, move):
+    """Return the Polyglot code of a notation move; castling is written as king takes rook."""
+    (r, c), (row, col), promotion = move
+    if board.board[r][c].symbol == 'K' and abs(col - c) == 2:
+        col = COLS - 1 if col > c else 0
+    return (col | (ROWS - 1 - row) << 3 | c << 6 | (ROWS - 1 - r) << 9
+            | PROMOTION_CODES.get(promotion, 0) << 12)
+
+
+def decode_move(board, code):
+    """Return the notation move for a Polyglot move code on board."""
+    col, row = code & 7, ROWS - 1 - (code >> 3 & 7)
+    c, r = code >> 6 & 7, ROWS - 1 - (code >> 9 & 7)
+    piece = board.board[r][c]
+    if piece != 0 and piece.symbol == 'K' and c == 4 and row == r and col in (0, COLS - 1):
+        col = 6 if col == COLS - 1 else 2
+    return (r, c), (row, col), PROMOTIONS.get(code >> 12 & 7)
+
+
+class OpeningBook:
+    """A memory-mapped Polyglot book."""
+
+    def __init__(self, path, key=polyglot_key):
+        self.path = path
+        self.key = key
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if f.seek(0, 2) else b''
+        self.size = len(self.data) // ENTRY.size
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def entries(self, board):
+        """Return [(move, weight)] for the legal book moves of board."""
+        key = self.key(board)
+        low, high = 0, self.size
+        while low < high:
+            mid = (low + high) // 2
+            if KEY.unpack_from(self.data, mid * ENTRY.size)[0] < key:
+                low = mid + 1
+            else:
+                high = mid
+        legal = legal_moves(board)
+        found = []
+        for index in range(low, self.size):
+            entry_key, code, weight, _ = ENTRY.unpack_from(self.data, index * ENTRY.size)
+            if entry_key != key:
+                break
+            move = decode_move(board, code)
+            if move not in legal and move[2] is None:
+                # Books without an explicit promotion piece mean a queen
+                move = (move[0], move[1], 'Q')
+            # A wrong key function or a hash collision can point at illegal moves
+            if move in legal and weight > 0:
+                found.append((move, weight))
+        return found
+
+    def choose(self, board, rng=random):
+        """Return a book move picked with probability proportional to its weight, or None."""
+        entries = self.entries(board)
+        if not entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        moves, weights = zip(*entries)
+        return rng.choices(moves, weights)[0]
+
+
+def build_book(pgn_paths, out_path, plies=20, min_games=1, key=polyglot_key):
+    """Write a book of the first plies moves of the games in pgn_paths and return its entry count.
+
+    A move's weight is 2 points per win and 1 per draw for the side that
+    played it, plus 1 per game so that moves that only lost stay in the book.
+    Moves played in fewer than min_games games are left out.
+    """
+    counts = {}
+    board = Board()
+    for path in pgn_paths:
+        for game in read_games(path):
+            white_points, black_points = RESULT_POINTS.get(game.result, (1, 1))
+            try:
+                board.load_fen(game.headers.get('FEN', START_FEN))
+                for san in game.moves[:plies]:
+                    move = parse_san(board, san)
+                    entry = (key(board), encode_move(board, move))
+                    games, points = counts.get(entry, (0, 0))
+                    counts[entry] = (games + 1, points + (white_points if board.white_turn else black_points))
+                    push(board, move)
+            except ValueError:
+                continue  # moves up to the illegal one are kept
+
+    entries = sorted((entry_key, code, games, points) for (entry_key, code), (games, points) in counts.items()
+                     if games >= min_games)
+    scale = max([points + games for _, _, games, points in entries] or [1])
+    with open(out_path, 'wb') as f:
+        for entry_key, code, games, points in entries:
+            weight = max(1, (points + games) * 0xFFFF // scale)
+            f.write(ENTRY.pack(entry_key, code, weight, 0))
+    return len(entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build and query Polyglot opening books.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='build a book from PGN files')
+    build.add_argument('pgn', nargs='+', help='PGN files')
+    build.add_argument('--out', required=True, help='book file to write')
+    build.add_argument('--plies', type=int, default=20, help='book moves taken from each game')
+    build.add_argument('--min-games', type=int, default=1, help='leave out moves played in fewer games')
+    probe = commands.add_parser('probe', help='list the book moves of a position')
+    probe.add_argument('book', help='book file')
+    probe.add_argument('--fen', help='position (default: start position)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        count = build_book(args.pgn, args.out, args.plies, args.min_games)
+        print(f'{count} entries written to {args.out}')
+    else:
+        board = Board(args.fen)
+        book = OpeningBook(args.book)
+        for move, weight in sorted(book.entries(board), key=lambda entry: -entry[1]):
+            print(f'{move_to_san(board, move):<8} {weight}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
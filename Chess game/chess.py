@@ -1,10 +1,19 @@
-import pygame
+import argparse
 import sys
 import random
-from copy import deepcopy
+import threading
+import time
 
-# Initialize pygame
-pygame.init()
+from engine import Engine, SearchResult
+from evaluation import PIECE_SQUARE_MIDDLEGAME, PIECE_SQUARE_ENDGAME, PIECE_PHASE, PIECE_MATERIAL
+from transposition import TranspositionTable
+
+# pygame and the window are set up by init_display() when the GUI starts, so the
+# rules engine (pieces, Board, Game.ai_turn) can be imported without a display
+pygame = None
+WIN = None
+# Event posted to the pygame queue when a background AI search finishes
+AI_MOVE_EVENT = None
 
 # Constants
 WIDTH, HEIGHT = 800, 800
@@ -22,9 +31,16 @@ BROWN = (139, 69, 19)
 CREAM = (255, 253, 208)
 LIGHT_BROWN = (210, 180, 140)
 
-# Set up the display
-WIN = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption('Chess')
+def init_display():
+    """Import and initialize pygame and open the game window, once."""
+    global pygame, WIN, AI_MOVE_EVENT
+    if WIN is None:
+        import pygame
+        pygame.init()
+        WIN = pygame.display.set_mode((WIDTH, HEIGHT))
+        pygame.display.set_caption('Chess')
+        AI_MOVE_EVENT = pygame.USEREVENT + 1
+    return WIN
 
 # Load piece images (you'll need these image files)
 def create_piece_image(symbol, color):
@@ -129,50 +145,45 @@ def load_images():
     return images
 
 class Piece:
+    # Pieces only hold engine state; pixel positions are derived from row/col when drawing
+    __slots__ = ('row', 'col', 'color', 'moved', 'piece')
+    symbol = ''
+
     def __init__(self, row, col, color):
         self.row = row
         self.col = col
         self.color = color
-        self.x = 0
-        self.y = 0
-        self.calc_pos()
-        self.selected = False
         self.moved = False
 
-    def calc_pos(self):
-        self.x = self.col * SQUARE_SIZE
-        self.y = self.row * SQUARE_SIZE
-
     def move(self, row, col):
         self.row = row
         self.col = col
-        self.calc_pos()
         self.moved = True
 
     def draw(self, win, images):
+        x, y = self.col * SQUARE_SIZE, self.row * SQUARE_SIZE
         if images.get(self.piece):
-            win.blit(images[self.piece], (self.x, self.y))
+            win.blit(images[self.piece], (x, y))
         else:
             # Fallback drawing if images aren't available
             radius = SQUARE_SIZE // 2 - 10
-            center = (self.x + SQUARE_SIZE // 2, self.y + SQUARE_SIZE // 2)
+            center = (x + SQUARE_SIZE // 2, y + SQUARE_SIZE // 2)
             pygame.draw.circle(win, self.color, center, radius)
             font = pygame.font.SysFont('Arial', 30)
             text = font.render(self.symbol, True, BLACK if self.color == WHITE else WHITE)
             text_rect = text.get_rect(center=center)
             win.blit(text, text_rect)
 
-        if self.selected:
-            pygame.draw.rect(win, BLUE, (self.x, self.y, SQUARE_SIZE, SQUARE_SIZE), 3)
-
     def __repr__(self):
         return self.color + self.symbol
 
 class Pawn(Piece):
+    __slots__ = ('direction', 'en_passant')
+    symbol = 'P'
+
     def __init__(self, row, col, color):
         super().__init__(row, col, color)
         self.piece = color + 'p'
-        self.symbol = 'P'
         self.direction = -1 if color == 'w' else 1
         self.en_passant = False
 
@@ -203,10 +214,12 @@ class Pawn(Piece):
         return moves
 
 class Rook(Piece):
+    __slots__ = ()
+    symbol = 'R'
+
     def __init__(self, row, col, color):
         super().__init__(row, col, color)
         self.piece = color + 'R'
-        self.symbol = 'R'
 
     def valid_moves(self, board):
         moves = []
@@ -229,10 +242,12 @@ class Rook(Piece):
         return moves
 
 class Knight(Piece):
+    __slots__ = ()
+    symbol = 'N'
+
     def __init__(self, row, col, color):
         super().__init__(row, col, color)
         self.piece = color + 'N'
-        self.symbol = 'N'
 
     def valid_moves(self, board):
         moves = []
@@ -250,10 +265,12 @@ class Knight(Piece):
         return moves
 
 class Bishop(Piece):
+    __slots__ = ()
+    symbol = 'B'
+
     def __init__(self, row, col, color):
         super().__init__(row, col, color)
         self.piece = color + 'B'
-        self.symbol = 'B'
 
     def valid_moves(self, board):
         moves = []
@@ -276,10 +293,12 @@ class Bishop(Piece):
         return moves
 
 class Queen(Piece):
+    __slots__ = ()
+    symbol = 'Q'
+
     def __init__(self, row, col, color):
         super().__init__(row, col, color)
         self.piece = color + 'Q'
-        self.symbol = 'Q'
 
     def valid_moves(self, board):
         moves = []
@@ -304,10 +323,12 @@ class Queen(Piece):
         return moves
 
 class King(Piece):
+    __slots__ = ()
+    symbol = 'K'
+
     def __init__(self, row, col, color):
         super().__init__(row, col, color)
         self.piece = color + 'K'
-        self.symbol = 'K'
 
     def valid_moves(self, board):
         moves = []
@@ -338,10 +359,67 @@ class King(Piece):
         
         return moves
 
+# Offsets used to look for attackers outward from a square
+KNIGHT_OFFSETS = [(2, 1), (2, -1), (-2, 1), (-2, -1),
+                  (1, 2), (1, -2), (-1, 2), (-1, -2)]
+KING_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, -1),
+                (0, 1), (1, -1), (1, 0), (1, 1)]
+ROOK_DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+BISHOP_DIRECTIONS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+FEN_PIECES = {'p': Pawn, 'n': Knight, 'b': Bishop, 'r': Rook, 'q': Queen, 'k': King}
+PROMOTION_PIECES = {'Q': Queen, 'R': Rook, 'B': Bishop, 'N': Knight}
+
+# Zobrist keys: one per piece and square, side to move, castling rights and en passant file
+_zobrist_random = random.Random(20240601)
+ZOBRIST_PIECES = {color + symbol: [_zobrist_random.getrandbits(64) for _ in range(ROWS * COLS)]
+                  for color in 'wb' for symbol in ('p', 'R', 'N', 'B', 'Q', 'K')}
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+ZOBRIST_CASTLING = [_zobrist_random.getrandbits(64) for _ in range(16)]
+ZOBRIST_EN_PASSANT = [_zobrist_random.getrandbits(64) for _ in range(COLS)]
+
+# Castling rights bits, and the right that depends on the rook in each corner
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+CORNER_RIGHTS = {(7, 7): WHITE_KINGSIDE, (7, 0): WHITE_QUEENSIDE,
+                 (0, 7): BLACK_KINGSIDE, (0, 0): BLACK_QUEENSIDE}
+
+# One-byte piece codes used by Board.pack: piece type in the low bits, 8 for black
+PIECE_CODES = {color + symbol: code + (8 if color == 'b' else 0)
+               for color in 'wb'
+               for code, symbol in enumerate(('p', 'N', 'B', 'R', 'Q', 'K'), start=1)}
+CODE_PIECES = {code: ({'p': Pawn, 'N': Knight, 'B': Bishop, 'R': Rook, 'Q': Queen, 'K': King}[piece[1]], piece[0])
+               for piece, code in PIECE_CODES.items()}
+PACKED_SIZE = ROWS * COLS + 2
+
+# One shared ((from_row, from_col), (to_row, to_col)) tuple per move, by from and to
+# square row * 8 + col, so cached legal move lists only hold references
+MOVES = [[((from_square // COLS, from_square % COLS), (to_square // COLS, to_square % COLS))
+          for to_square in range(ROWS * COLS)] for from_square in range(ROWS * COLS)]
+
+# Measured cost of a move cache entry: the move tuple of a middlegame position
+# (40-50 references to shared moves) plus the table's own entry overhead
+MOVE_LIST_BYTES = 576
+
+def square_name(row, col):
+    """Return the algebraic name of a square, e.g. (6, 4) -> 'e2'."""
+    return 'abcdefgh'[col] + str(ROWS - row)
+
+def parse_square(name):
+    """Return the (row, col) of an algebraic square name, e.g. 'e2' -> (6, 4)."""
+    if len(name) != 2 or name[0] not in 'abcdefgh' or name[1] not in '12345678':
+        raise ValueError(f'Invalid square: {name!r}')
+    return ROWS - int(name[1]), 'abcdefgh'.index(name[0])
+
 class Board:
-    def __init__(self):
+    # Legal move lists shared by all boards, keyed by position; off (None) until
+    # enable_move_cache is called
+    move_cache = None
+
+    def __init__(self, fen=None):
         self.board = [[0 for _ in range(COLS)] for _ in range(ROWS)]
         self.create_board()
+        self.index_pieces()
         self.white_turn = True
         self.selected_piece = None
         self.valid_moves = []
@@ -351,6 +429,27 @@ class Board:
         self.checkmate = False
         self.stalemate = False
         self.captured_pieces = []
+        self.en_passant_pawn = None
+        self.legal_moves = None
+        self.castling = self.castling_rights()
+        self.zobrist_key = self.compute_zobrist_key()
+        self.set_evaluation_terms()
+        self.reset_history()
+        # Squares whose pixels are out of date; draw() repaints only these
+        self.dirty = set()
+        self.mark_all_dirty()
+        if fen is not None:
+            self.load_fen(fen)
+
+    @classmethod
+    def enable_move_cache(cls, size_mb=16):
+        """Share legal move lists between all boards (and threads) in a table of about size_mb MB.
+
+        It pays off when the same positions are searched again, as in the
+        AI's iterative deepening; benchmarks of move generation leave it off.
+        """
+        cls.move_cache = TranspositionTable(size_mb=size_mb, policy='always', entry_bytes=MOVE_LIST_BYTES)
+        return cls.move_cache
 
     def draw_squares(self, win):
         win.fill(LIGHT_BROWN)
@@ -383,25 +482,307 @@ class Board:
         for col in range(COLS):
             self.board[6][col] = Pawn(6, col, 'w')
 
-    def draw(self, win, images):
-        self.draw_squares(win)
-        
-        # Highlight valid moves
-        for move in self.valid_moves:
-            row, col = move
-            pygame.draw.rect(win, GREEN, (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE), 3)
-        
-        # Highlight king in check
-        if self.check:
-            king_pos = self.white_king if not self.white_turn else self.black_king
-            pygame.draw.rect(win, RED, (king_pos[1] * SQUARE_SIZE, king_pos[0] * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE), 3)
-        
-        # Draw pieces
-        for row in range(ROWS):
-            for col in range(COLS):
-                piece = self.board[row][col]
+    def load_fen(self, fen):
+        """Set up the position described by a FEN string.
+
+        Castling rights are expressed through the moved flags of kings and rooks,
+        and the en passant square through the en_passant flag of the pawn that
+        has just moved two squares. Missing move counters default to 0 1.
+        """
+        fields = fen.split()
+        if not fields or len(fields[0].split('/')) != ROWS:
+            raise ValueError(f'Invalid FEN: {fen!r}')
+        side = fields[1] if len(fields) > 1 else 'w'
+        castling = fields[2] if len(fields) > 2 else '-'
+        en_passant = fields[3] if len(fields) > 3 else '-'
+        if side not in ('w', 'b'):
+            raise ValueError(f'Invalid FEN side to move: {side!r}')
+        try:
+            halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError(f'Invalid FEN move counters: {fen!r}') from None
+
+        grid = [[0 for _ in range(COLS)] for _ in range(ROWS)]
+        for row, rank in enumerate(fields[0].split('/')):
+            col = 0
+            for char in rank:
+                if char.isdigit():
+                    col += int(char)
+                    continue
+                if char.lower() not in FEN_PIECES or col >= COLS:
+                    raise ValueError(f'Invalid FEN: {fen!r}')
+                grid[row][col] = FEN_PIECES[char.lower()](row, col, 'w' if char.isupper() else 'b')
+                col += 1
+            if col != COLS:
+                raise ValueError(f'Invalid FEN: {fen!r}')
+
+        rights = 0
+        for char, right in zip('KQkq', (WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE)):
+            if char in castling:
+                rights |= right
+        en_passant_col = parse_square(en_passant)[1] if en_passant != '-' else -1
+        self.set_position(grid, side == 'w', rights, en_passant_col, halfmove_clock, fullmove_number)
+
+    def fen(self):
+        """Return the position as a FEN string.
+
+        The en passant square is only written when a pawn can capture there.
+        """
+        ranks = []
+        for row in self.board:
+            rank = ''
+            empty = 0
+            for piece in row:
+                if piece == 0:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece.symbol if piece.color == 'w' else piece.symbol.lower()
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+
+        castling = ''.join(char for char, right in zip('KQkq', (WHITE_KINGSIDE, WHITE_QUEENSIDE,
+                                                               BLACK_KINGSIDE, BLACK_QUEENSIDE))
+                           if self.castling & right) or '-'
+        en_passant_col = self.en_passant_file()
+        en_passant = square_name(2 if self.white_turn else 5, en_passant_col) if en_passant_col >= 0 else '-'
+        return f"{'/'.join(ranks)} {'w' if self.white_turn else 'b'} {castling} {en_passant} {self.halfmove_clock} {self.fullmove_number}"
+
+    def set_position(self, grid, white_turn, castling, en_passant_col=-1, halfmove_clock=0, fullmove_number=1):
+        """Set up the board from an 8x8 grid of pieces (or 0) and the position state.
+
+        castling holds the castling rights bits and en_passant_col the column of a
+        pawn that has just moved two squares (-1 for none). Rights become the
+        moved flags of kings and rooks, and pawns off their starting rank count
+        as moved. The move history starts over from this position.
+        """
+        kings = {}
+        for row in grid:
+            for piece in row:
+                if isinstance(piece, Pawn):
+                    piece.moved = piece.row != (6 if piece.color == 'w' else 1)
+                elif isinstance(piece, King):
+                    rights = WHITE_KINGSIDE | WHITE_QUEENSIDE if piece.color == 'w' else BLACK_KINGSIDE | BLACK_QUEENSIDE
+                    piece.moved = not castling & rights
+                    kings[piece.color] = (piece.row, piece.col)
+                elif isinstance(piece, Rook):
+                    right = CORNER_RIGHTS.get((piece.row, piece.col), 0)
+                    piece.moved = not castling & right or piece.color != ('w' if piece.row == 7 else 'b')
+        if len(kings) != 2:
+            raise ValueError('The position needs one king per side')
+
+        self.board = grid
+        self.index_pieces()
+        self.white_king = kings['w']
+        self.black_king = kings['b']
+        self.white_turn = white_turn
+        self.selected_piece = None
+        self.valid_moves = []
+        self.check = self.checkmate = self.stalemate = False
+        self.captured_pieces = []
+        self.en_passant_pawn = None
+        if en_passant_col >= 0:
+            pawn = grid[3 if white_turn else 4][en_passant_col]
+            if isinstance(pawn, Pawn):
+                pawn.en_passant = True
+                self.en_passant_pawn = pawn
+
+        self.castling = self.castling_rights()
+        self.zobrist_key = self.compute_zobrist_key()
+        self.set_evaluation_terms()
+        self.legal_moves = None
+        self.reset_history(halfmove_clock, fullmove_number)
+        self.update_game_state()
+        self.mark_all_dirty()
+
+    def pack(self):
+        """Return the position as PACKED_SIZE bytes.
+
+        Bytes 0-63 hold a piece code per square (row * 8 + col, 0 for empty),
+        byte 64 the side to move (bit 0, set for black) and the castling rights
+        (bits 1-4), and byte 65 the en passant pawn's column + 1 (0 for none).
+        """
+        data = bytearray(PACKED_SIZE)
+        for pieces in self.pieces.values():
+            for piece in pieces:
+                data[piece.row * COLS + piece.col] = PIECE_CODES[piece.piece]
+        data[64] = (0 if self.white_turn else 1) | self.castling << 1
+        data[65] = self.en_passant_pawn.col + 1 if self.en_passant_pawn is not None else 0
+        return bytes(data)
+
+    def load_packed(self, data):
+        """Set up the position stored by pack()."""
+        if len(data) != PACKED_SIZE:
+            raise ValueError(f'Packed position must be {PACKED_SIZE} bytes, got {len(data)}')
+        grid = [[0 for _ in range(COLS)] for _ in range(ROWS)]
+        for square in range(ROWS * COLS):
+            code = data[square]
+            if code:
+                piece_class, color = CODE_PIECES[code]
+                row, col = divmod(square, COLS)
+                grid[row][col] = piece_class(row, col, color)
+        self.set_position(grid, not data[64] & 1, data[64] >> 1, data[65] - 1)
+
+    @classmethod
+    def from_packed(cls, data):
+        board = cls()
+        board.load_packed(data)
+        return board
+
+    def reset_history(self, halfmove_clock=0, fullmove_number=1):
+        """Start the move history, move counters and repetition counts at the current position.
+
+        history holds an (undo record, halfmove clock before the move) pair per
+        move played with move(), and redo_moves the moves taken back by
+        undo_move as ((from_row, from_col), (to_row, to_col), promotion), most
+        recent last. repetitions counts how often each Zobrist key occurred.
+        """
+        self.history = []
+        self.redo_moves = []
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self.repetitions = {self.zobrist_key: 1}
+        self.draw_reason = None
+
+    def index_pieces(self):
+        """Rebuild the per-color piece sets from the board.
+
+        self.pieces maps each color to a dict used as an insertion-ordered set of
+        its pieces; make_move and unmake_move keep it up to date, so nothing else
+        needs to scan all 64 squares.
+        """
+        self.pieces = {'w': {}, 'b': {}}
+        for row in self.board:
+            for piece in row:
                 if piece != 0:
-                    piece.draw(win, images)
+                    self.pieces[piece.color][piece] = None
+
+    def castling_rights(self):
+        """Return the castling rights bits implied by the moved flags of kings and rooks."""
+        rights = 0
+        for right, row, rook_col in ((WHITE_KINGSIDE, 7, 7), (WHITE_QUEENSIDE, 7, 0),
+                                     (BLACK_KINGSIDE, 0, 7), (BLACK_QUEENSIDE, 0, 0)):
+            king = self.board[row][4]
+            rook = self.board[row][rook_col]
+            if (isinstance(king, King) and not king.moved and isinstance(rook, Rook) and not rook.moved
+                    and king.color == rook.color == ('w' if row == 7 else 'b')):
+                rights |= right
+        return rights
+
+    def en_passant_file(self):
+        """Return the file of the en passant square if a pawn can capture there, else -1."""
+        pawn = self.en_passant_pawn
+        if pawn is None:
+            return -1
+        for c in (pawn.col - 1, pawn.col + 1):
+            if 0 <= c < COLS:
+                neighbour = self.board[pawn.row][c]
+                if isinstance(neighbour, Pawn) and neighbour.color != pawn.color:
+                    return pawn.col
+        return -1
+
+    def compute_zobrist_key(self):
+        """Compute the Zobrist key of the position from scratch."""
+        key = 0
+        for pieces in self.pieces.values():
+            for piece in pieces:
+                key ^= ZOBRIST_PIECES[piece.piece][piece.row * COLS + piece.col]
+        if not self.white_turn:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        key ^= ZOBRIST_CASTLING[self.castling]
+        en_passant_file = self.en_passant_file()
+        if en_passant_file >= 0:
+            key ^= ZOBRIST_EN_PASSANT[en_passant_file]
+        return key
+
+    def compute_evaluation_terms(self):
+        """Compute the incrementally updated evaluation terms from scratch.
+
+        Returns (middlegame, endgame, phase, white_material, black_material,
+        pawn_key): the value plus piece-square sums of both phases from White's
+        point of view, the unclamped game phase, each side's material without
+        kings, and the Zobrist key of the pawns alone.
+        """
+        middlegame = endgame = phase = pawn_key = 0
+        material = {'w': 0, 'b': 0}
+        for color, pieces in self.pieces.items():
+            for piece in pieces:
+                code = piece.piece
+                square = piece.row * COLS + piece.col
+                middlegame += PIECE_SQUARE_MIDDLEGAME[code][square]
+                endgame += PIECE_SQUARE_ENDGAME[code][square]
+                phase += PIECE_PHASE[code]
+                material[color] += PIECE_MATERIAL[code]
+                if isinstance(piece, Pawn):
+                    pawn_key ^= ZOBRIST_PIECES[code][square]
+        return middlegame, endgame, phase, material['w'], material['b'], pawn_key
+
+    def set_evaluation_terms(self):
+        (self.middlegame, self.endgame, self.phase,
+         self.white_material, self.black_material, self.pawn_key) = self.compute_evaluation_terms()
+
+    def mark_all_dirty(self):
+        self.dirty.update((row, col) for row in range(ROWS) for col in range(COLS))
+
+    def mark_selection_dirty(self):
+        """Mark the selected piece and its move highlights for repainting."""
+        if self.selected_piece:
+            self.dirty.add((self.selected_piece.row, self.selected_piece.col))
+        self.dirty.update(self.valid_moves)
+
+    def mark_check_dirty(self):
+        """Mark the square of the king in check, if any, for repainting."""
+        if self.check:
+            self.dirty.add(self.white_king if self.white_turn else self.black_king)
+
+    def draw(self, win, images, background=None):
+        """Repaint the dirty squares and return their rectangles.
+
+        background is a pre-rendered surface of the empty board (see
+        draw_squares); without one the squares are filled directly.
+        """
+        king_pos = None
+        if self.check:
+            king_pos = self.white_king if self.white_turn else self.black_king
+        selected = None
+        if self.selected_piece:
+            selected = (self.selected_piece.row, self.selected_piece.col)
+
+        rects = []
+        for row, col in sorted(self.dirty):
+            rect = pygame.Rect(col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
+            if background is not None:
+                win.blit(background, rect, rect)
+            else:
+                win.fill(CREAM if (row + col) % 2 == 0 else LIGHT_BROWN, rect)
+
+            # Highlight valid moves and the king in check
+            if (row, col) in self.valid_moves:
+                pygame.draw.rect(win, GREEN, rect, 3)
+            if (row, col) == king_pos:
+                pygame.draw.rect(win, RED, rect, 3)
+
+            piece = self.board[row][col]
+            if piece != 0:
+                piece.draw(win, images)
+
+            # Highlight the selected piece
+            if (row, col) == selected:
+                pygame.draw.rect(win, BLUE, rect, 3)
+            rects.append(rect)
+
+        self.dirty.clear()
+        return rects
+
+    def set_selection(self, piece, moves):
+        self.mark_selection_dirty()
+        self.selected_piece = piece
+        self.valid_moves = moves
+        self.mark_selection_dirty()
 
     def select(self, row, col):
         piece = self.board[row][col]
@@ -410,175 +791,554 @@ class Board:
         if self.selected_piece:
             # If clicking on a valid move
             if (row, col) in self.valid_moves:
-                self.move(self.selected_piece, row, col)
-                self.selected_piece = None
-                self.valid_moves = []
+                piece = self.selected_piece
+                self.set_selection(None, [])
+                self.move(piece, row, col)
                 return True
             
             # If clicking on another piece of the same color
             if piece != 0 and piece.color == ('w' if self.white_turn else 'b'):
-                self.selected_piece = piece
-                self.valid_moves = self.get_valid_moves(piece)
+                self.set_selection(piece, self.get_piece_legal_moves(piece))
                 return False
             
             # If clicking elsewhere
-            self.selected_piece = None
-            self.valid_moves = []
+            self.set_selection(None, [])
             return False
         
         # If no piece is selected yet
         if piece != 0 and piece.color == ('w' if self.white_turn else 'b'):
-            self.selected_piece = piece
-            self.valid_moves = self.get_valid_moves(piece)
+            self.set_selection(piece, self.get_piece_legal_moves(piece))
             return False
         
         return False
 
-    def move(self, piece, row, col):
+    def get_piece_legal_moves(self, piece):
+        """Return the destination squares of piece, read from the cached legal move list."""
+        square = (piece.row, piece.col)
+        return [to for start, to in self.get_legal_moves() if start == square]
+
+    def move(self, piece, row, col, promotion='Q'):
+        """Play a move in the game; it can be taken back with undo_move and replaces any redo moves."""
+        self.redo_moves.clear()
+        self.play(piece, row, col, promotion)
+
+    def play(self, piece, row, col, promotion='Q'):
+        self.mark_check_dirty()
+        undo = self.make_move(piece, row, col, promotion)
+        self.history.append((undo, self.halfmove_clock))
+        self.mark_move_dirty(undo)
+
+        # Record the capture (including en passant)
+        captured = undo[6]
+        if captured != 0:
+            self.captured_pieces.append(captured)
+
+        # Pawn moves and captures cannot be reversed, so they restart the 50-move count
+        self.halfmove_clock = 0 if isinstance(piece, Pawn) or captured != 0 else self.halfmove_clock + 1
+        if self.white_turn:
+            self.fullmove_number += 1
+        self.repetitions[self.zobrist_key] = self.repetitions.get(self.zobrist_key, 0) + 1
+
+        # Check for check/checkmate/stalemate and draws
+        self.update_game_state()
+        self.mark_check_dirty()
+
+    def undo_move(self):
+        """Take back the last move played with move(); return False if there is none."""
+        if not self.history:
+            return False
+        undo, halfmove_clock = self.history.pop()
+        piece, from_row, from_col, row, col = undo[:5]
+        promoted = self.board[row][col]
+        self.redo_moves.append(((from_row, from_col), (row, col), promoted.symbol if promoted is not piece else 'Q'))
+
+        count = self.repetitions[self.zobrist_key] - 1
+        if count:
+            self.repetitions[self.zobrist_key] = count
+        else:
+            del self.repetitions[self.zobrist_key]
+
+        self.set_selection(None, [])
+        self.mark_check_dirty()
+        self.unmake_move(undo)
+        self.mark_move_dirty(undo)
+        if undo[6] != 0:
+            self.captured_pieces.pop()
+        self.halfmove_clock = halfmove_clock
+        if not self.white_turn:
+            self.fullmove_number -= 1
+        self.update_game_state()
+        self.mark_check_dirty()
+        return True
+
+    def redo_move(self):
+        """Play again the last move taken back by undo_move; return False if there is none."""
+        if not self.redo_moves:
+            return False
+        (r, c), (row, col), promotion = self.redo_moves.pop()
+        self.set_selection(None, [])
+        self.play(self.board[r][c], row, col, promotion)
+        return True
+
+    def mark_move_dirty(self, undo):
+        # Repaint the source, destination, en passant victim and castling rook squares
+        _, from_row, from_col, row, col, _, captured, captured_row, captured_col, rook, rook_from_col, rook_to_col = undo[:12]
+        self.dirty.update(((from_row, from_col), (row, col)))
+        if captured != 0:
+            self.dirty.add((captured_row, captured_col))
+        if rook is not None:
+            self.dirty.update(((row, rook_from_col), (row, rook_to_col)))
+
+    def make_move(self, piece, row, col, promotion='Q'):
+        """Apply a move in place and return the record unmake_move needs to take it back.
+
+        Pawns reaching the last rank become the piece named by promotion ('Q', 'R', 'B' or 'N').
+
+        The record is a tuple of (piece, from_row, from_col, to_row, to_col, moved,
+        captured, captured_row, captured_col, rook, rook_from_col, rook_to_col,
+        rook_moved, en_passant_pawn, white_king, black_king, castling, zobrist_key,
+        legal_moves, middlegame, endgame, phase, white_material, black_material,
+        pawn_key). The Zobrist key and the evaluation terms (see
+        compute_evaluation_terms) are updated incrementally and the cached
+        legal move list is dropped.
+        """
+        board = self.board
+        from_row, from_col = piece.row, piece.col
+        captured = board[row][col]
+        captured_row, captured_col = row, col
+        rook = None
+        rook_from_col = rook_to_col = 0
+        rook_moved = False
+        code = piece.piece
+        from_square = from_row * COLS + from_col
+        to_square = row * COLS + col
+        key = self.zobrist_key ^ ZOBRIST_BLACK_TO_MOVE ^ ZOBRIST_PIECES[code][from_square]
+        middlegame = self.middlegame - PIECE_SQUARE_MIDDLEGAME[code][from_square]
+        endgame = self.endgame - PIECE_SQUARE_ENDGAME[code][from_square]
+        phase = self.phase
+        white_material, black_material = self.white_material, self.black_material
+        pawn_key = self.pawn_key
+        en_passant_file = self.en_passant_file()
+        if en_passant_file >= 0:
+            key ^= ZOBRIST_EN_PASSANT[en_passant_file]
+
         # Handle castling
-        if isinstance(piece, King) and abs(piece.col - col) == 2:
-            # Kingside castling
-            if col > piece.col:
-                rook = self.board[row][7]
-                self.board[row][5] = rook
-                self.board[row][7] = 0
-                rook.move(row, 5)
-            # Queenside castling
-            else:
-                rook = self.board[row][0]
-                self.board[row][3] = rook
-                self.board[row][0] = 0
-                rook.move(row, 3)
-        
+        if isinstance(piece, King) and abs(from_col - col) == 2:
+            rook_from_col, rook_to_col = (7, 5) if col > from_col else (0, 3)
+            rook = board[row][rook_from_col]
+            rook_moved = rook.moved
+            board[row][rook_to_col] = rook
+            board[row][rook_from_col] = 0
+            rook.move(row, rook_to_col)
+            rook_keys = ZOBRIST_PIECES[rook.piece]
+            key ^= rook_keys[row * COLS + rook_from_col] ^ rook_keys[row * COLS + rook_to_col]
+            rook_middlegame = PIECE_SQUARE_MIDDLEGAME[rook.piece]
+            rook_endgame = PIECE_SQUARE_ENDGAME[rook.piece]
+            middlegame += rook_middlegame[row * COLS + rook_to_col] - rook_middlegame[row * COLS + rook_from_col]
+            endgame += rook_endgame[row * COLS + rook_to_col] - rook_endgame[row * COLS + rook_from_col]
+
         # Handle en passant
-        if isinstance(piece, Pawn) and self.board[row][col] == 0 and piece.col != col:
-            # Capture the pawn that was en passant
-            captured_pawn = self.board[piece.row][col]
-            self.captured_pieces.append(captured_pawn)
-            self.board[piece.row][col] = 0
-        
-        # Handle pawn promotion
-        if isinstance(piece, Pawn) and (row == 0 or row == 7):
-            # Promote to queen by default (can implement a promotion menu later)
-            self.board[piece.row][piece.col] = Queen(row, col, piece.color)
-            piece = self.board[row][col]
-        
-        # Handle capture
-        if self.board[row][col] != 0:
-            self.captured_pieces.append(self.board[row][col])
-        
-        # Move the piece
-        self.board[piece.row][piece.col] = 0
-        self.board[row][col] = piece
-        piece.move(row, col)
-        
-        # Set en passant flag for pawns that moved two squares
-        if isinstance(piece, Pawn) and abs(piece.row - row) == 2:
-            piece.en_passant = True
+        elif isinstance(piece, Pawn) and captured == 0 and from_col != col:
+            captured_row = from_row
+            captured = board[from_row][col]
+            board[from_row][col] = 0
+
+        if captured != 0:
+            captured_code = captured.piece
+            captured_square = captured_row * COLS + captured_col
+            key ^= ZOBRIST_PIECES[captured_code][captured_square]
+            middlegame -= PIECE_SQUARE_MIDDLEGAME[captured_code][captured_square]
+            endgame -= PIECE_SQUARE_ENDGAME[captured_code][captured_square]
+            phase -= PIECE_PHASE[captured_code]
+            if captured.color == 'w':
+                white_material -= PIECE_MATERIAL[captured_code]
+            else:
+                black_material -= PIECE_MATERIAL[captured_code]
+            if isinstance(captured, Pawn):
+                pawn_key ^= ZOBRIST_PIECES[captured_code][captured_square]
+            del self.pieces[captured.color][captured]
+
+        undo = (piece, from_row, from_col, row, col, piece.moved,
+                captured, captured_row, captured_col, rook, rook_from_col, rook_to_col,
+                rook_moved, self.en_passant_pawn, self.white_king, self.black_king,
+                self.castling, self.zobrist_key, self.legal_moves,
+                self.middlegame, self.endgame, self.phase, self.white_material, self.black_material,
+                self.pawn_key)
+
+        # Move the piece, promoting pawns on the last rank
+        board[from_row][from_col] = 0
+        if isinstance(piece, Pawn) and (row == 0 or row == ROWS - 1):
+            promoted = PROMOTION_PIECES[promotion](row, col, piece.color)
+            promoted.moved = True
+            board[row][col] = promoted
+            promoted_code = promoted.piece
+            key ^= ZOBRIST_PIECES[promoted_code][to_square]
+            middlegame += PIECE_SQUARE_MIDDLEGAME[promoted_code][to_square]
+            endgame += PIECE_SQUARE_ENDGAME[promoted_code][to_square]
+            phase += PIECE_PHASE[promoted_code]
+            gained = PIECE_MATERIAL[promoted_code] - PIECE_MATERIAL[code]
+            if piece.color == 'w':
+                white_material += gained
+            else:
+                black_material += gained
+            pawn_key ^= ZOBRIST_PIECES[code][from_square]
+            own_pieces = self.pieces[piece.color]
+            del own_pieces[piece]
+            own_pieces[promoted] = None
         else:
-            piece.en_passant = False
-        
+            board[row][col] = piece
+            piece.move(row, col)
+            key ^= ZOBRIST_PIECES[code][to_square]
+            middlegame += PIECE_SQUARE_MIDDLEGAME[code][to_square]
+            endgame += PIECE_SQUARE_ENDGAME[code][to_square]
+            if isinstance(piece, Pawn):
+                pawn_key ^= ZOBRIST_PIECES[code][from_square] ^ ZOBRIST_PIECES[code][to_square]
+
+        # Only a pawn that has just moved two squares can be taken en passant
+        if self.en_passant_pawn is not None:
+            self.en_passant_pawn.en_passant = False
+            self.en_passant_pawn = None
+        if isinstance(piece, Pawn) and abs(from_row - row) == 2:
+            piece.en_passant = True
+            self.en_passant_pawn = piece
+
         # Update king position
         if isinstance(piece, King):
             if piece.color == 'w':
                 self.white_king = (row, col)
             else:
                 self.black_king = (row, col)
-        
+
+        # Castling rights only change when a king or rook leaves or a rook is captured
+        if isinstance(piece, (King, Rook)) or isinstance(captured, Rook):
+            castling = self.castling_rights()
+            key ^= ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_CASTLING[castling]
+            self.castling = castling
+        en_passant_file = self.en_passant_file()
+        if en_passant_file >= 0:
+            key ^= ZOBRIST_EN_PASSANT[en_passant_file]
+        self.zobrist_key = key
+        self.middlegame, self.endgame, self.phase = middlegame, endgame, phase
+        self.white_material, self.black_material = white_material, black_material
+        self.pawn_key = pawn_key
+        self.legal_moves = None
+
         # Switch turns
         self.white_turn = not self.white_turn
-        
-        # Reset en passant flags for opponent's pawns
-        for r in range(ROWS):
-            for c in range(COLS):
-                p = self.board[r][c]
-                if isinstance(p, Pawn) and p.color != piece.color:
-                    p.en_passant = False
-        
-        # Check for check/checkmate/stalemate
-        self.update_game_state()
+        return undo
+
+    def unmake_move(self, undo):
+        """Take back a move applied by make_move, restoring the exact previous position."""
+        (piece, from_row, from_col, row, col, moved,
+         captured, captured_row, captured_col, rook, rook_from_col, rook_to_col,
+         rook_moved, en_passant_pawn, white_king, black_king, castling, zobrist_key,
+         legal_moves, middlegame, endgame, phase, white_material, black_material, pawn_key) = undo
+        board = self.board
+
+        # Put the moving piece (or the pawn behind a promotion) back
+        promoted = board[row][col]
+        if promoted is not piece:
+            own_pieces = self.pieces[piece.color]
+            del own_pieces[promoted]
+            own_pieces[piece] = None
+        if captured != 0:
+            self.pieces[captured.color][captured] = None
+        board[row][col] = 0
+        board[captured_row][captured_col] = captured
+        board[from_row][from_col] = piece
+        piece.row, piece.col = from_row, from_col
+        piece.moved = moved
 
-    def get_valid_moves(self, piece):
+        # Put the castling rook back
+        if rook is not None:
+            board[row][rook_to_col] = 0
+            board[row][rook_from_col] = rook
+            rook.col = rook_from_col
+            rook.moved = rook_moved
+
+        # Restore en passant flags
+        if self.en_passant_pawn is not None:
+            self.en_passant_pawn.en_passant = False
+        if en_passant_pawn is not None:
+            en_passant_pawn.en_passant = True
+        self.en_passant_pawn = en_passant_pawn
+
+        self.white_king = white_king
+        self.black_king = black_king
+        self.castling = castling
+        self.zobrist_key = zobrist_key
+        self.middlegame, self.endgame, self.phase = middlegame, endgame, phase
+        self.white_material, self.black_material = white_material, black_material
+        self.pawn_key = pawn_key
+        self.legal_moves = legal_moves
+        self.white_turn = not self.white_turn
+
+    def get_valid_moves(self, piece, checkers=None, pins=None):
+        """Return the legal destination squares of piece.
+
+        checkers and pins are the result of checkers_and_pins for the side to move;
+        callers that ask for several pieces can pass them in to avoid recomputing.
+        """
+        if checkers is None:
+            checkers, pins = self.checkers_and_pins(piece.color)
         moves = piece.valid_moves(self.board)
+
+        # Outside of check only pinned pieces, the king and en passant captures
+        # can expose the king, so everything else is legal as generated
+        if not checkers and not isinstance(piece, King):
+            pin = pins.get((piece.row, piece.col))
+            if pin is not None:
+                moves = self.moves_along_pin(piece, moves, pin)
+            if not isinstance(piece, Pawn) or all(c == piece.col or self.board[r][c] != 0 for r, c in moves):
+                return moves
+
         valid_moves = []
-        
+        color = piece.color
+        enemy = 'b' if color == 'w' else 'w'
+
         # Filter moves that would leave king in check
         for move in moves:
-            temp_board = deepcopy(self)
-            temp_piece = temp_board.board[piece.row][piece.col]
-            
-            # Simulate the move
-            temp_board.board[piece.row][piece.col] = 0
-            temp_board.board[move[0]][move[1]] = temp_piece
-            temp_piece.row, temp_piece.col = move
-            
-            # Update king position if moving king
-            if isinstance(piece, King):
-                if piece.color == 'w':
-                    temp_board.white_king = (move[0], move[1])
-                else:
-                    temp_board.black_king = (move[0], move[1])
-            
-            # Check if king is in check after move
-            king_pos = temp_board.white_king if piece.color == 'w' else temp_board.black_king
-            if not temp_board.is_square_under_attack(king_pos[0], king_pos[1], 'b' if piece.color == 'w' else 'w'):
+            # The king may not castle out of or through check
+            if isinstance(piece, King) and abs(move[1] - piece.col) == 2:
+                if checkers or self.is_square_under_attack(move[0], (move[1] + piece.col) // 2, enemy):
+                    continue
+            undo = self.make_move(piece, move[0], move[1])
+            king_pos = self.white_king if color == 'w' else self.black_king
+            if not self.is_square_under_attack(king_pos[0], king_pos[1], enemy):
                 valid_moves.append(move)
-        
+            self.unmake_move(undo)
+
         return valid_moves
 
+    def moves_along_pin(self, piece, moves, pin):
+        """Keep only the moves that leave a pinned piece on the line of its pin."""
+        dr, dc = pin
+        king_row, king_col = self.white_king if piece.color == 'w' else self.black_king
+        return [(r, c) for r, c in moves if (r - king_row) * dc == (c - king_col) * dr]
+
     def is_square_under_attack(self, row, col, color):
-        for r in range(ROWS):
-            for c in range(COLS):
-                piece = self.board[r][c]
-                if piece != 0 and piece.color == color:
-                    moves = piece.valid_moves(self.board)
-                    if (row, col) in moves:
+        """Return True if any piece of color attacks the square (row, col)."""
+        board = self.board
+
+        # Pawns attack diagonally towards the opposite side
+        pawn_row = row + 1 if color == 'w' else row - 1
+        if 0 <= pawn_row < ROWS:
+            for c in (col - 1, col + 1):
+                if 0 <= c < COLS:
+                    piece = board[pawn_row][c]
+                    if piece != 0 and piece.color == color and isinstance(piece, Pawn):
                         return True
+
+        for dr, dc in KNIGHT_OFFSETS:
+            r, c = row + dr, col + dc
+            if 0 <= r < ROWS and 0 <= c < COLS:
+                piece = board[r][c]
+                if piece != 0 and piece.color == color and isinstance(piece, Knight):
+                    return True
+
+        for dr, dc in KING_OFFSETS:
+            r, c = row + dr, col + dc
+            if 0 <= r < ROWS and 0 <= c < COLS:
+                piece = board[r][c]
+                if piece != 0 and piece.color == color and isinstance(piece, King):
+                    return True
+
+        # Sliding pieces: walk each ray until the first blocker
+        for directions, slider in ((ROOK_DIRECTIONS, Rook), (BISHOP_DIRECTIONS, Bishop)):
+            for dr, dc in directions:
+                r, c = row + dr, col + dc
+                while 0 <= r < ROWS and 0 <= c < COLS:
+                    piece = board[r][c]
+                    if piece != 0:
+                        if piece.color == color and isinstance(piece, (slider, Queen)):
+                            return True
+                        break
+                    r += dr
+                    c += dc
+
         return False
 
+    def attackers(self, row, col, color):
+        """Return the squares of all pieces of color that attack the square (row, col)."""
+        board = self.board
+        squares = []
+
+        pawn_row = row + 1 if color == 'w' else row - 1
+        if 0 <= pawn_row < ROWS:
+            for c in (col - 1, col + 1):
+                if 0 <= c < COLS:
+                    piece = board[pawn_row][c]
+                    if piece != 0 and piece.color == color and isinstance(piece, Pawn):
+                        squares.append((pawn_row, c))
+
+        for offsets, leaper in ((KNIGHT_OFFSETS, Knight), (KING_OFFSETS, King)):
+            for dr, dc in offsets:
+                r, c = row + dr, col + dc
+                if 0 <= r < ROWS and 0 <= c < COLS:
+                    piece = board[r][c]
+                    if piece != 0 and piece.color == color and isinstance(piece, leaper):
+                        squares.append((r, c))
+
+        for directions, slider in ((ROOK_DIRECTIONS, Rook), (BISHOP_DIRECTIONS, Bishop)):
+            for dr, dc in directions:
+                r, c = row + dr, col + dc
+                while 0 <= r < ROWS and 0 <= c < COLS:
+                    piece = board[r][c]
+                    if piece != 0:
+                        if piece.color == color and isinstance(piece, (slider, Queen)):
+                            squares.append((r, c))
+                        break
+                    r += dr
+                    c += dc
+
+        return squares
+
+    def checkers_and_pins(self, color):
+        """Return the pieces giving check to color's king and the pieces pinned to it.
+
+        checkers is a list of attacker squares; pins maps the square of each pinned
+        piece of color to the direction (dr, dc) of the ray from the king.
+        """
+        king_row, king_col = self.white_king if color == 'w' else self.black_king
+        enemy = 'b' if color == 'w' else 'w'
+        board = self.board
+        checkers = self.attackers(king_row, king_col, enemy)
+        pins = {}
+
+        for directions, slider in ((ROOK_DIRECTIONS, Rook), (BISHOP_DIRECTIONS, Bishop)):
+            for dr, dc in directions:
+                r, c = king_row + dr, king_col + dc
+                shield = None
+                while 0 <= r < ROWS and 0 <= c < COLS:
+                    piece = board[r][c]
+                    if piece != 0:
+                        if piece.color == color:
+                            if shield is not None:
+                                break
+                            shield = (r, c)
+                        else:
+                            if shield is not None and isinstance(piece, (slider, Queen)):
+                                pins[shield] = (dr, dc)
+                            break
+                    r += dr
+                    c += dc
+
+        return checkers, pins
+
     def update_game_state(self):
         # Check if current player's king is in check
         king_pos = self.white_king if self.white_turn else self.black_king
         self.check = self.is_square_under_attack(king_pos[0], king_pos[1], 'b' if self.white_turn else 'w')
         
-        # Check for checkmate or stalemate
-        has_legal_move = False
-        for r in range(ROWS):
-            for c in range(COLS):
-                piece = self.board[r][c]
-                if piece != 0 and piece.color == ('w' if self.white_turn else 'b'):
-                    if self.get_valid_moves(piece):
-                        has_legal_move = True
-                        break
-            if has_legal_move:
-                break
-        
-        if not has_legal_move:
-            if self.check:
-                self.checkmate = True
+        # Check for checkmate or stalemate; the move list stays cached for select and the AI
+        has_legal_move = bool(self.get_legal_moves())
+        self.checkmate = not has_legal_move and self.check
+        self.stalemate = not has_legal_move and not self.check
+
+        # Draws by rule; a checkmate on the move that completes one still wins
+        self.draw_reason = None
+        if has_legal_move:
+            if self.repetitions.get(self.zobrist_key, 0) >= 3:
+                self.draw_reason = 'threefold repetition'
+            elif self.halfmove_clock >= 100:
+                self.draw_reason = 'fifty-move rule'
+
+    @property
+    def game_over(self):
+        return self.checkmate or self.stalemate or self.draw_reason is not None
+
+    def get_legal_moves(self):
+        """Return the legal moves of the side to move, generated once per position.
+
+        The tuple of ((from_row, from_col), (to_row, to_col)) moves is cached on the
+        board until the next make_move (unmake_move brings the previous one back).
+        """
+        if self.legal_moves is None:
+            color = 'w' if self.white_turn else 'b'
+            cache = self.move_cache
+            entry = cache.probe(self.zobrist_key) if cache is not None else None
+            if entry is not None:
+                self.legal_moves = entry[1]
             else:
-                self.stalemate = True
+                self.legal_moves = tuple(self.generate_valid_moves(color))
+                if cache is not None:
+                    cache.store(self.zobrist_key, 0, self.legal_moves)
+        return self.legal_moves
 
     def get_all_valid_moves(self, color):
+        if color == ('w' if self.white_turn else 'b'):
+            return list(self.get_legal_moves())
+        return self.generate_valid_moves(color)
+
+    def generate_valid_moves(self, color):
         moves = []
-        for r in range(ROWS):
-            for c in range(COLS):
-                piece = self.board[r][c]
-                if piece != 0 and piece.color == color:
-                    piece_moves = self.get_valid_moves(piece)
-                    for move in piece_moves:
-                        moves.append(((r, c), move))
+        checkers, pins = self.checkers_and_pins(color)
+        # Iterate over a copy: testing a promotion swaps pieces in the set
+        for piece in list(self.pieces[color]):
+            piece_moves = MOVES[piece.row * COLS + piece.col]
+            for row, col in self.get_valid_moves(piece, checkers, pins):
+                moves.append(piece_moves[row * COLS + col])
         return moves
 
 class Game:
-    def __init__(self):
+    def __init__(self, ai_time=1.0, workers=1, book=None, tablebase=None, ponder=True):
         self.board = Board()
-        self.images = load_images()
+        self.images = None
+        self.background = None
+        self.font = None
         self.ai_thinking = False
+        self.ai_thread = None
+        self.ai_key = None
+        if workers > 1:
+            # Imported here because parallel imports this module
+            from parallel import ParallelEngine
+            self.engine = ParallelEngine(workers=workers, time_limit=ai_time, tablebase=tablebase)
+        else:
+            self.engine = Engine(time_limit=ai_time, tablebase=tablebase)
+        # An opening book (book.OpeningBook) whose moves are played without searching
+        self.book = book
+        # Endgame tables (tablebase.Tablebase) that decide won and lost endgames
+        self.tablebase = tablebase
+        self.last_search = None
+        # Pondering: while the human thinks, the engine searches the position
+        # after the reply it expects; see start_ponder
+        self.ponder = ponder
+        self.ponder_thread = None
+        self.ponder_key = None
+        self.ponder_started = 0.0
+        self.ponder_result = None
+        self.ponder_on_done = None
+        self.ponder_lock = threading.Lock()
+        self.ponder_timer = None
+        self.ponder_stats = {'ponders': 0, 'hits': 0, 'misses': 0, 'seconds_saved': 0.0}
 
     def draw(self):
-        self.board.draw(WIN, self.images)
-        pygame.display.update()
+        """Repaint what changed since the last frame; return False if nothing did."""
+        if self.images is None:
+            self.images = load_images()
+            self.font = pygame.font.SysFont('Arial', 50)
+            self.background = pygame.Surface((WIDTH, HEIGHT))
+            self.board.draw_squares(self.background)
+            self.board.mark_all_dirty()
+        if not self.board.dirty:
+            return False
+
+        rects = self.board.draw(WIN, self.images, self.background)
+
+        # Display game over message
+        if self.board.game_over:
+            if self.board.checkmate:
+                text = self.font.render('Checkmate!', True, RED)
+            elif self.board.stalemate:
+                text = self.font.render('Stalemate!', True, BLUE)
+            else:
+                text = self.font.render('Draw!', True, BLUE)
+            text_rect = text.get_rect(center=(WIDTH//2, HEIGHT//2))
+            WIN.blit(text, text_rect)
+            rects.append(text_rect)
+
+        pygame.display.update(rects)
+        return True
 
     def human_turn(self, pos):
         row, col = pos[1] // SQUARE_SIZE, pos[0] // SQUARE_SIZE
@@ -586,48 +1346,285 @@ class Game:
             return True  # Move was made
         return False  # Move wasn't made
 
+    def takeback(self):
+        """Take back moves until it is the human's (white's) turn again; return False if none were."""
+        self.cancel_ai_turn()
+        was_over = self.board.game_over
+        if not self.board.undo_move():
+            return False
+        while not self.board.white_turn and self.board.undo_move():
+            pass
+        if was_over:
+            # Repaint the squares under the game over message
+            self.board.mark_all_dirty()
+        return True
+
+    def redo(self):
+        """Replay taken back moves up to the human's next turn; return False if there were none."""
+        if self.ai_thinking or not self.board.redo_move():
+            return False
+        while not self.board.white_turn and self.board.redo_move():
+            pass
+        return True
+
     def ai_turn(self):
-        # Simple AI: choose a random valid move
-        valid_moves = self.board.get_all_valid_moves('b' if self.board.white_turn else 'w')
-        if valid_moves:
-            (start_row, start_col), (end_row, end_col) = random.choice(valid_moves)
-            piece = self.board.board[start_row][start_col]
-            self.board.move(piece, end_row, end_col)
-            return True
-        return False
+        # Search the side to move's best move within the engine's time budget
+        return self.apply_ai_move(self.book_move() or self.tablebase_move() or self.engine.search(self.board))
+
+    def book_move(self):
+        """Return a SearchResult with a book move for the position, or None."""
+        if self.book is None:
+            return None
+        move = self.book.choose(self.board)
+        if move is None:
+            return None
+        return SearchResult(move[:2], 0, 0, 0, 0.0, [move[:2]])
+
+    def tablebase_move(self):
+        """Return a SearchResult with the tables' move for a won or lost endgame, or None.
+
+        Drawn endgames are left to the search, which also probes the tables.
+        """
+        if self.tablebase is None:
+            return None
+        found = self.tablebase.best_move(self.board)
+        if found is None or found[1] == 0:
+            return None
+        move, value = found
+        score = self.tablebase.probe_score(self.board, 0)
+        return SearchResult(move, score, 0, 0, 0.0, [move])
+
+    def start_ai_turn(self, on_done):
+        """Search the AI's move on a worker thread and return immediately.
 
-def main():
+        The search runs on a copy of the board, so the caller keeps drawing
+        and handling events. on_done(result) is called from the worker thread
+        unless the search was cancelled; pass the result to finish_ai_turn on
+        the main thread.
+        """
+        if self.ai_thinking:
+            return
+        self.ai_thinking = True
+        self.ai_key = self.board.zobrist_key
+        result = self.book_move() or self.tablebase_move()
+        if result is not None:
+            self.stop_ponder()
+            on_done(result)
+            return
+        if self.ponder_thread is not None:
+            if self.ponder_key == self.ai_key:
+                self.ponder_hit(on_done)
+                return
+            self.ponder_stats['misses'] += 1
+            self.stop_ponder()
+        board = Board.from_packed(self.board.pack())
+        self.engine.prepare_search()
+        self.ai_thread = threading.Thread(target=self.search_in_background,
+                                          args=(board, on_done, len(self.board.history)), daemon=True)
+        self.ai_thread.start()
+
+    def search_in_background(self, board, on_done, game_ply=None):
+        result = self.engine.search(board, game_ply=game_ply)
+        if self.ai_thinking:
+            on_done(result)
+
+    def predicted_move(self):
+        """Return the human reply the last search expects, or None.
+
+        That is the second move of its principal variation, or the
+        transposition table move of the current position when the variation
+        was cut short.
+        """
+        pv = self.last_search.pv if self.last_search is not None else []
+        move = pv[1] if len(pv) > 1 else None
+        if move is None and isinstance(self.engine, Engine):
+            entry = self.engine.tt.probe(self.board.zobrist_key)
+            if entry is not None:
+                move = entry[1][2]
+        color = 'w' if self.board.white_turn else 'b'
+        return move if move is not None and move in self.board.get_all_valid_moves(color) else None
+
+    def start_ponder(self):
+        """Search the position after the human's expected reply on a worker thread until the human moves.
+
+        If the human plays that move, start_ai_turn takes the search over
+        (a ponder hit); otherwise it is stopped and a new search starts. The
+        transposition table, killers and history filled meanwhile are kept
+        either way. Return False if there is nothing to ponder.
+        """
+        if not self.ponder or self.ai_thinking or self.ponder_thread is not None or self.board.game_over:
+            return False
+        move = self.predicted_move()
+        if move is None:
+            return False
+        (r, c), (row, col) = move
+        board = Board.from_packed(self.board.pack())
+        board.make_move(board.board[r][c], row, col)
+        self.ponder_key = board.zobrist_key
+        self.ponder_result = None
+        self.ponder_on_done = None
+        self.ponder_started = time.perf_counter()
+        self.ponder_stats['ponders'] += 1
+        self.engine.prepare_search()
+        self.ponder_thread = threading.Thread(target=self.ponder_in_background,
+                                              args=(board, len(self.board.history) + 1), daemon=True)
+        self.ponder_thread.start()
+        return True
+
+    def ponder_in_background(self, board, game_ply):
+        result = self.engine.search(board, time_limit=float('inf'), game_ply=game_ply)
+        with self.ponder_lock:
+            self.ponder_result = result
+            on_done = self.ponder_on_done
+        if on_done is not None and self.ai_thinking:
+            on_done(result)
+
+    def ponder_hit(self, on_done):
+        """Turn the ponder search into the AI's search after the human played the expected move.
+
+        A finished ponder search is answered at once; a running one gets what
+        is left of the AI's time, counted from when pondering began.
+        """
+        elapsed = time.perf_counter() - self.ponder_started
+        with self.ponder_lock:
+            result = self.ponder_result
+            if result is None:
+                self.ponder_on_done = on_done
+        time_limit = self.engine.time_limit
+        searched = result.seconds if result is not None else elapsed
+        self.ponder_stats['hits'] += 1
+        self.ponder_stats['seconds_saved'] += min(searched, time_limit) if time_limit is not None else searched
+        self.ai_thread = self.ponder_thread
+        self.ponder_thread = None
+        if result is not None:
+            on_done(result)
+        elif time_limit is not None:
+            self.ponder_timer = threading.Timer(max(0.0, time_limit - elapsed), self.engine.stop)
+            self.ponder_timer.daemon = True
+            self.ponder_timer.start()
+
+    def stop_ponder(self):
+        """Stop a ponder search that was not a hit and wait for its thread."""
+        if self.ponder_thread is not None:
+            self.stop_thread(self.ponder_thread)
+            self.ponder_thread = None
+
+    def stop_thread(self, thread):
+        """Stop thread's search and wait for the thread, so that no two searches share the engine."""
+        # The search was prepared before the thread started, so the request
+        # holds even if it has not begun searching yet
+        self.engine.stop()
+        thread.join()
+
+    def ponder_report(self):
+        """Return a one-line summary of ponder hits and the thinking time they saved."""
+        stats = self.ponder_stats
+        rate = 100 * stats['hits'] / stats['ponders'] if stats['ponders'] else 0.0
+        return (f"Ponder hits: {stats['hits']} of {stats['ponders']} ({rate:.0f}%), "
+                f"{stats['seconds_saved']:.1f}s of AI thinking time saved")
+
+    def finish_ai_turn(self, result):
+        """Apply a background search result; stale results are ignored."""
+        if not self.ai_thinking:
+            return False
+        self.ai_thinking = False
+        if self.ponder_timer is not None:
+            self.ponder_timer.cancel()
+            self.ponder_timer = None
+        if self.board.zobrist_key != self.ai_key:
+            return False
+        return self.apply_ai_move(result)
+
+    def cancel_ai_turn(self):
+        """Stop a background search or ponder search and wait for its thread."""
+        self.ai_thinking = False
+        if self.ponder_timer is not None:
+            self.ponder_timer.cancel()
+            self.ponder_timer = None
+        self.stop_ponder()
+        if self.ai_thread is not None:
+            self.stop_thread(self.ai_thread)
+            self.ai_thread = None
+
+    def apply_ai_move(self, result):
+        self.last_search = result
+        if result.move is None:
+            return False
+        (start_row, start_col), (end_row, end_col) = result.move
+        piece = self.board.board[start_row][start_col]
+        self.board.move(piece, end_row, end_col)
+        return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play chess against the AI.')
+    parser.add_argument('--ai-time', type=float, default=1.0, help='seconds the AI thinks per move')
+    parser.add_argument('--workers', type=int, default=1, help='processes the AI searches on')
+    parser.add_argument('--book', metavar='PATH', help='Polyglot opening book for the AI')
+    parser.add_argument('--tablebase', metavar='DIR', help='endgame tables made by tablebase.py')
+    parser.add_argument('--no-ponder', dest='ponder', action='store_false',
+                        help="don't let the AI think on your time")
+    parser.add_argument('--profile', metavar='PATH', help='write a profile of the run to PATH and PATH.pstats')
+    args = parser.parse_args(argv)
+    # The AI searches the same positions again at every depth
+    Board.enable_move_cache()
+    if args.profile:
+        from profiler import profile_to, default_targets
+        profile_to(args.profile, default_targets(Board, Game))
+
+    init_display()
     clock = pygame.time.Clock()
-    game = Game()
+    book = None
+    if args.book:
+        from book import OpeningBook
+        book = OpeningBook(args.book)
+    tablebase = None
+    if args.tablebase:
+        from tablebase import open_tablebase
+        tablebase = open_tablebase(args.tablebase)
+    game = Game(ai_time=args.ai_time, workers=args.workers, book=book, tablebase=tablebase, ponder=args.ponder)
+
+    def post_ai_move(result):
+        # Runs on the search thread; the move is applied by the event loop
+        pygame.event.post(pygame.event.Event(AI_MOVE_EVENT, result=result))
     
     while True:
-        clock.tick(60)
+        # Nothing to repaint: sleep until the next event instead of polling
+        events = pygame.event.get() if game.board.dirty else [pygame.event.wait()] + pygame.event.get()
         
-        for event in pygame.event.get():
+        for event in events:
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                game.board.mark_all_dirty()
+
             if event.type == pygame.QUIT:
+                game.cancel_ai_turn()
                 pygame.quit()
+                if game.ponder_stats['ponders']:
+                    print(game.ponder_report())
                 sys.exit()
+
+            if event.type == AI_MOVE_EVENT:
+                if game.finish_ai_turn(event.result):
+                    # Think on the human's time about the reply the search expects
+                    game.start_ponder()
+
+            # Left arrow or Backspace takes back the last move pair, Right arrow replays it
+            if event.type == pygame.KEYDOWN and event.key in (pygame.K_LEFT, pygame.K_BACKSPACE):
+                game.takeback()
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_RIGHT:
+                if game.redo() and not game.board.white_turn and not game.board.game_over:
+                    # The AI's reply had not been played before the takeback
+                    game.start_ai_turn(post_ai_move)
             
-            if event.type == pygame.MOUSEBUTTONDOWN and not game.board.checkmate and not game.board.stalemate:
-                if game.board.white_turn:  # Human's turn (white)
+            if event.type == pygame.MOUSEBUTTONDOWN and not game.board.game_over:
+                if game.board.white_turn and not game.ai_thinking:  # Human's turn (white)
                     if game.human_turn(pygame.mouse.get_pos()):
                         # After human moves, AI moves if game isn't over
-                        if not game.board.checkmate and not game.board.stalemate:
-                            game.ai_turn()
-                # else:  # AI's turn (black) - handled automatically after human move
-        
-        game.draw()
+                        if not game.board.game_over:
+                            game.start_ai_turn(post_ai_move)
+                # else:  # AI's turn (black) - the search posts AI_MOVE_EVENT when done
         
-        # Display game over message
-        if game.board.checkmate or game.board.stalemate:
-            font = pygame.font.SysFont('Arial', 50)
-            if game.board.checkmate:
-                text = font.render('Checkmate!', True, RED)
-            else:
-                text = font.render('Stalemate!', True, BLUE)
-            text_rect = text.get_rect(center=(WIDTH//2, HEIGHT//2))
-            WIN.blit(text, text_rect)
-            pygame.display.update()
+        if game.draw():
+            clock.tick(60)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,367 @@
+"""Alpha-beta search engine for the AI player.
+
+Negamax alpha-beta with iterative deepening and a quiescence search on
+captures and a transposition table keyed by Board.zobrist_key. Moves are
+ordered by the transposition table move, the previous iteration's principal
+variation, MVV-LVA for captures, killer moves and the history heuristic. Every search
+runs under a hard time and/or node budget and always returns a move when one
+exists.
+
+The transposition table and history scores are kept between searches.
+Killer moves are too when search is told the game ply of its root: they
+are shifted to stay aligned with the new root, so the searches of one game
+(and a ponder search on the opponent's expected reply) build on each other.
+
+With a tablebase (tablebase.Tablebase), positions with few enough pieces
+are scored exactly from the endgame tables instead of being searched.
+
+The engine only uses the Board interface (get_all_valid_moves, make_move,
+unmake_move, ...) and piece symbols, so it does not import the chess module.
+"""
+import time
+
+from evaluation import evaluate, PIECE_VALUES
+from transposition import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND
+
+MATE = 100000
+INFINITY = 1000000
+MAX_PLY = 128
+
+# How many nodes to search between clock checks
+TIME_CHECK_INTERVAL = 256
+
+
+def score_to_tt(score, ply):
+    """Store mate scores as distance from the stored node rather than from the root."""
+    if score >= MATE - MAX_PLY:
+        return score + ply
+    if score <= -MATE + MAX_PLY:
+        return score - ply
+    return score
+
+
+def score_from_tt(score, ply):
+    if score >= MATE - MAX_PLY:
+        return score - ply
+    if score <= -MATE + MAX_PLY:
+        return score + ply
+    return score
+
+
+def captured_symbol(board, move):
+    """Return the symbol of the piece a move captures, or None; en passant captures a pawn."""
+    (r, c), (row, col) = move
+    victim = board.board[row][col]
+    if victim != 0:
+        return victim.symbol
+    if c != col and board.board[r][c].symbol == 'P':
+        return 'P'
+    return None
+
+
+class SearchResult:
+    """Outcome of Engine.search: the best move found and search statistics."""
+
+    def __init__(self, move, score, depth, nodes, seconds, pv):
+        self.move = move
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.seconds = seconds
+        self.nps = int(nodes / seconds) if seconds > 0 else 0
+        self.pv = pv
+
+    def __repr__(self):
+        return (f'SearchResult(move={self.move}, score={self.score}, depth={self.depth}, '
+                f'nodes={self.nodes}, seconds={self.seconds:.3f}, nps={self.nps})')
+
+
+class Engine:
+    def __init__(self, time_limit=1.0, node_limit=None, max_depth=64, hash_mb=16, tablebase=None):
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.max_depth = max_depth
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.game_ply = None
+        self.history = {}
+        self.nodes = 0
+        self.stopped = False
+        self.stop_requested = False
+        self.search_prepared = False
+        self.deadline = None
+        self.node_budget = None
+        self.pv = [[] for _ in range(MAX_PLY + 1)]
+        self.principal_variation = []
+        self.tt = TranspositionTable(size_mb=hash_mb)
+        self.tablebase = tablebase
+
+    def new_game(self):
+        """Forget everything learned from previous searches."""
+        self.tt.clear()
+        self.history = {}
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.game_ply = None
+
+    def stop(self):
+        """Ask a running search to return as soon as possible; safe to call from another thread."""
+        self.stop_requested = True
+
+    def prepare_search(self):
+        """Clear earlier stop requests before starting a search on another thread.
+
+        The next search keeps a stop() made from now on, so one that comes
+        before the thread begins searching is not lost.
+        """
+        self.stop_requested = False
+        self.search_prepared = True
+
+    def search(self, board, time_limit=None, node_limit=None, max_depth=None, on_info=None, root_moves=None,
+               game_ply=None):
+        """Search the side to move's best move in board and return a SearchResult.
+
+        The board is searched in place and restored before returning. Limits
+        default to the ones given to the constructor; None means unlimited.
+        on_info, if given, is called with a SearchResult after every completed
+        iteration. A search interrupted by stop() still returns the best move
+        found so far. root_moves, if given, restricts the search to those
+        legal moves at the root. game_ply, if given, is the number of moves
+        played in the game before board; the killer moves of a previous
+        search from the same or an earlier ply are then kept.
+        """
+        time_limit = self.time_limit if time_limit is None else time_limit
+        node_limit = self.node_limit if node_limit is None else node_limit
+        max_depth = self.max_depth if max_depth is None else max_depth
+
+        start = time.perf_counter()
+        self.deadline = start + time_limit if time_limit is not None else None
+        self.node_budget = node_limit if node_limit is not None else float('inf')
+        self.nodes = 0
+        self.stopped = False
+        if not self.search_prepared:
+            self.stop_requested = False
+        self.search_prepared = False
+        self.advance_killers(game_ply)
+
+        color = 'w' if board.white_turn else 'b'
+        legal_moves = board.get_all_valid_moves(color)
+        if root_moves is not None:
+            legal_moves = [move for move in legal_moves if move in root_moves]
+        root_moves = legal_moves
+        if not root_moves:
+            return SearchResult(None, 0, 0, 0, time.perf_counter() - start, [])
+
+        best = SearchResult(root_moves[0], 0, 0, 0, 0.0, [root_moves[0]])
+        self.principal_variation = []
+        for depth in range(1, max_depth + 1):
+            move, score = self.search_root(board, root_moves, depth)
+            if self.stopped:
+                # A move finished in the interrupted iteration beat the previous best
+                if move is not None:
+                    best = SearchResult(move, score, best.depth, 0, 0.0, list(self.pv[0]))
+                break
+            best = SearchResult(move, score, depth, self.nodes,
+                                time.perf_counter() - start, list(self.pv[0]))
+            self.principal_variation = best.pv
+            if on_info is not None:
+                on_info(best)
+            # Search the best move first in the next iteration
+            root_moves.remove(move)
+            root_moves.insert(0, move)
+            if abs(score) >= MATE - MAX_PLY:
+                break
+
+        best.nodes = self.nodes
+        best.seconds = time.perf_counter() - start
+        best.nps = int(best.nodes / best.seconds) if best.seconds > 0 else 0
+        return best
+
+    def search_root(self, board, moves, depth):
+        """Search every root move to depth; return the best move and score.
+
+        If the budget runs out part-way, the best fully searched move is
+        returned, or None if not even the first move was finished.
+        """
+        alpha, beta = -INFINITY, INFINITY
+        best_move = None
+        for move in moves:
+            (r, c), (row, col) = move
+            undo = board.make_move(board.board[r][c], row, col)
+            score = -self.negamax(board, depth - 1, -beta, -alpha, 1)
+            board.unmake_move(undo)
+            if self.stopped:
+                break
+            if score > alpha:
+                alpha = score
+                best_move = move
+                self.pv[0] = [move] + self.pv[1]
+        return best_move, alpha
+
+    def out_of_budget(self):
+        if self.stop_requested or self.nodes >= self.node_budget:
+            return True
+        if self.deadline is not None and self.nodes % TIME_CHECK_INTERVAL == 0:
+            return time.perf_counter() >= self.deadline
+        return False
+
+    def negamax(self, board, depth, alpha, beta, ply):
+        self.pv[ply] = []
+        if depth <= 0 or ply >= MAX_PLY:
+            return self.quiescence(board, alpha, beta, ply)
+
+        self.nodes += 1
+        if self.out_of_budget():
+            self.stopped = True
+            return 0
+
+        if self.tablebase is not None:
+            score = self.probe_tablebase(board, ply)
+            if score is not None:
+                return score
+
+        key = board.zobrist_key
+        tt_move = None
+        entry = self.tt.probe(key)
+        if entry is not None:
+            entry_depth, (flag, tt_score, tt_move) = entry
+            if entry_depth >= depth:
+                tt_score = score_from_tt(tt_score, ply)
+                if (flag == EXACT or (flag == LOWER_BOUND and tt_score >= beta)
+                        or (flag == UPPER_BOUND and tt_score <= alpha)):
+                    if tt_move is not None:
+                        self.pv[ply] = [tt_move]
+                    return tt_score
+
+        color = 'w' if board.white_turn else 'b'
+        moves = board.get_all_valid_moves(color)
+        if not moves:
+            king = board.white_king if board.white_turn else board.black_king
+            if board.is_square_under_attack(king[0], king[1], 'b' if board.white_turn else 'w'):
+                return -MATE + ply
+            return 0
+
+        moves = self.order_moves(board, moves, ply, tt_move)
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = None
+        for move in moves:
+            (r, c), (row, col) = move
+            captured = captured_symbol(board, move)
+            undo = board.make_move(board.board[r][c], row, col)
+            score = -self.negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            board.unmake_move(undo)
+            if self.stopped:
+                return 0
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    self.pv[ply] = [move] + self.pv[ply + 1]
+                    if alpha >= beta:
+                        if captured is None:
+                            self.store_killer(move, ply)
+                            self.history[(color, move)] = self.history.get((color, move), 0) + depth * depth
+                        break
+
+        if best_score >= beta:
+            flag = LOWER_BOUND
+        elif best_score > original_alpha:
+            flag = EXACT
+        else:
+            flag = UPPER_BOUND
+        self.tt.store(key, depth, (flag, score_to_tt(best_score, ply), best_move))
+        return best_score
+
+    def quiescence(self, board, alpha, beta, ply):
+        """Search captures and promotions until the position is quiet."""
+        self.pv[ply] = []
+        self.nodes += 1
+        if self.out_of_budget():
+            self.stopped = True
+            return 0
+
+        if self.tablebase is not None:
+            score = self.probe_tablebase(board, ply)
+            if score is not None:
+                return score
+
+        stand_pat = evaluate(board)
+        if stand_pat >= beta or ply >= MAX_PLY:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        color = 'w' if board.white_turn else 'b'
+        captures = []
+        for move in board.get_all_valid_moves(color):
+            (r, c), (row, col) = move
+            victim = captured_symbol(board, move)
+            if victim is not None:
+                captures.append((PIECE_VALUES[victim] * 10 - PIECE_VALUES[board.board[r][c].symbol], move))
+            elif board.board[r][c].symbol == 'P' and (row == 0 or row == 7):
+                captures.append((PIECE_VALUES['Q'] * 10, move))
+        captures.sort(key=lambda item: item[0], reverse=True)
+
+        for _, move in captures:
+            (r, c), (row, col) = move
+            undo = board.make_move(board.board[r][c], row, col)
+            score = -self.quiescence(board, -beta, -alpha, ply + 1)
+            board.unmake_move(undo)
+            if self.stopped:
+                return 0
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+        return alpha
+
+    def probe_tablebase(self, board, ply):
+        """Return the exact score of a position from the endgame tables, or None."""
+        if len(board.pieces['w']) + len(board.pieces['b']) > self.tablebase.max_pieces:
+            return None
+        return self.tablebase.probe_score(board, ply)
+
+    def order_moves(self, board, moves, ply, tt_move=None):
+        """Sort moves: TT move, PV move, captures by MVV-LVA, killers, then by history score."""
+        pv_move = self.pv_move(ply)
+        killers = self.killers[ply]
+        color = 'w' if board.white_turn else 'b'
+        history = self.history
+
+        def score(move):
+            if move == tt_move:
+                return 4 * INFINITY
+            if move == pv_move:
+                return 3 * INFINITY
+            victim = captured_symbol(board, move)
+            if victim is not None:
+                (r, c), _ = move
+                return 2 * INFINITY + PIECE_VALUES[victim] * 10 - PIECE_VALUES[board.board[r][c].symbol]
+            if move == killers[0]:
+                return INFINITY + 1
+            if move == killers[1]:
+                return INFINITY
+            return history.get((color, move), 0)
+
+        return sorted(moves, key=score, reverse=True)
+
+    def pv_move(self, ply):
+        """Return the move at ply of the previous iteration's principal variation, if any."""
+        pv = self.principal_variation
+        return pv[ply] if ply < len(pv) else None
+
+    def advance_killers(self, game_ply):
+        """Shift the killer moves to a root game_ply moves into the game, or clear them."""
+        shift = game_ply - self.game_ply if game_ply is not None and self.game_ply is not None else -1
+        if 0 <= shift < MAX_PLY:
+            self.killers = self.killers[shift:] + [[None, None] for _ in range(shift)]
+        else:
+            self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.game_ply = game_ply
+
+    def store_killer(self, move, ply):
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
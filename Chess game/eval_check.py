@@ -0,0 +1,137 @@
+"""Consistency check of the incremental evaluation against a from-scratch one.
+
+Plays random games with Board.make_move and checks after every move, and
+again after unmaking the moves, that the terms the board keeps up to date
+(piece-square sums, phase, material and pawn key) equal those computed
+from scratch, and that evaluation.evaluate equals evaluation.evaluate_full.
+When NumPy is installed, the positions after every move are also scored
+by batch_evaluation.evaluate_boards, which must give the same scores:
+
+    python eval_check.py --games 200 --plies 120 --seed 1
+    python eval_check.py --fen "<FEN>" --games 50
+
+Every mismatch is printed with the position's FEN and the moves leading to
+it; the exit status is 1 when any was found.
+"""
+import argparse
+import random
+import sys
+import time
+
+from chess import Board, Pawn, ROWS, START_FEN, square_name
+from evaluation import evaluate, evaluate_full
+
+try:
+    from batch_evaluation import evaluate_boards
+except ImportError:
+    evaluate_boards = None
+
+TERMS = ('middlegame', 'endgame', 'phase', 'white_material', 'black_material', 'pawn_key')
+
+
+def check_position(board):
+    """Return a description of each incremental term of board that differs from scratch."""
+    problems = []
+    expected = board.compute_evaluation_terms()
+    for name, value in zip(TERMS, expected):
+        actual = getattr(board, name)
+        if actual != value:
+            problems.append(f'{name} is {actual}, expected {value}')
+    actual, value = evaluate(board), evaluate_full(board)
+    if actual != value:
+        problems.append(f'evaluate is {actual}, expected {value}')
+    return problems
+
+
+def random_game(board, rng, plies):
+    """Play up to plies random moves on board; yield the move played (in UCI) after each one.
+
+    The moves are unmade again once the game ends, yielding None after each.
+    """
+    undos = []
+    for _ in range(plies):
+        moves = board.get_all_valid_moves('w' if board.white_turn else 'b')
+        if not moves:
+            break
+        (r, c), (row, col) = rng.choice(moves)
+        piece = board.board[r][c]
+        promotion = rng.choice('QRBN') if isinstance(piece, Pawn) and row in (0, ROWS - 1) else 'Q'
+        uci = square_name(r, c) + square_name(row, col)
+        if isinstance(piece, Pawn) and row in (0, ROWS - 1):
+            uci += promotion.lower()
+        undos.append(board.make_move(piece, row, col, promotion))
+        yield uci
+    while undos:
+        board.unmake_move(undos.pop())
+        yield None
+
+
+def check_batch(positions):
+    """Return (board, line, batch score, expected score) for each position the batch evaluator gets wrong.
+
+    positions is a list of (board, line) pairs.
+    """
+    scores = evaluate_boards([board for board, _ in positions])
+    wrong = []
+    for (board, line), score in zip(positions, scores):
+        expected = evaluate_full(board)
+        if score != expected:
+            wrong.append((board, line, int(score), expected))
+    return wrong
+
+
+def run_check(fen=START_FEN, games=100, plies=100, seed=None, batch=True, out=sys.stdout):
+    """Check games random games from fen; return (positions checked, mismatches).
+
+    With batch, and NumPy installed, the batch evaluator is checked too.
+    """
+    rng = random.Random(seed)
+    board = Board(fen)
+    batch = batch and evaluate_boards is not None
+    positions = mismatches = 0
+    for game in range(games):
+        line = []
+        batch_positions = []
+        for uci in random_game(board, rng, plies):
+            if uci is None:
+                line.pop()
+            else:
+                line.append(uci)
+                if batch:
+                    batch_positions.append((Board.from_packed(board.pack()), ' '.join(line)))
+            positions += 1
+            problems = check_position(board)
+            if problems:
+                mismatches += 1
+                print(f"game {game + 1}: {board.fen()} after {' '.join(line) or '(no moves)'}", file=out)
+                for problem in problems:
+                    print(f'    {problem}', file=out)
+        if batch_positions:
+            for copy, moves, score, expected in check_batch(batch_positions):
+                mismatches += 1
+                print(f'game {game + 1}: {copy.fen()} after {moves}', file=out)
+                print(f'    batch evaluation is {score}, expected {expected}', file=out)
+    return positions, mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the incremental evaluation with a from-scratch one '
+                                                 'on random games.')
+    parser.add_argument('--fen', default=START_FEN, help='starting position (default: start position)')
+    parser.add_argument('--games', type=int, default=100, help='random games to play')
+    parser.add_argument('--plies', type=int, default=100, help='maximum plies per game')
+    parser.add_argument('--seed', type=int, help='random seed')
+    parser.add_argument('--no-batch', dest='batch', action='store_false',
+                        help="don't check batch_evaluation even when NumPy is installed")
+    args = parser.parse_args(argv)
+
+    if args.batch and evaluate_boards is None:
+        print('NumPy is not installed: batch evaluation not checked')
+    start = time.perf_counter()
+    positions, mismatches = run_check(args.fen, args.games, args.plies, args.seed, args.batch)
+    print(f'{positions} positions checked, {mismatches} mismatches in {time.perf_counter() - start:.3f}s')
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,284 @@
+"""Static evaluation: material, piece-square tables, mobility and pawn
+structure, tapered by game phase.
+
+Tables are written from White's point of view with rank 8 first, the same
+orientation as Board.board, so a white piece on (row, col) reads index
+row * 8 + col and a black piece reads the mirrored (7 - row) * 8 + col.
+
+Material, piece-square sums and game phase are kept up to date by
+Board.make_move from the PIECE_SQUARE tables below, so evaluate() only
+scans for mobility; pawn structure is cached by Board.pawn_key.
+evaluate_full() computes everything from scratch, and eval_check.py
+compares the two on random games.
+
+batch_evaluation.py computes the same score with NumPy for many positions
+at once; any change to the terms here has to be made there too.
+"""
+from transposition import TranspositionTable
+
+PIECE_VALUES = {'P': 100, 'N': 320, 'B': 330, 'R': 500, 'Q': 900, 'K': 0}
+
+# Contribution of each piece to the game phase; MAX_PHASE is the starting material
+PHASE_WEIGHTS = {'P': 0, 'N': 1, 'B': 1, 'R': 2, 'Q': 4, 'K': 0}
+MAX_PHASE = 24
+
+PAWN_TABLE = [
+     0,   0,   0,   0,   0,   0,   0,   0,
+    50,  50,  50,  50,  50,  50,  50,  50,
+    10,  10,  20,  30,  30,  20,  10,  10,
+     5,   5,  10,  25,  25,  10,   5,   5,
+     0,   0,   0,  20,  20,   0,   0,   0,
+     5,  -5, -10,   0,   0, -10,  -5,   5,
+     5,  10,  10, -20, -20,  10,  10,   5,
+     0,   0,   0,   0,   0,   0,   0,   0,
+]
+
+KNIGHT_TABLE = [
+   -50, -40, -30, -30, -30, -30, -40, -50,
+   -40, -20,   0,   0,   0,   0, -20, -40,
+   -30,   0,  10,  15,  15,  10,   0, -30,
+   -30,   5,  15,  20,  20,  15,   5, -30,
+   -30,   0,  15,  20,  20,  15,   0, -30,
+   -30,   5,  10,  15,  15,  10,   5, -30,
+   -40, -20,   0,   5,   5,   0, -20, -40,
+   -50, -40, -30, -30, -30, -30, -40, -50,
+]
+
+BISHOP_TABLE = [
+   -20, -10, -10, -10, -10, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,  10,  10,   5,   0, -10,
+   -10,   5,   5,  10,  10,   5,   5, -10,
+   -10,   0,  10,  10,  10,  10,   0, -10,
+   -10,  10,  10,  10,  10,  10,  10, -10,
+   -10,   5,   0,   0,   0,   0,   5, -10,
+   -20, -10, -10, -10, -10, -10, -10, -20,
+]
+
+ROOK_TABLE = [
+     0,   0,   0,   0,   0,   0,   0,   0,
+     5,  10,  10,  10,  10,  10,  10,   5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+     0,   0,   0,   5,   5,   0,   0,   0,
+]
+
+QUEEN_TABLE = [
+   -20, -10, -10,  -5,  -5, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,   5,   5,   5,   0, -10,
+    -5,   0,   5,   5,   5,   5,   0,  -5,
+     0,   0,   5,   5,   5,   5,   0,  -5,
+   -10,   5,   5,   5,   5,   5,   0, -10,
+   -10,   0,   5,   0,   0,   0,   0, -10,
+   -20, -10, -10,  -5,  -5, -10, -10, -20,
+]
+
+KING_MIDDLEGAME_TABLE = [
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -20, -30, -30, -40, -40, -30, -30, -20,
+   -10, -20, -20, -20, -20, -20, -20, -10,
+    20,  20,   0,   0,   0,   0,  20,  20,
+    20,  30,  10,   0,   0,  10,  30,  20,
+]
+
+KING_ENDGAME_TABLE = [
+   -50, -40, -30, -20, -20, -30, -40, -50,
+   -30, -20, -10,   0,   0, -10, -20, -30,
+   -30, -10,  20,  30,  30,  20, -10, -30,
+   -30, -10,  30,  40,  40,  30, -10, -30,
+   -30, -10,  30,  40,  40,  30, -10, -30,
+   -30, -10,  20,  30,  30,  20, -10, -30,
+   -30, -30,   0,   0,   0,   0, -30, -30,
+   -50, -30, -30, -30, -30, -30, -30, -50,
+]
+
+PST_MIDDLEGAME = {'P': PAWN_TABLE, 'N': KNIGHT_TABLE, 'B': BISHOP_TABLE,
+                  'R': ROOK_TABLE, 'Q': QUEEN_TABLE, 'K': KING_MIDDLEGAME_TABLE}
+PST_ENDGAME = {'P': PAWN_TABLE, 'N': KNIGHT_TABLE, 'B': BISHOP_TABLE,
+               'R': ROOK_TABLE, 'Q': QUEEN_TABLE, 'K': KING_ENDGAME_TABLE}
+
+
+def piece_square_scores(tables):
+    """Return value plus piece-square score by piece code ('wp', 'bN', ...) and square row * 8 + col.
+
+    Scores are from White's point of view, so Black's are negated and mirrored.
+    """
+    scores = {}
+    for color in 'wb':
+        for symbol, table in tables.items():
+            code = color + ('p' if symbol == 'P' else symbol)
+            if color == 'w':
+                scores[code] = [PIECE_VALUES[symbol] + value for value in table]
+            else:
+                scores[code] = [-PIECE_VALUES[symbol] - table[(7 - row) * 8 + col]
+                                for row in range(8) for col in range(8)]
+    return scores
+
+
+PIECE_SQUARE_MIDDLEGAME = piece_square_scores(PST_MIDDLEGAME)
+PIECE_SQUARE_ENDGAME = piece_square_scores(PST_ENDGAME)
+PIECE_PHASE = {color + ('p' if symbol == 'P' else symbol): weight
+               for color in 'wb' for symbol, weight in PHASE_WEIGHTS.items()}
+PIECE_MATERIAL = {color + ('p' if symbol == 'P' else symbol): value
+                  for color in 'wb' for symbol, value in PIECE_VALUES.items()}
+
+# Pawn structure terms by Board.pawn_key, shared by all boards
+pawn_cache = TranspositionTable(size_mb=2, policy='always')
+
+# Bonus per square a piece attacks that is not taken by its own side
+MOBILITY_MIDDLEGAME = {'N': 4, 'B': 5, 'R': 2, 'Q': 1}
+MOBILITY_ENDGAME = {'N': 4, 'B': 5, 'R': 4, 'Q': 2}
+
+# Pawn structure: per doubled pawn (beyond the first on a file), per isolated
+# pawn, and for a passed pawn by its rank counted from its own side (index 0 = rank 1)
+DOUBLED_PAWN_MIDDLEGAME, DOUBLED_PAWN_ENDGAME = -10, -20
+ISOLATED_PAWN_MIDDLEGAME, ISOLATED_PAWN_ENDGAME = -10, -15
+PASSED_PAWN_MIDDLEGAME = [0, 5, 10, 15, 25, 40, 70, 0]
+PASSED_PAWN_ENDGAME = [0, 10, 15, 25, 45, 75, 120, 0]
+
+KNIGHT_JUMPS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]
+ORTHOGONAL = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+DIAGONAL = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+DIRECTIONS = {'B': DIAGONAL, 'R': ORTHOGONAL, 'Q': ORTHOGONAL + DIAGONAL}
+
+# Squares a knight on index row * 8 + col jumps to, and the rays of each slider
+KNIGHT_TARGETS = [[(row + dr, col + dc) for dr, dc in KNIGHT_JUMPS if 0 <= row + dr < 8 and 0 <= col + dc < 8]
+                  for row in range(8) for col in range(8)]
+SLIDER_RAYS = {
+    symbol: [[[(row + dr * i, col + dc * i) for i in range(1, 8)
+               if 0 <= row + dr * i < 8 and 0 <= col + dc * i < 8] for dr, dc in directions]
+             for row in range(8) for col in range(8)]
+    for symbol, directions in DIRECTIONS.items()
+}
+
+
+def mobility(board, piece):
+    """Return the number of squares piece attacks that are empty or hold an enemy piece."""
+    grid = board.board
+    color = piece.color
+    index = piece.row * 8 + piece.col
+    count = 0
+    if piece.symbol == 'N':
+        for row, col in KNIGHT_TARGETS[index]:
+            target = grid[row][col]
+            if target == 0 or target.color != color:
+                count += 1
+        return count
+    for ray in SLIDER_RAYS[piece.symbol][index]:
+        for row, col in ray:
+            target = grid[row][col]
+            if target == 0:
+                count += 1
+                continue
+            if target.color != color:
+                count += 1
+            break
+    return count
+
+
+def pawn_structure(board):
+    """Return the (middlegame, endgame) doubled, isolated and passed pawn terms, White minus Black."""
+    white = [(piece.row, piece.col) for piece in board.pieces['w'] if piece.symbol == 'P']
+    black = [(piece.row, piece.col) for piece in board.pieces['b'] if piece.symbol == 'P']
+    # Pawn counts per file, and the row of the pawn furthest up the board from
+    # each side's point of view; padded by one file on each side
+    white_files = [0] * 10
+    black_files = [0] * 10
+    white_rearmost = [-1] * 10
+    black_rearmost = [8] * 10
+    for row, col in white:
+        white_files[col + 1] += 1
+        white_rearmost[col + 1] = max(white_rearmost[col + 1], row)
+    for row, col in black:
+        black_files[col + 1] += 1
+        black_rearmost[col + 1] = min(black_rearmost[col + 1], row)
+
+    middlegame = endgame = 0
+    for sign, pawns, files, enemy_rearmost in ((1, white, white_files, black_rearmost),
+                                                (-1, black, black_files, white_rearmost)):
+        for count in files:
+            if count > 1:
+                middlegame += sign * DOUBLED_PAWN_MIDDLEGAME * (count - 1)
+                endgame += sign * DOUBLED_PAWN_ENDGAME * (count - 1)
+        for row, col in pawns:
+            if files[col] == 0 and files[col + 2] == 0:
+                middlegame += sign * ISOLATED_PAWN_MIDDLEGAME
+                endgame += sign * ISOLATED_PAWN_ENDGAME
+            # Passed: no enemy pawn ahead on this or an adjacent file
+            if sign == 1:
+                passed = min(enemy_rearmost[col:col + 3]) >= row
+                rank = 7 - row
+            else:
+                passed = max(enemy_rearmost[col:col + 3]) <= row
+                rank = row
+            if passed:
+                middlegame += sign * PASSED_PAWN_MIDDLEGAME[rank]
+                endgame += sign * PASSED_PAWN_ENDGAME[rank]
+    return middlegame, endgame
+
+
+def cached_pawn_structure(board):
+    """Return pawn_structure(board), looked up in pawn_cache by the board's pawn key."""
+    entry = pawn_cache.probe(board.pawn_key)
+    if entry is not None:
+        return entry[1]
+    terms = pawn_structure(board)
+    pawn_cache.store(board.pawn_key, 0, terms)
+    return terms
+
+
+def evaluate(board):
+    """Return the static evaluation of board in centipawns for the side to move.
+
+    Uses the material, piece-square and phase sums Board keeps up to date
+    and the pawn cache; only mobility is computed here.
+    """
+    middlegame = board.middlegame
+    endgame = board.endgame
+    for color, sign in (('w', 1), ('b', -1)):
+        for piece in board.pieces[color]:
+            symbol = piece.symbol
+            if symbol in MOBILITY_MIDDLEGAME:
+                moves = mobility(board, piece)
+                middlegame += sign * MOBILITY_MIDDLEGAME[symbol] * moves
+                endgame += sign * MOBILITY_ENDGAME[symbol] * moves
+
+    pawn_middlegame, pawn_endgame = cached_pawn_structure(board)
+    middlegame += pawn_middlegame
+    endgame += pawn_endgame
+
+    phase = min(board.phase, MAX_PHASE)
+    score = (middlegame * phase + endgame * (MAX_PHASE - phase)) // MAX_PHASE
+    return score if board.white_turn else -score
+
+
+def evaluate_full(board):
+    """Return the same evaluation as evaluate(), computed from scratch without the board's sums or caches."""
+    middlegame = endgame = phase = 0
+    for color, sign in (('w', 1), ('b', -1)):
+        for piece in board.pieces[color]:
+            symbol = piece.symbol
+            index = piece.row * 8 + piece.col if sign == 1 else (7 - piece.row) * 8 + piece.col
+            value = PIECE_VALUES[symbol]
+            middlegame += sign * (value + PST_MIDDLEGAME[symbol][index])
+            endgame += sign * (value + PST_ENDGAME[symbol][index])
+            phase += PHASE_WEIGHTS[symbol]
+            if symbol in MOBILITY_MIDDLEGAME:
+                moves = mobility(board, piece)
+                middlegame += sign * MOBILITY_MIDDLEGAME[symbol] * moves
+                endgame += sign * MOBILITY_ENDGAME[symbol] * moves
+
+    pawn_middlegame, pawn_endgame = pawn_structure(board)
+    middlegame += pawn_middlegame
+    endgame += pawn_endgame
+
+    phase = min(phase, MAX_PHASE)
+    score = (middlegame * phase + endgame * (MAX_PHASE - phase)) // MAX_PHASE
+    return score if board.white_turn else -score
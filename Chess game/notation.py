@@ -0,0 +1,110 @@
+"""UCI and SAN move notation for Board.
+
+A move here is a (from_square, to_square, promotion) tuple of (row, col)
+squares and a promotion letter 'Q', 'R', 'B' or 'N'; promotion is None
+for moves that do not promote. The engine's ((r, c), (row, col)) moves
+convert with move[0], move[1].
+"""
+import re
+
+from chess import ROWS, PROMOTION_PIECES, square_name, parse_square
+
+SAN_PATTERN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+
+
+def legal_moves(board):
+    """Return the legal moves of the side to move, one per promotion piece for promotions."""
+    moves = []
+    for (r, c), (row, col) in board.get_legal_moves():
+        if board.board[r][c].symbol == 'P' and (row == 0 or row == ROWS - 1):
+            for promotion in PROMOTION_PIECES:
+                moves.append(((r, c), (row, col), promotion))
+        else:
+            moves.append(((r, c), (row, col), None))
+    return moves
+
+
+def push(board, move):
+    """Play a legal move on board through Board.move."""
+    (r, c), (row, col), promotion = move
+    board.move(board.board[r][c], row, col, promotion or 'Q')
+
+
+def move_to_uci(move):
+    (r, c), (row, col), promotion = move
+    return square_name(r, c) + square_name(row, col) + (promotion.lower() if promotion else '')
+
+
+def parse_uci(board, text):
+    """Return the legal move of board written as text in UCI notation (e2e4, e7e8q)."""
+    if len(text) not in (4, 5):
+        raise ValueError(f'Invalid UCI move: {text!r}')
+    move = (parse_square(text[:2]), parse_square(text[2:4]), text[4].upper() if len(text) == 5 else None)
+    if move not in legal_moves(board):
+        raise ValueError(f'Illegal move: {text!r}')
+    return move
+
+
+def move_to_san(board, move, moves=None):
+    """Return move, which must be legal on board, in standard algebraic notation.
+
+    moves, if given, is legal_moves(board), to save regenerating it when
+    writing many moves of the same position.
+    """
+    (r, c), (row, col), promotion = move
+    piece = board.board[r][c]
+    if piece.symbol == 'K' and abs(col - c) == 2:
+        san = 'O-O' if col > c else 'O-O-O'
+    else:
+        capture = board.board[row][col] != 0 or (piece.symbol == 'P' and col != c)
+        if piece.symbol == 'P':
+            san = ('abcdefgh'[c] + 'x' if capture else '') + square_name(row, col)
+            if promotion:
+                san += '=' + promotion
+        else:
+            # Disambiguate by file, then rank, then both
+            others = [(fr, fc) for (fr, fc), to, _ in (moves or legal_moves(board))
+                      if to == (row, col) and (fr, fc) != (r, c) and board.board[fr][fc].piece == piece.piece]
+            prefix = ''
+            if others:
+                if all(fc != c for _, fc in others):
+                    prefix = 'abcdefgh'[c]
+                elif all(fr != r for fr, _ in others):
+                    prefix = str(ROWS - r)
+                else:
+                    prefix = square_name(r, c)
+            san = piece.symbol + prefix + ('x' if capture else '') + square_name(row, col)
+
+    undo = board.make_move(piece, row, col, promotion or 'Q')
+    king = board.white_king if board.white_turn else board.black_king
+    if board.is_square_under_attack(king[0], king[1], 'b' if board.white_turn else 'w'):
+        san += '+' if board.get_legal_moves() else '#'
+    board.unmake_move(undo)
+    return san
+
+
+def parse_san(board, text):
+    """Return the legal move of board written as text in standard algebraic notation."""
+    san = text.rstrip('+#!?')
+    moves = legal_moves(board)
+    if san in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        king = board.white_king if board.white_turn else board.black_king
+        target = (king[0], king[1] + (2 if len(san) == 3 else -2))
+        candidates = [move for move in moves if move[0] == king and move[1] == target]
+    else:
+        match = SAN_PATTERN.match(san)
+        if match is None:
+            raise ValueError(f'Invalid SAN move: {text!r}')
+        symbol, from_file, from_rank, to, promotion = match.groups()
+        symbol = symbol or 'P'
+        to = parse_square(to)
+        candidates = []
+        for move in moves:
+            (r, c), target, move_promotion = move
+            if (target == to and board.board[r][c].symbol == symbol and move_promotion == promotion
+                    and (from_file is None or 'abcdefgh'[c] == from_file)
+                    and (from_rank is None or str(ROWS - r) == from_rank)):
+                candidates.append(move)
+    if len(candidates) != 1:
+        raise ValueError(f"{'Ambiguous' if candidates else 'Illegal'} move: {text!r}")
+    return candidates[0]
@@ -0,0 +1,324 @@
+"""Multi-process root-splitting search.
+
+The legal moves at the root are ordered, dealt round-robin to a pool of
+worker processes and searched there by an ordinary Engine restricted to
+its share of the root moves. Every worker reports the best move and score
+of each iteration it completed. Workers finish depth 1 before their time
+limit applies, so every root move is scored. The combined result is the
+best move of the deepest iteration that every worker finished. A worker that stopped
+early on a mate score counts as having finished every depth.
+
+Processes rather than threads are used because of the GIL. Positions are
+sent to the workers as Board.pack() bytes. Each worker keeps its Engine,
+and with it the transposition table and history, for as long as the pool
+lives; every task carries the id of its game, and a worker that sees a new
+one clears its Engine first, so a new game does not restart the pool.
+
+Measure the speedup curve from 1 to N workers at a fixed depth:
+
+    python parallel.py --bench --workers 8 --depth 4 --json smp.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import threading
+import time
+
+from chess import Board, START_FEN
+from engine import Engine, SearchResult, MATE, MAX_PLY
+from tablebase import Tablebase
+
+# Middlegame and endgame positions for the speedup benchmark
+BENCH_POSITIONS = [
+    ('start', START_FEN),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'),
+    ('position3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1'),
+    ('position4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1'),
+    ('position6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10'),
+]
+
+# Workers are spawned rather than forked: the pool may be started from a
+# search thread while another thread holds locks (stdin in uci.py, SDL in the GUI)
+CONTEXT = multiprocessing.get_context('spawn')
+
+# How often a worker checks whether its search was stopped
+POLL_INTERVAL = 0.05
+
+# The Engine of the current worker process, created by init_worker, and the
+# ids of the game and the search its current task belongs to
+worker_engine = None
+worker_game = None
+worker_search = None
+# Held while the search id changes and while the stop watcher compares and stops
+worker_lock = threading.Lock()
+
+
+def init_worker(hash_mb, stopped_search, ready, tablebase_directory=None):
+    global worker_engine
+    # Limits always come with each task, so the engine's own defaults are unlimited;
+    # the tables are memory-mapped, so every worker opens its own
+    tablebase = Tablebase(tablebase_directory) if tablebase_directory else None
+    worker_engine = Engine(time_limit=None, hash_mb=hash_mb, tablebase=tablebase)
+    threading.Thread(target=watch_stop, args=(stopped_search,), daemon=True).start()
+    with ready.get_lock():
+        ready.value += 1
+
+
+def watch_stop(stopped_search):
+    """Stop the worker's search when its id is written to the shared stopped_search."""
+    while True:
+        time.sleep(POLL_INTERVAL)
+        # A task cannot start a new search between the comparison and the stop
+        with worker_lock:
+            if stopped_search.value == worker_search:
+                worker_engine.stop()
+
+
+def search_root_moves(game_id, search_id, packed, moves, time_limit, node_limit, max_depth):
+    """Search the given root moves of a packed position in a worker process.
+
+    Returns the (depth, move, score, pv) of every completed iteration and
+    the final SearchResult.
+    """
+    global worker_game, worker_search
+    with worker_lock:
+        if game_id != worker_game:
+            worker_game = game_id
+            worker_engine.new_game()
+        worker_search = search_id
+        # Searches are prepared so that a stop() of this search id is never cleared
+        worker_engine.prepare_search()
+    board = Board.from_packed(packed)
+    iterations = []
+
+    def record(info):
+        iterations.append((info.depth, info.move, info.score, info.pv))
+
+    # Finish depth 1 whatever the limits, so that combine() never has to drop
+    # this worker's moves; the time it took counts against the time limit
+    start = time.perf_counter()
+    result = worker_engine.search(board, None, None, 1, on_info=record, root_moves=moves)
+    with worker_lock:
+        deeper = max_depth > 1 and not worker_engine.stop_requested
+        if deeper:
+            worker_engine.prepare_search()
+    if deeper:
+        if time_limit is not None:
+            time_limit = max(0.0, time_limit - (time.perf_counter() - start))
+        result = worker_engine.search(board, time_limit, node_limit, max_depth, on_info=record, root_moves=moves)
+    return iterations, result
+
+
+def is_mate_score(score):
+    return abs(score) >= MATE - MAX_PLY
+
+
+def combine(reports):
+    """Return (depth, move, score, pv) of the best move from the workers' reports.
+
+    reports is a list of (iterations, result) as returned by
+    search_root_moves. Only the deepest iteration completed by every worker
+    is compared, so all scores come from searches of the same depth.
+    Workers finish depth 1 unless the search is stopped; if none did, the
+    best of their partial results is returned.
+    """
+    finished = [iterations for iterations, _ in reports if iterations]
+    if not finished:
+        result = max((result for _, result in reports if result.move is not None),
+                     key=lambda result: result.score, default=reports[0][1])
+        return 0, result.move, result.score, result.pv
+
+    # A worker that stopped on a mate score has its final answer for any depth
+    depths = [iterations[-1][0] for iterations in finished if not is_mate_score(iterations[-1][2])]
+    depth = min(depths) if depths else max(iterations[-1][0] for iterations in finished)
+
+    best = None
+    for iterations in finished:
+        candidates = [entry for entry in iterations if entry[0] <= depth]
+        if candidates and (best is None or candidates[-1][2] > best[2]):
+            best = candidates[-1]
+    return best
+
+
+class ParallelEngine:
+    """Drop-in replacement for Engine that searches on several processes.
+
+    With workers=1 the search runs in this process on a plain Engine, which
+    is the baseline for the speedup benchmark. With a tablebase, every
+    worker's Engine probes the same table directory.
+    """
+
+    def __init__(self, workers=None, time_limit=1.0, node_limit=None, max_depth=64, hash_mb=16, tablebase=None):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.max_depth = max_depth
+        self.hash_mb = hash_mb
+        self.tablebase = tablebase
+        self.engine = Engine(time_limit=time_limit, node_limit=node_limit, max_depth=max_depth, hash_mb=hash_mb,
+                             tablebase=tablebase)
+        self.pool = None
+        self.game_id = 0
+        self.search_id = 0
+        self.search_prepared = False
+        self.stopped_search = CONTEXT.Value('i', -1, lock=False)
+        # Number of worker processes that finished init_worker
+        self.ready = CONTEXT.Value('i', 0)
+
+    def start_pool(self):
+        """Start the worker processes and wait until they have imported the modules."""
+        if self.pool is None and self.workers > 1:
+            self.ready.value = 0
+            self.pool = CONTEXT.Pool(self.workers, initializer=init_worker,
+                                     initargs=(self.hash_mb, self.stopped_search, self.ready,
+                                               self.tablebase.directory if self.tablebase else None))
+            while self.ready.value < self.workers:
+                time.sleep(0.01)
+        return self.pool
+
+    def close(self):
+        """Shut the worker processes down; the next search starts new ones."""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def new_game(self):
+        # The workers clear their tables when their next task has the new game id
+        self.game_id += 1
+        self.engine.new_game()
+
+    def stop(self):
+        """Make a running search return its best move so far; safe to call from another thread."""
+        self.stopped_search.value = self.search_id
+        self.engine.stop()
+
+    def prepare_search(self):
+        """Give the next search its id now, so that a stop() before it starts is kept; see Engine.prepare_search."""
+        self.search_id += 1
+        self.search_prepared = True
+
+    def search(self, board, time_limit=None, node_limit=None, max_depth=None, on_info=None, game_ply=None):
+        """Search the side to move's best move in board and return a SearchResult.
+
+        Takes the same limits as Engine.search. node_limit is shared evenly
+        between the workers, and on_info and game_ply are only used by the
+        single-process search.
+        """
+        time_limit = self.time_limit if time_limit is None else time_limit
+        node_limit = self.node_limit if node_limit is None else node_limit
+        max_depth = self.max_depth if max_depth is None else max_depth
+        if not self.search_prepared:
+            self.search_id += 1
+        self.search_prepared = False
+        # Stops of this search reach the single-process engine too
+        self.engine.prepare_search()
+        if self.stopped_search.value == self.search_id:
+            self.engine.stop()
+        if self.workers == 1:
+            return self.engine.search(board, time_limit, node_limit, max_depth, on_info, game_ply=game_ply)
+
+        color = 'w' if board.white_turn else 'b'
+        moves = self.engine.order_moves(board, board.get_all_valid_moves(color), 0)
+        if len(moves) <= 1:
+            return self.engine.search(board, time_limit, node_limit, max_depth, on_info, game_ply=game_ply)
+
+        shares = [moves[i::self.workers] for i in range(min(self.workers, len(moves)))]
+        if node_limit is not None:
+            node_limit = max(1, node_limit // len(shares))
+        packed = board.pack()
+        pool = self.start_pool()
+        # Starting the pool is not part of the search time
+        start = time.perf_counter()
+        pending = [pool.apply_async(search_root_moves,
+                                    (self.game_id, self.search_id, packed, share, time_limit, node_limit, max_depth))
+                   for share in shares]
+
+        reports = [task.get() for task in pending]
+
+        depth, move, score, pv = combine(reports)
+        nodes = sum(result.nodes for _, result in reports)
+        return SearchResult(move, score, depth, nodes, time.perf_counter() - start, list(pv))
+
+
+def run_bench(max_workers, depth, positions=BENCH_POSITIONS):
+    """Search every position to depth with 1..max_workers workers and report the speedup."""
+    runs = []
+    for workers in range(1, max_workers + 1):
+        engine = ParallelEngine(workers=workers, time_limit=None)
+        results = []
+        try:
+            # Start the workers once, before anything is timed
+            engine.start_pool()
+            for name, fen in positions:
+                # Each position starts from cold tables so the runs are comparable
+                engine.new_game()
+                result = engine.search(Board(fen), max_depth=depth)
+                results.append({
+                    'name': name,
+                    'move': result.move,
+                    'score': result.score,
+                    'depth': result.depth,
+                    'nodes': result.nodes,
+                    'seconds': round(result.seconds, 6),
+                })
+        finally:
+            engine.close()
+        seconds = sum(r['seconds'] for r in results)
+        nodes = sum(r['nodes'] for r in results)
+        runs.append({
+            'workers': workers,
+            'nodes': nodes,
+            'seconds': round(seconds, 6),
+            'nps': round(nodes / seconds) if seconds > 0 else 0,
+            'positions': results,
+        })
+
+    baseline = runs[0]['seconds']
+    for run in runs:
+        run['speedup'] = round(baseline / run['seconds'], 3) if run['seconds'] > 0 else 0.0
+        run['efficiency'] = round(run['speedup'] / run['workers'], 3)
+    return {
+        'depth': depth,
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'runs': runs,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Parallel root-splitting search and its speedup benchmark.')
+    parser.add_argument('--fen', default=START_FEN, help='position to search (default: start position)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--depth', type=int, default=4, help='search depth in plies')
+    parser.add_argument('--bench', action='store_true', help='measure the speedup from 1 to --workers workers')
+    parser.add_argument('--json', metavar='PATH', help='write the results to PATH as JSON')
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        report = run_bench(args.workers, args.depth)
+        for run in report['runs']:
+            print(f"{run['workers']:>3} workers  {run['nodes']:>10} nodes  {run['seconds']:8.3f}s  "
+                  f"{run['nps']:>8} nps  speedup {run['speedup']:.2f}  efficiency {run['efficiency']:.2f}")
+    else:
+        engine = ParallelEngine(workers=args.workers, time_limit=None)
+        try:
+            result = engine.search(Board(args.fen), max_depth=args.depth)
+        finally:
+            engine.close()
+        print(result)
+        report = {'fen': args.fen, 'workers': engine.workers, 'move': result.move, 'score': result.score,
+                  'depth': result.depth, 'nodes': result.nodes, 'seconds': round(result.seconds, 6)}
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""Headless perft and move-generation benchmark for the rules engine.
+
+Count the leaf nodes of the legal move tree of a position:
+
+    python perft.py --fen "<FEN>" --depth 4 --divide
+
+Run the benchmark suite of standard positions against their known counts
+and save the results as JSON to compare throughput between releases:
+
+    python perft.py --bench --depth 3 --json bench.json
+
+Both commands take --engine board (the Board class used by the game) or
+--engine bitboard (bitboard.Position).
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+from chess import Board, Pawn, ROWS, START_FEN, square_name
+from bitboard import Position, decode_move, PIECE_SYMBOLS
+from profiler import profile_to
+
+# (name, FEN, node counts for depth 1, 2, ...)
+BENCH_POSITIONS = [
+    ('start', START_FEN,
+     [20, 400, 8902, 197281, 4865609]),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     [48, 2039, 97862, 4085603]),
+    ('position3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     [14, 191, 2812, 43238, 674624]),
+    ('position4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     [6, 264, 9467, 422333]),
+    ('position5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     [44, 1486, 62379, 2103487]),
+    ('position6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     [46, 2079, 89890, 3894594]),
+    ('ep-pinned', '3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1',
+     [18, 92, 1670, 10138, 185429, 1134888]),
+    ('ep-discovered', '8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1',
+     [13, 102, 1266, 10276, 135655, 1015133]),
+    ('ep-gives-check', '8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1',
+     [15, 126, 1928, 13931, 206379, 1440467]),
+    ('castle-gives-check', '5k2/8/8/8/8/8/8/4K2R w K - 0 1',
+     [15, 66, 1198, 6399, 120330, 661072]),
+    ('castle-rights', 'r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1',
+     [26, 1141, 27826, 1274206]),
+    ('castle-prevented', 'r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1',
+     [44, 1494, 50509, 1720476]),
+    ('promote-out-of-check', '2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1',
+     [11, 133, 1442, 19174, 266199, 3821001]),
+    ('underpromote-check', '8/P1k5/K7/8/8/8/8/8 w - - 0 1',
+     [6, 27, 273, 1329, 18135, 92683]),
+    ('self-stalemate', 'K1k5/8/P7/8/8/8/8/8 w - - 0 1',
+     [2, 6, 13, 63, 382, 2217]),
+    ('stalemate-checkmate', '8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1',
+     [37, 183, 6559, 23527]),
+]
+
+
+def board_moves(board):
+    """Return the legal moves of the side to move as (piece, row, col, promotion).
+
+    Pawn moves to the last rank are listed once for each promotion piece.
+    """
+    moves = []
+    color = 'w' if board.white_turn else 'b'
+    for (r, c), (row, col) in board.get_all_valid_moves(color):
+        piece = board.board[r][c]
+        if isinstance(piece, Pawn) and (row == 0 or row == ROWS - 1):
+            for promotion in 'QRBN':
+                moves.append((piece, row, col, promotion))
+        else:
+            moves.append((piece, row, col, 'Q'))
+    return moves
+
+
+def board_perft(board, depth):
+    if depth == 0:
+        return 1
+    moves = board_moves(board)
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for piece, row, col, promotion in moves:
+        undo = board.make_move(piece, row, col, promotion)
+        nodes += board_perft(board, depth - 1)
+        board.unmake_move(undo)
+    return nodes
+
+
+def board_divide(board, depth):
+    """Return [(uci, nodes)] for every legal root move."""
+    results = []
+    for piece, row, col, promotion in board_moves(board):
+        uci = square_name(piece.row, piece.col) + square_name(row, col)
+        if isinstance(piece, Pawn) and (row == 0 or row == ROWS - 1):
+            uci += promotion.lower()
+        undo = board.make_move(piece, row, col, promotion)
+        results.append((uci, board_perft(board, depth - 1)))
+        board.unmake_move(undo)
+    return results
+
+
+def bitboard_divide(position, depth):
+    results = []
+    for move in position.legal_moves():
+        from_sq, to_sq, promotion = decode_move(move)
+        uci = square_name(*divmod(from_sq, 8)) + square_name(*divmod(to_sq, 8))
+        if promotion:
+            uci += PIECE_SYMBOLS[promotion].lower()
+        undo = position.make_move(move)
+        results.append((uci, position.perft(depth - 1)))
+        position.unmake_move(move, undo)
+    return results
+
+
+def run_perft(fen, depth, engine='board', divide=False):
+    """Run perft on a position and return a result dict with nodes, time and NPS."""
+    # Time move generation itself, not hits in a move cache warmed by earlier
+    # runs; the cache a GUI or UCI process enabled is put back afterwards
+    move_cache, Board.move_cache = Board.move_cache, None
+    try:
+        board = Board(fen)
+        start = time.perf_counter()
+        if engine == 'bitboard':
+            position = Position.from_board(board)
+            moves = bitboard_divide(position, depth) if divide else None
+            nodes = sum(n for _, n in moves) if divide else position.perft(depth)
+        else:
+            moves = board_divide(board, depth) if divide else None
+            nodes = sum(n for _, n in moves) if divide else board_perft(board, depth)
+        seconds = time.perf_counter() - start
+    finally:
+        Board.move_cache = move_cache
+
+    result = {
+        'engine': engine,
+        'fen': fen,
+        'depth': depth,
+        'nodes': nodes,
+        'seconds': round(seconds, 6),
+        'nps': round(nodes / seconds) if seconds > 0 else 0,
+    }
+    if divide:
+        result['divide'] = dict(sorted(moves))
+    return result
+
+
+def run_bench(depth, engine='board'):
+    """Run every benchmark position to min(depth, deepest known count)."""
+    results = []
+    for name, fen, counts in BENCH_POSITIONS:
+        result = run_perft(fen, min(depth, len(counts)), engine)
+        result['name'] = name
+        result['expected'] = counts[result['depth'] - 1]
+        result['ok'] = result['nodes'] == result['expected']
+        results.append(result)
+    nodes = sum(r['nodes'] for r in results)
+    seconds = sum(r['seconds'] for r in results)
+    return {
+        'engine': engine,
+        'depth': depth,
+        'python': platform.python_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'nodes': nodes,
+        'seconds': round(seconds, 6),
+        'nps': round(nodes / seconds) if seconds > 0 else 0,
+        'ok': all(r['ok'] for r in results),
+        'positions': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Perft node counts and move-generation benchmark.')
+    parser.add_argument('--fen', default=START_FEN, help='position to search (default: start position)')
+    parser.add_argument('--depth', type=int, default=3, help='search depth in plies')
+    parser.add_argument('--engine', choices=('board', 'bitboard'), default='board')
+    parser.add_argument('--divide', action='store_true', help='print the node count below every root move')
+    parser.add_argument('--bench', action='store_true', help='run the benchmark suite instead of one position')
+    parser.add_argument('--json', metavar='PATH', help='write the results to PATH as JSON')
+    parser.add_argument('--profile', metavar='PATH', help='write a profile of the run to PATH and PATH.pstats')
+    args = parser.parse_args(argv)
+    profile_to(args.profile)
+
+    if args.bench:
+        report = run_bench(args.depth, args.engine)
+        for r in report['positions']:
+            status = 'ok' if r['ok'] else f"FAIL (expected {r['expected']})"
+            print(f"{r['name']:<22} depth {r['depth']}  {r['nodes']:>10}  {r['seconds']:8.3f}s  {r['nps']:>8} nps  {status}")
+        print(f"total {report['nodes']} nodes in {report['seconds']:.3f}s, {report['nps']} nps")
+    else:
+        report = run_perft(args.fen, args.depth, args.engine, args.divide)
+        for uci, nodes in report.get('divide', {}).items():
+            print(f'{uci}: {nodes}')
+        print(f"nodes {report['nodes']}  time {report['seconds']:.3f}s  nps {report['nps']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0 if report.get('ok', True) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""Streaming PGN reader that replays games through Board, and a PGN writer.
+
+Games are read one at a time from any iterable of lines, or from a file
+through mmap, so archives of any size are processed in constant memory:
+
+    for game in read_games('archive.pgn'):
+        for ply, san, board in replay(game):
+            ...
+
+Validate an archive and measure throughput from the command line:
+
+    python pgn.py archive.pgn --limit 10000 --json pgn.json
+"""
+import argparse
+import json
+import mmap
+import re
+import sys
+import textwrap
+import time
+
+from chess import Board, START_FEN
+from notation import parse_san, push
+from profiler import profile_to
+
+HEADER_PATTERN = re.compile(r'^\[(\w+)\s+"(.*)"\]\s*$')
+# Comments, variations, NAGs and move numbers are skipped; the rest are moves and results
+TOKEN_PATTERN = re.compile(r'\{[^}]*\}?|;[^\n]*|\(|\)|\$\d+|\d+\.+|[^\s(){};]+')
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+
+class PgnGame:
+    """A game as read from PGN: its tag pairs, SAN moves and result."""
+
+    def __init__(self, headers, moves, result):
+        self.headers = headers
+        self.moves = moves
+        self.result = result
+
+    def __repr__(self):
+        return f"PgnGame({self.headers.get('White', '?')} - {self.headers.get('Black', '?')}, {len(self.moves)} moves, {self.result})"
+
+
+def parse_movetext(text):
+    """Return the SAN moves of the main line of movetext and the game result."""
+    moves = []
+    result = '*'
+    depth = 0
+    for token in TOKEN_PATTERN.findall(text):
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth = max(0, depth - 1)
+        elif depth or token[0] in '{;$' or token[0].isdigit() and token[-1] == '.':
+            continue
+        elif token in RESULTS:
+            result = token
+        else:
+            moves.append(token)
+    return moves, result
+
+
+def parse_games(lines):
+    """Yield a PgnGame for every game in an iterable of text lines.
+
+    Movetext lines are joined with newlines, so a ; comment ends with its line:
+
+    >>> game, = parse_games(['1. e4 e5 ; king pawn', '2. Nf3 Nc6 3. Bb5 a6 1-0'])
+    >>> game.moves, game.result
+    (['e4', 'e5', 'Nf3', 'Nc6', 'Bb5', 'a6'], '1-0')
+    """
+    headers = {}
+    movetext = []
+    for line in lines:
+        line = line.strip()
+        if line.startswith('['):
+            if movetext:
+                yield PgnGame(headers, *parse_movetext('\n'.join(movetext)))
+                headers, movetext = {}, []
+            match = HEADER_PATTERN.match(line)
+            if match:
+                headers[match.group(1)] = match.group(2)
+        elif line and not line.startswith('%'):
+            movetext.append(line)
+    if headers or movetext:
+        yield PgnGame(headers, *parse_movetext('\n'.join(movetext)))
+
+
+def mapped_lines(path, encoding='utf-8'):
+    """Yield the lines of a file through a read-only memory map."""
+    with open(path, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return  # empty file
+        with data:
+            for line in iter(data.readline, b''):
+                yield line.decode(encoding, errors='replace')
+
+
+def read_games(path):
+    """Yield a PgnGame for every game in the PGN file at path."""
+    return parse_games(mapped_lines(path))
+
+
+def format_game(headers, moves, result):
+    """Return a game as PGN text from its tag pairs, SAN moves and result.
+
+    The moves are played from the start position, or from the position of
+    the FEN tag when there is one.
+    """
+    fields = headers.get('FEN', START_FEN).split()
+    black_first = len(fields) > 1 and fields[1] == 'b'
+    number = int(fields[5]) if len(fields) > 5 and fields[5].isdigit() else 1
+    tokens = []
+    for index, san in enumerate(moves):
+        ply = index + black_first
+        if ply % 2 == 0:
+            tokens.append(f'{number + ply // 2}.')
+        elif index == 0:
+            tokens.append(f'{number}...')
+        tokens.append(san)
+    tokens.append(result)
+    tags = ''.join(f'[{name} "{value}"]\n' for name, value in headers.items())
+    return f"{tags}\n{textwrap.fill(' '.join(tokens), 79)}\n\n"
+
+
+def replay(game, board=None):
+    """Play a game through the rules engine and yield (ply, san, board) after every move.
+
+    The same Board is yielded each time, updated in place; copy what you need
+    (board.fen(), board.pack(), board.zobrist_key) before advancing. Raises
+    ValueError at the first illegal or unreadable move.
+    """
+    if board is None:
+        board = Board()
+    board.load_fen(game.headers.get('FEN', START_FEN))
+    for ply, san in enumerate(game.moves, 1):
+        push(board, parse_san(board, san))
+        yield ply, san, board
+
+
+def replay_file(path, limit=None):
+    """Replay the games of a PGN file, up to limit, and return statistics; bad games are counted and skipped."""
+    games = positions = errors = 0
+    board = Board()
+    start = time.perf_counter()
+    for game in read_games(path):
+        if limit is not None and games >= limit:
+            break
+        games += 1
+        try:
+            for _ in replay(game, board):
+                positions += 1
+        except ValueError:
+            errors += 1
+    seconds = time.perf_counter() - start
+    return {
+        'path': path,
+        'games': games,
+        'positions': positions,
+        'errors': errors,
+        'seconds': round(seconds, 6),
+        'games_per_second': round(games / seconds, 1) if seconds > 0 else 0.0,
+        'positions_per_second': round(positions / seconds) if seconds > 0 else 0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay PGN games through the rules engine.')
+    parser.add_argument('path', help='PGN file')
+    parser.add_argument('--limit', type=int, help='stop after this many games')
+    parser.add_argument('--json', metavar='PATH', help='write the statistics to PATH as JSON')
+    parser.add_argument('--profile', metavar='PATH', help='write a profile of the run to PATH and PATH.pstats')
+    args = parser.parse_args(argv)
+    profile_to(args.profile)
+
+    report = replay_file(args.path, args.limit)
+    print(f"{report['games']} games, {report['positions']} positions, {report['errors']} with errors "
+          f"in {report['seconds']:.3f}s ({report['games_per_second']} games/s, "
+          f"{report['positions_per_second']} positions/s)")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0 if report['errors'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
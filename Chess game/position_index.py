@@ -0,0 +1,298 @@
+"""On-disk index of the positions reached in PGN archives.
+
+An index is a directory. Every position of every game is stored as a
+17-byte record (Zobrist key, game id, ply, move played from it, game
+result) in segment files sorted by key. Adding games writes new segments,
+compact() merges them all into one, and queries binary-search each segment
+through a memory map, so the index is never loaded into memory. The tags of
+the games are kept in games.jsonl with a table of their offsets.
+
+    python position_index.py add archive.idx games.pgn
+    python position_index.py compact archive.idx
+    python position_index.py query archive.idx --fen "<FEN>" --games 10
+
+Positions are matched by Board.zobrist_key, so a 64-bit hash collision can
+in principle mix two positions.
+"""
+import argparse
+import heapq
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+from chess import Board, START_FEN
+from book import encode_move, decode_move
+from notation import move_to_san, parse_san, push
+from pgn import read_games
+
+RECORD = struct.Struct('>QIHHB')
+KEY = struct.Struct('>Q')
+OFFSET = struct.Struct('>Q')
+
+# Move code of the last position of a game, from which no move was played
+NO_MOVE = 0xFFFF
+
+RESULT_CODES = {'1-0': 0, '1/2-1/2': 1, '0-1': 2, '*': 3}
+
+# Records buffered in memory before they are written out as a segment
+SEGMENT_RECORDS = 500000
+
+
+class Segment:
+    """A memory-mapped file of records sorted by key."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if f.seek(0, 2) else b''
+        self.size = len(self.data) // RECORD.size
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def find(self, key):
+        """Yield the (key, game id, ply, move, result) records of key."""
+        low, high = 0, self.size
+        while low < high:
+            mid = (low + high) // 2
+            if KEY.unpack_from(self.data, mid * RECORD.size)[0] < key:
+                low = mid + 1
+            else:
+                high = mid
+        for index in range(low, self.size):
+            record = RECORD.unpack_from(self.data, index * RECORD.size)
+            if record[0] != key:
+                break
+            yield record
+
+    def __iter__(self):
+        for offset in range(0, self.size * RECORD.size, RECORD.size):
+            yield RECORD.unpack_from(self.data, offset)
+
+
+def write_segment(path, records):
+    """Write records, which must be sorted, to a new segment at path."""
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        chunk = []
+        for record in records:
+            chunk.append(RECORD.pack(*record))
+            if len(chunk) == 65536:
+                f.write(b''.join(chunk))
+                chunk = []
+        f.write(b''.join(chunk))
+    os.replace(temporary, path)
+
+
+class PositionIndex:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.segments = [Segment(os.path.join(path, name)) for name in sorted(os.listdir(path))
+                         if name.startswith('segment-') and name.endswith('.idx')]
+        self.games_path = os.path.join(path, 'games.jsonl')
+        self.offsets_path = os.path.join(path, 'games.offsets')
+        for name in (self.games_path, self.offsets_path):
+            open(name, 'ab').close()
+        self.offsets = None
+        self.games_file = None
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+        self.close_games()
+
+    def close_games(self):
+        if isinstance(self.offsets, mmap.mmap):
+            self.offsets.close()
+        if self.games_file is not None:
+            self.games_file.close()
+        self.offsets = self.games_file = None
+
+    @property
+    def game_count(self):
+        return os.path.getsize(self.offsets_path) // OFFSET.size
+
+    @property
+    def record_count(self):
+        return sum(segment.size for segment in self.segments)
+
+    def next_segment_path(self):
+        numbers = [int(os.path.basename(segment.path)[8:-4]) for segment in self.segments]
+        return os.path.join(self.path, f'segment-{max(numbers, default=0) + 1:06d}.idx')
+
+    def flush(self, records):
+        if records:
+            records.sort()
+            path = self.next_segment_path()
+            write_segment(path, records)
+            self.segments.append(Segment(path))
+            records.clear()
+
+    def add_pgn(self, pgn_path, limit=None):
+        """Index the games of a PGN file, up to limit, and return (games, positions, errors).
+
+        Games with an illegal move are indexed up to the position before it.
+        """
+        self.close_games()
+        game_id = self.game_count
+        games = positions = errors = 0
+        records = []
+        board = Board()
+        with open(self.games_path, 'ab') as games_file, open(self.offsets_path, 'ab') as offsets_file:
+            for game in read_games(pgn_path):
+                if limit is not None and games >= limit:
+                    break
+                result = RESULT_CODES.get(game.result, RESULT_CODES['*'])
+                ply = 0
+                try:
+                    board.load_fen(game.headers.get('FEN', START_FEN))
+                    for san in game.moves:
+                        move = parse_san(board, san)
+                        records.append((board.zobrist_key, game_id, ply, encode_move(board, move), result))
+                        push(board, move)
+                        ply += 1
+                except ValueError:
+                    errors += 1
+                records.append((board.zobrist_key, game_id, ply, NO_MOVE, result))
+                positions += ply + 1
+
+                offsets_file.write(OFFSET.pack(games_file.tell()))
+                entry = {'id': game_id, 'source': pgn_path, 'plies': ply, 'result': game.result,
+                         'headers': game.headers}
+                games_file.write(json.dumps(entry).encode() + b'\n')
+                game_id += 1
+                games += 1
+                if len(records) >= SEGMENT_RECORDS:
+                    self.flush(records)
+        self.flush(records)
+        return games, positions, errors
+
+    def compact(self):
+        """Merge all segments into one and return its record count."""
+        if len(self.segments) <= 1:
+            return self.record_count
+        path = self.next_segment_path()
+        write_segment(path, heapq.merge(*self.segments))
+        for segment in self.segments:
+            segment.close()
+            os.remove(segment.path)
+        self.segments = [Segment(path)]
+        return self.record_count
+
+    def lookup(self, key):
+        """Return the (key, game id, ply, move, result) records of a position key by game id and ply."""
+        return sorted(record for segment in self.segments for record in segment.find(key))
+
+    def game(self, game_id):
+        """Return the stored entry of a game: id, source, plies, result and headers."""
+        if self.offsets is None:
+            with open(self.offsets_path, 'rb') as f:
+                self.offsets = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if f.seek(0, 2) else b''
+            self.games_file = open(self.games_path, 'rb')
+        if not 0 <= game_id < len(self.offsets) // OFFSET.size:
+            raise ValueError(f'No game {game_id} in the index')
+        self.games_file.seek(OFFSET.unpack_from(self.offsets, game_id * OFFSET.size)[0])
+        return json.loads(self.games_file.readline())
+
+    def games(self, board, limit=10):
+        """Return the entries of up to limit games that reached board's position, with the ply they did."""
+        found = {}
+        for _, game_id, ply, _, _ in self.lookup(board.zobrist_key):
+            if game_id not in found:
+                found[game_id] = ply
+                if len(found) == limit:
+                    break
+        return [dict(self.game(game_id), ply=ply) for game_id, ply in found.items()]
+
+    def move_stats(self, board):
+        """Return statistics of the moves played from board's position, most played first.
+
+        Each is a dict with the move in SAN, the number of games, the
+        percentages of white wins, draws and black wins among games with a
+        known result, and the score of the side to move in percent.
+        """
+        stats = {}
+        for _, _, _, code, result in self.lookup(board.zobrist_key):
+            if code == NO_MOVE:
+                continue
+            counts = stats.setdefault(code, [0, 0, 0, 0])
+            counts[result] += 1
+        moves = []
+        for code, (white, draws, black, unknown) in stats.items():
+            decided = white + draws + black
+            score = (white if board.white_turn else black) + draws / 2
+            moves.append({
+                'move': move_to_san(board, decode_move(board, code)),
+                'games': decided + unknown,
+                'white': round(100 * white / decided, 1) if decided else None,
+                'draws': round(100 * draws / decided, 1) if decided else None,
+                'black': round(100 * black / decided, 1) if decided else None,
+                'score': round(100 * score / decided, 1) if decided else None,
+            })
+        moves.sort(key=lambda move: -move['games'])
+        return moves
+
+    def query(self, fen, limit=10):
+        """Return the move statistics and up to limit games of a FEN position, with the query time."""
+        start = time.perf_counter()
+        board = Board(fen)
+        report = {'fen': fen, 'moves': self.move_stats(board), 'games': self.games(board, limit)}
+        report['milliseconds'] = round((time.perf_counter() - start) * 1000, 3)
+        return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build and query an index of the positions in PGN archives.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help='index the games of PGN files')
+    add.add_argument('index', help='index directory')
+    add.add_argument('pgn', nargs='+', help='PGN files')
+    add.add_argument('--limit', type=int, help='games to index from each file')
+    add.add_argument('--compact', action='store_true', help='merge the segments afterwards')
+    compact = commands.add_parser('compact', help='merge the segments of an index into one')
+    compact.add_argument('index', help='index directory')
+    query = commands.add_parser('query', help='show the moves and games of a position')
+    query.add_argument('index', help='index directory')
+    query.add_argument('--fen', default=START_FEN, help='position (default: start position)')
+    query.add_argument('--games', type=int, default=10, help='games to list')
+    query.add_argument('--json', action='store_true', help='print the result as JSON')
+    args = parser.parse_args(argv)
+
+    index = PositionIndex(args.index)
+    try:
+        if args.command == 'add':
+            for path in args.pgn:
+                start = time.perf_counter()
+                games, positions, errors = index.add_pgn(path, args.limit)
+                print(f'{path}: {games} games, {positions} positions, {errors} with errors '
+                      f'in {time.perf_counter() - start:.3f}s')
+        if args.command == 'compact' or args.command == 'add' and args.compact:
+            count = index.compact()
+            print(f'{count} records in {len(index.segments)} segment')
+        if args.command == 'query':
+            report = index.query(args.fen, args.games)
+            if args.json:
+                print(json.dumps(report, indent=2))
+                return 0
+            for move in report['moves']:
+                percentages = (f"+{move['white']}% ={move['draws']}% -{move['black']}%  score {move['score']}%"
+                               if move['score'] is not None else 'no results')
+                print(f"{move['move']:<8} {move['games']:>8} games  {percentages}")
+            for game in report['games']:
+                headers = game['headers']
+                print(f"#{game['id']} ply {game['ply']}: {headers.get('White', '?')} - {headers.get('Black', '?')} "
+                      f"{game['result']} ({headers.get('Event', '?')}, {headers.get('Date', '?')})")
+            print(f"{report['milliseconds']} ms")
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""Opt-in instrumentation of the rules engine, search and drawing.
+
+Nothing is instrumented until Profiler.enable() is called. It then replaces
+the target functions with timing wrappers, and disable() puts the originals
+back, so the code runs exactly as before when profiling is off.
+
+Every wrapped function records its call count, cumulative (inclusive) time
+and slowest call. On top of that the profiler reports search nodes and
+NPS, the hit rates of the move cache and transposition tables, and frame
+render times from Game.draw. Reports are written as JSON, or as a pstats
+file readable with `python -m pstats`; pstats times are inclusive, so
+tottime equals cumtime there.
+
+The game and the headless tools (perft.py, pgn.py, uci.py) take
+--profile PATH, which writes PATH and PATH.pstats on exit:
+
+    python perft.py --depth 4 --profile perft.json
+    python -m pstats perft.json.pstats
+"""
+import atexit
+import functools
+import json
+import marshal
+import time
+
+import engine
+import evaluation
+from engine import Engine, SearchResult
+
+BOARD_METHODS = ('get_valid_moves', 'get_legal_moves', 'is_square_under_attack', 'update_game_state',
+                 'make_move', 'unmake_move', 'move', 'draw')
+
+
+def default_targets(board_class=None, game_class=None):
+    """Return the (owner, attribute) pairs instrumented by default.
+
+    Pass the classes of the running module when chess.py is run as a script,
+    since its Board is then __main__.Board rather than chess.Board.
+    """
+    if board_class is None:
+        from chess import Board as board_class
+    targets = [(board_class, name) for name in BOARD_METHODS]
+    if game_class is not None:
+        targets.append((game_class, 'draw'))
+    targets += [(Engine, 'search'), (engine, 'evaluate')]
+    return targets
+
+
+class Profiler:
+    def __init__(self, targets=None):
+        self.targets = default_targets() if targets is None else targets
+        self.stats = {}
+        self.functions = {}
+        self.originals = []
+        self.nodes = 0
+        self.search_seconds = 0.0
+        self.tables = {}
+        self.caches = {}
+        self.started = None
+        self.seconds = 0.0
+
+    def enable(self):
+        if self.originals:
+            return
+        for owner, name in self.targets:
+            original = getattr(owner, name)
+            label = f'{owner.__name__}.{name}'
+            self.originals.append((owner, name, original))
+            setattr(owner, name, self.wrap(label, original))
+            cache = getattr(owner, 'move_cache', None)
+            if cache is not None:
+                self.caches[f'{owner.__name__}.move_cache'] = cache
+        self.started = time.perf_counter()
+
+    def disable(self):
+        for owner, name, original in reversed(self.originals):
+            setattr(owner, name, original)
+        self.originals = []
+        if self.started is not None:
+            self.seconds += time.perf_counter() - self.started
+            self.started = None
+
+    def wrap(self, label, function):
+        stats = self.stats.setdefault(label, [0, 0.0, 0.0])
+        self.functions[label] = function
+        clock = time.perf_counter
+        profiler = self
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                result = function(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                stats[0] += 1
+                stats[1] += elapsed
+                if elapsed > stats[2]:
+                    stats[2] = elapsed
+            if isinstance(result, SearchResult):
+                profiler.record_search(args[0], result)
+            return result
+
+        return wrapper
+
+    def record_search(self, searcher, result):
+        self.nodes += result.nodes
+        self.search_seconds += result.seconds
+        self.tables[f'tt {id(searcher.tt):x}'] = searcher.tt
+
+    def report(self):
+        """Return everything recorded so far as a JSON-serializable dict."""
+        seconds = self.seconds + (time.perf_counter() - self.started if self.started is not None else 0.0)
+        functions = {
+            label: {
+                'calls': calls,
+                'seconds': round(total, 6),
+                'mean_us': round(total / calls * 1e6, 2) if calls else 0.0,
+                'max_ms': round(slowest * 1000, 3),
+            }
+            for label, (calls, total, slowest) in sorted(self.stats.items(), key=lambda item: -item[1][1])
+        }
+        tables = {**self.caches, 'evaluation.pawn_cache': evaluation.pawn_cache, **self.tables}
+        caches = {name: table.stats() for name, table in tables.items()}
+        report = {
+            'seconds': round(seconds, 6),
+            'functions': functions,
+            'search': {
+                'nodes': self.nodes,
+                'seconds': round(self.search_seconds, 6),
+                'nps': round(self.nodes / self.search_seconds) if self.search_seconds > 0 else 0,
+            },
+            'caches': caches,
+        }
+        frames = functions.get('Game.draw')
+        if frames:
+            report['frames'] = {'count': frames['calls'], 'mean_ms': round(frames['mean_us'] / 1000, 3),
+                                'max_ms': frames['max_ms']}
+        return report
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def dump_stats(self, path):
+        """Write the function statistics in the marshal format read by pstats.Stats."""
+        stats = {}
+        for label, (calls, total, _) in self.stats.items():
+            code = getattr(self.functions[label], '__code__', None)
+            key = (code.co_filename, code.co_firstlineno, code.co_name) if code else ('~', 0, label)
+            stats[key] = (calls, calls, total, total, {})
+        with open(path, 'wb') as f:
+            marshal.dump(stats, f)
+
+    def save(self, path):
+        """Write the JSON report to path and the pstats dump to path + '.pstats'."""
+        self.write_json(path)
+        self.dump_stats(path + '.pstats')
+
+
+def profile_to(path, targets=None):
+    """Enable a Profiler that saves its report to path at exit; return it, or None when path is None."""
+    if path is None:
+        return None
+    profiler = Profiler(targets)
+    profiler.enable()
+    atexit.register(profiler.save, path)
+    return profiler
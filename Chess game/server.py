@@ -0,0 +1,418 @@
+"""Asyncio game server: many concurrent games against the engine over TCP.
+
+Every connection is one session owning a Board. The client sends one
+command per line and gets exactly one reply line per command:
+
+    new [white|black]   start a game; reply ok <engine move or ->
+    move <uci>          play a move; reply ok <engine reply or -> [<result> <reason>]
+    moves               reply ok <legal moves in UCI>
+    fen                 reply ok <FEN>
+    undo                take back the last move pair; reply ok
+    stats               reply ok <server metrics as JSON>
+    quit                reply ok and close
+
+Errors are answered with error <message>. Moves are validated by the rules
+engine. Engine replies are searched on a bounded process pool; when all of
+its slots are busy further requests wait, and since a session reads its
+next command only after answering the last one, clients are slowed down
+instead of queueing unbounded work. Connections beyond --max-sessions are
+refused and sessions idle for --idle-timeout seconds are closed.
+
+Serve, then load-test with the bundled synthetic client:
+
+    python server.py serve --port 8765 --workers 4 --nodes 2000
+    python server.py load --port 8765 --clients 500 --games 2 --plies 40
+
+Both report latency percentiles and games per second. Thousands of clients
+need a matching open-files limit (ulimit -n) on both ends.
+"""
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from chess import Board, Pawn, ROWS
+from engine import Engine
+from notation import legal_moves, move_to_uci, parse_uci, push
+
+DEFAULT_PORT = 8765
+
+# Latencies kept per kind of request for the percentiles
+LATENCY_WINDOW = 10000
+
+# Longest accepted command line, in bytes
+MAX_LINE = 4096
+
+# Workers are spawned rather than forked, as in parallel.py
+CONTEXT = multiprocessing.get_context('spawn')
+
+# The Engine of the current worker process, created by init_worker
+worker_engine = None
+
+
+def init_worker(node_limit, max_depth, hash_mb):
+    global worker_engine
+    worker_engine = Engine(time_limit=None, node_limit=node_limit, max_depth=max_depth, hash_mb=hash_mb)
+
+
+def engine_reply(packed):
+    """Search a packed position and return the engine's move as a UCI string; runs in a worker."""
+    board = Board.from_packed(packed)
+    result = worker_engine.search(board)
+    if result.move is None:
+        return None
+    (r, c), (row, col) = result.move
+    promotion = 'Q' if isinstance(board.board[r][c], Pawn) and row in (0, ROWS - 1) else None
+    return move_to_uci(((r, c), (row, col), promotion))
+
+
+def percentile(values, fraction):
+    """Return the nearest-rank percentile of a sorted list, or 0.0 if it is empty."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def latency_summary(latencies):
+    """Return the count and p50/p90/p99/max in milliseconds of a list of seconds."""
+    values = sorted(latencies)
+    summary = {'count': len(values)}
+    for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+        summary[name + '_ms'] = round(percentile(values, fraction) * 1000, 3)
+    summary['max_ms'] = round(values[-1] * 1000, 3) if values else 0.0
+    return summary
+
+
+def game_result(board):
+    """Return (result, reason) if the game on board is over, else None."""
+    if board.checkmate:
+        return ('0-1' if board.white_turn else '1-0'), 'checkmate'
+    if board.stalemate:
+        return '1/2-1/2', 'stalemate'
+    if board.draw_reason is not None:
+        return '1/2-1/2', board.draw_reason.replace(' ', '-')
+    return None
+
+
+class Metrics:
+    """Counters and request latencies of a server."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.latencies = collections.defaultdict(lambda: collections.deque(maxlen=LATENCY_WINDOW))
+        self.counts = collections.Counter()
+
+    def record(self, kind, seconds):
+        self.latencies[kind].append(seconds)
+        self.counts['requests'] += 1
+
+    def snapshot(self, sessions=0, pending=0):
+        seconds = time.perf_counter() - self.started
+        return {
+            'seconds': round(seconds, 3),
+            'sessions': sessions,
+            'pending_engine_moves': pending,
+            **self.counts,
+            'games_per_second': round(self.counts['games_finished'] / seconds, 3) if seconds > 0 else 0.0,
+            'moves_per_second': round(self.counts['moves'] / seconds, 3) if seconds > 0 else 0.0,
+            'latency': {kind: latency_summary(values) for kind, values in sorted(self.latencies.items())},
+        }
+
+
+class Session:
+    """The game of one connection."""
+
+    def __init__(self, session_id, writer):
+        self.id = session_id
+        self.writer = writer
+        self.board = None
+        self.human = 'w'
+        self.last_active = time.monotonic()
+        self.busy = False
+
+
+class GameServer:
+    def __init__(self, workers=None, max_sessions=10000, max_pending=None, idle_timeout=300.0,
+                 node_limit=2000, max_depth=64, hash_mb=16):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_sessions = max_sessions
+        # Engine searches submitted to the pool at once; more requests wait for a slot
+        self.max_pending = max_pending or 2 * self.workers
+        self.idle_timeout = idle_timeout
+        self.engine_settings = (node_limit, max_depth, hash_mb)
+        self.pool = None
+        self.engine_slots = None
+        self.pending = 0
+        self.sessions = {}
+        self.session_ids = itertools.count(1)
+        self.metrics = Metrics()
+        self.server = None
+        self.evictor = None
+
+    async def start(self, host='127.0.0.1', port=DEFAULT_PORT):
+        self.pool = concurrent.futures.ProcessPoolExecutor(
+            self.workers, mp_context=CONTEXT, initializer=init_worker, initargs=self.engine_settings)
+        self.engine_slots = asyncio.Semaphore(self.max_pending)
+        self.server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_LINE,
+                                                 backlog=1024)
+        self.evictor = asyncio.create_task(self.evict_idle())
+        return self.server
+
+    async def close(self):
+        if self.evictor is not None:
+            self.evictor.cancel()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for session in list(self.sessions.values()):
+            session.writer.close()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    def stats(self):
+        return self.metrics.snapshot(len(self.sessions), self.pending)
+
+    async def handle_connection(self, reader, writer):
+        if len(self.sessions) >= self.max_sessions:
+            self.metrics.counts['sessions_refused'] += 1
+            writer.write(b'error server full\n')
+            writer.close()
+            return
+        session = Session(next(self.session_ids), writer)
+        self.sessions[session.id] = session
+        self.metrics.counts['sessions_opened'] += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):
+                    break  # line too long or connection reset
+                if not line:
+                    break
+                session.last_active = time.monotonic()
+                session.busy = True
+                start = time.perf_counter()
+                tokens = line.decode('utf-8', 'replace').split()
+                command = tokens[0] if tokens else ''
+                try:
+                    reply = await self.handle_command(session, command, tokens[1:])
+                except ValueError as error:
+                    reply = f'error {error}'
+                writer.write(reply.encode() + b'\n')
+                # Stop reading this client until its replies are sent
+                await writer.drain()
+                session.busy = False
+                session.last_active = time.monotonic()
+                if command in ('new', 'move'):
+                    self.metrics.record(command, time.perf_counter() - start)
+                if command == 'quit':
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            del self.sessions[session.id]
+            writer.close()
+
+    async def handle_command(self, session, command, args):
+        if command == 'new':
+            side = args[0] if args else 'white'
+            if side not in ('white', 'black'):
+                raise ValueError(f'unknown side {side!r}')
+            session.board = Board()
+            session.human = side[0]
+            self.metrics.counts['games_started'] += 1
+            if session.human == 'w':
+                return 'ok -'
+            reply = await self.play_engine_move(session.board)
+            return f'ok {reply}'
+        if command == 'quit':
+            return 'ok'
+        if command == 'stats':
+            return 'ok ' + json.dumps(self.stats())
+        board = session.board
+        if board is None:
+            raise ValueError('no game, send new first')
+        if command == 'moves':
+            return ' '.join(['ok'] + [move_to_uci(move) for move in legal_moves(board)])
+        if command == 'fen':
+            return f'ok {board.fen()}'
+        if command == 'undo':
+            # Take back the engine's reply too, unless the game ended on the player's move
+            plies = 2 if board.white_turn == (session.human == 'w') else 1
+            if len(board.history) < plies:
+                raise ValueError('nothing to undo')
+            for _ in range(plies):
+                board.undo_move()
+            return 'ok'
+        if command == 'move':
+            if not args:
+                raise ValueError('move needs a UCI move')
+            if board.game_over:
+                raise ValueError('game over')
+            if board.white_turn != (session.human == 'w'):
+                raise ValueError('not your turn')
+            push(board, parse_uci(board, args[0]))
+            self.metrics.counts['moves'] += 1
+            reply = '-'
+            if not board.game_over:
+                reply = await self.play_engine_move(board)
+            result = game_result(board)
+            if result is None:
+                return f'ok {reply}'
+            self.metrics.counts['games_finished'] += 1
+            return f'ok {reply} {result[0]} {result[1]}'
+        raise ValueError(f'unknown command {command!r}')
+
+    async def play_engine_move(self, board):
+        """Search the engine's move on the pool, play it on board and return it in UCI."""
+        start = time.perf_counter()
+        async with self.engine_slots:
+            self.pending += 1
+            try:
+                loop = asyncio.get_running_loop()
+                uci = await loop.run_in_executor(self.pool, engine_reply, board.pack())
+            finally:
+                self.pending -= 1
+        self.metrics.record('engine', time.perf_counter() - start)
+        if uci is None:
+            return '-'
+        push(board, parse_uci(board, uci))
+        self.metrics.counts['moves'] += 1
+        return uci
+
+    async def evict_idle(self):
+        """Close sessions that sent nothing for idle_timeout seconds."""
+        interval = max(1.0, self.idle_timeout / 4)
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for session in list(self.sessions.values()):
+                if not session.busy and now - session.last_active > self.idle_timeout:
+                    self.metrics.counts['sessions_evicted'] += 1
+                    session.writer.close()
+
+
+async def serve(args):
+    server = GameServer(args.workers, args.max_sessions, args.max_pending, args.idle_timeout,
+                        args.nodes, args.depth, args.hash)
+    await server.start(args.host, args.port)
+    print(f'serving on {args.host}:{args.port} with {server.workers} engine workers', flush=True)
+    try:
+        while True:
+            await asyncio.sleep(args.stats_interval or 3600)
+            if args.stats_interval:
+                print(json.dumps(server.stats()), flush=True)
+    finally:
+        print(json.dumps(server.stats()), flush=True)
+        await server.close()
+
+
+async def play_client(host, port, games, plies, rng, report):
+    """Play games random moves against the server, recording round trips into report."""
+    try:
+        reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE)
+    except OSError:
+        report['connect_errors'] += 1
+        return
+
+    async def request(line):
+        start = time.perf_counter()
+        writer.write(line.encode() + b'\n')
+        await writer.drain()
+        reply = (await reader.readline()).decode()
+        if not reply:
+            raise ConnectionError('server closed the connection')
+        report['latencies'].append(time.perf_counter() - start)
+        if reply.startswith('error'):
+            report['errors'] += 1
+        return reply.split()
+
+    try:
+        for _ in range(games):
+            await request('new white')
+            for _ in range(plies):
+                moves = (await request('moves'))[1:]
+                if not moves:
+                    break
+                reply = await request('move ' + rng.choice(moves))
+                if reply[0] != 'ok' or len(reply) > 2:
+                    break
+            report['games'] += 1
+        await request('quit')
+    except (ConnectionError, OSError):
+        report['disconnects'] += 1
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, clients=100, games=1, plies=40, seed=0):
+    """Run a synthetic load of clients playing random moves and return its statistics."""
+    report = {'latencies': [], 'games': 0, 'errors': 0, 'disconnects': 0, 'connect_errors': 0}
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    await asyncio.gather(*(play_client(host, port, games, plies, random.Random(rng.random()), report)
+                           for _ in range(clients)))
+    seconds = time.perf_counter() - start
+    latencies = report.pop('latencies')
+    return {
+        'clients': clients,
+        **report,
+        'seconds': round(seconds, 3),
+        'games_per_second': round(report['games'] / seconds, 3) if seconds > 0 else 0.0,
+        'requests_per_second': round(len(latencies) / seconds, 1) if seconds > 0 else 0.0,
+        'latency': latency_summary(latencies),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve games against the engine, or load-test a server.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve', help='run the game server')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument('--workers', type=int, default=os.cpu_count(), help='engine worker processes')
+    serve_parser.add_argument('--max-sessions', type=int, default=10000, help='refuse connections beyond this')
+    serve_parser.add_argument('--max-pending', type=int, help='engine searches in flight (default: 2 per worker)')
+    serve_parser.add_argument('--idle-timeout', type=float, default=300.0, help='close sessions idle this long')
+    serve_parser.add_argument('--nodes', type=int, default=2000, help='engine node limit per move')
+    serve_parser.add_argument('--depth', type=int, default=64, help='engine depth limit per move')
+    serve_parser.add_argument('--hash', type=int, default=16, help='transposition table MB per worker')
+    serve_parser.add_argument('--stats-interval', type=float, default=0, help='print metrics every N seconds')
+    load_parser = commands.add_parser('load', help='run synthetic clients against a server')
+    load_parser.add_argument('--host', default='127.0.0.1')
+    load_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    load_parser.add_argument('--clients', type=int, default=100, help='concurrent connections')
+    load_parser.add_argument('--games', type=int, default=1, help='games per client')
+    load_parser.add_argument('--plies', type=int, default=40, help='moves per game before starting the next')
+    load_parser.add_argument('--seed', type=int, default=0)
+    load_parser.add_argument('--json', metavar='PATH', help='write the statistics to PATH as JSON')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(serve(args))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    report = asyncio.run(run_load(args.host, args.port, args.clients, args.games, args.plies, args.seed))
+    latency = report['latency']
+    print(f"{report['games']} games by {report['clients']} clients in {report['seconds']:.3f}s "
+          f"({report['games_per_second']} games/s, {report['requests_per_second']} requests/s)  "
+          f"latency p50 {latency['p50_ms']}ms p90 {latency['p90_ms']}ms p99 {latency['p99_ms']}ms  "
+          f"{report['errors']} errors, {report['disconnects'] + report['connect_errors']} dropped")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0 if report['disconnects'] + report['connect_errors'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
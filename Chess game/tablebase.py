@@ -0,0 +1,758 @@
+"""Endgame tablebases for positions with 3 and 4 pieces, built by retrograde analysis.
+
+A table holds one byte per placement of its pieces and side to move:
+0 for a draw, k (1-127) when the side to move mates in k plies, 128 + k
+when it is mated in k plies (128 is checkmate), and 255 for positions that
+cannot occur. Tables are files named after their material, white first
+(KQvK.tb, KRvKP.tb); a position with the colors the other way round is
+probed with the board flipped. Files are memory-mapped, so probing one is
+a dictionary lookup, a sort of at most four pieces and one byte read.
+
+The search and Game.ai_turn consult the tables when few enough pieces are
+left. Generate them (tables of one size are built in parallel, one per
+worker process; 4-piece tables take a long time in pure Python):
+
+    python tablebase.py generate tables --pieces 3 --workers 4
+    python tablebase.py probe tables --fen "8/8/8/4k3/8/8/8/4K2Q w - - 0 1"
+    python tablebase.py verify tables --positions 1000
+
+verify replays random table positions through Board and checks every value
+against the values of its successors.
+
+Generation indexes positions by square per piece and side to move, and
+moves pieces with its own compact tables; captures and promotions lead into
+smaller tables, which must be generated first. Castling and en passant
+rights are not part of the tables: positions with castling rights are not
+probed, and a position with an en passant capture is scored from its
+successors, both when probing and during generation, where a double push
+that allows the capture leads to an extra entry with the capture's moves.
+"""
+import argparse
+import array
+import itertools
+import mmap
+import multiprocessing
+import os
+import random
+import struct
+import sys
+import time
+
+from engine import MATE
+
+ORDER = 'KQRBNP'
+SQUARES = 64
+DRAW = 0
+LOSS = 128
+ILLEGAL = 255
+MAX_DISTANCE = 126
+MAX_PIECES = 4
+PROMOTIONS = 'QRBN'
+# Order of the pieces in a table: white's by ORDER, then black's
+RANKS = {color: {symbol: offset + index for index, symbol in enumerate(ORDER)}
+         for color, offset in (('w', 0), ('b', 6))}
+
+HEADER = struct.Struct('>4sBB16s')
+MAGIC = b'CGTB'
+VERSION = 1
+EXTENSION = '.tb'
+
+
+def on_board(row, col):
+    return 0 <= row < 8 and 0 <= col < 8
+
+
+def step_targets(steps):
+    return [frozenset(r * 8 + c for dr, dc in steps for r, c in [(square // 8 + dr, square % 8 + dc)]
+                      if on_board(r, c)) for square in range(SQUARES)]
+
+
+KING_STEPS = [(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc]
+KNIGHT_STEPS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]
+ORTHOGONAL = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+DIAGONAL = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+SLIDER_DIRECTIONS = {'R': ORTHOGONAL, 'B': DIAGONAL, 'Q': ORTHOGONAL + DIAGONAL}
+
+KING_TARGETS = step_targets(KING_STEPS)
+KNIGHT_TARGETS = step_targets(KNIGHT_STEPS)
+# White pawns move towards row 0, black pawns towards row 7
+PAWN_FORWARD = {'w': -1, 'b': 1}
+PAWN_ATTACKS = {color: step_targets([(forward, -1), (forward, 1)]) for color, forward in PAWN_FORWARD.items()}
+
+
+def ray(square, direction):
+    row, col = divmod(square, 8)
+    squares = []
+    row, col = row + direction[0], col + direction[1]
+    while on_board(row, col):
+        squares.append(row * 8 + col)
+        row, col = row + direction[0], col + direction[1]
+    return squares
+
+
+# RAYS[symbol][square] lists the rays of a slider; BETWEEN[symbol][square] maps
+# every square a slider could reach on an empty board to the squares in between
+RAYS = {symbol: [[ray(square, direction) for direction in directions] for square in range(SQUARES)]
+        for symbol, directions in SLIDER_DIRECTIONS.items()}
+BETWEEN = {symbol: [{target: tuple(line[:index]) for line in lines for index, target in enumerate(line)}
+                    for lines in rays]
+           for symbol, rays in RAYS.items()}
+
+
+def attacks(color, symbol, square, target, occupied):
+    """True if a piece on square attacks target, given the set of occupied squares."""
+    if symbol == 'K':
+        return target in KING_TARGETS[square]
+    if symbol == 'N':
+        return target in KNIGHT_TARGETS[square]
+    if symbol == 'P':
+        return target in PAWN_ATTACKS[color][square]
+    between = BETWEEN[symbol][square].get(target)
+    return between is not None and not any(s in occupied for s in between)
+
+
+def attacked(target, by_color, pieces, occupied):
+    for color, symbol, square in pieces:
+        if color == by_color and attacks(color, symbol, square, target, occupied):
+            return True
+    return False
+
+
+def piece_moves(color, symbol, square, occupied):
+    """Yield the target squares of a piece that are empty or occupied (captures are checked by the caller)."""
+    if symbol == 'K':
+        yield from KING_TARGETS[square]
+    elif symbol == 'N':
+        yield from KNIGHT_TARGETS[square]
+    else:
+        for line in RAYS[symbol][square]:
+            for target in line:
+                yield target
+                if target in occupied:
+                    break
+
+
+def pawn_pushes(color, square, occupied):
+    forward = PAWN_FORWARD[color] * 8
+    one = square + forward
+    if one in occupied:
+        return
+    yield one
+    start_row = 6 if color == 'w' else 1
+    if square // 8 == start_row and one + forward not in occupied:
+        yield one + forward
+
+
+def signature(white, black):
+    return f'{white}v{black}'
+
+
+def sort_material(symbols):
+    return ''.join(sorted(symbols, key=ORDER.index))
+
+
+def material_key(symbols):
+    """Order used to pick which side of a material pair is stored as white."""
+    return len(symbols), [-ORDER.index(symbol) for symbol in symbols]
+
+
+def canonical(white, black):
+    """Return the (white, black) orientation a material pair is stored in, and whether it is flipped."""
+    return ((white, black), False) if material_key(white) >= material_key(black) else ((black, white), True)
+
+
+def table_kinds(white, black):
+    return [('w', symbol) for symbol in white] + [('b', symbol) for symbol in black]
+
+
+class Table:
+    """A memory-mapped table file."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, pieces, name = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} tablebase file')
+        self.name = name.rstrip(b'\0').decode()
+        self.pieces = pieces
+        self.weights = [SQUARES ** (pieces - 1 - index) for index in range(pieces)]
+        self.black_offset = SQUARES ** pieces
+        if len(self.data) != HEADER.size + 2 * self.black_offset:
+            raise ValueError(f'{path} is truncated')
+
+    def close(self):
+        self.data.close()
+
+    def value(self, squares, white_to_move):
+        index = HEADER.size if white_to_move else HEADER.size + self.black_offset
+        for square, weight in zip(squares, self.weights):
+            index += square * weight
+        return self.data[index]
+
+
+def open_tablebase(directory):
+    """Return the Tablebase of directory; raise OSError if it is missing or holds no tables."""
+    if not any(name.endswith(EXTENSION) for name in os.listdir(directory)):
+        raise FileNotFoundError(f'No tablebase files in {directory!r}')
+    return Tablebase(directory)
+
+
+class Tablebase:
+    """The tables in a directory, opened as they are first probed."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}
+        # Sorted piece ranks of a material -> (table, flipped)
+        self.materials = {}
+        self.max_pieces = 2
+        for name in os.listdir(directory) if os.path.isdir(directory) else []:
+            if name.endswith(EXTENSION):
+                pieces = len(name) - len(EXTENSION) - 1
+                self.max_pieces = max(self.max_pieces, pieces)
+        self.hits = 0
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table.close()
+        self.tables = {}
+        self.materials = {}
+
+    def table(self, name):
+        if name not in self.tables:
+            path = os.path.join(self.directory, name + EXTENSION)
+            self.tables[name] = Table(path) if os.path.exists(path) else None
+        return self.tables[name]
+
+    def probe_pieces(self, pieces, white_to_move):
+        """Return the table value of (color, symbol, square) pieces for the side to move, or None."""
+        return self.probe_ranks([(RANKS[color][symbol], square) for color, symbol, square in pieces], white_to_move)
+
+    def probe_ranks(self, entries, white_to_move):
+        """Probe (rank, square) pairs, where a piece's rank is its place in the table order."""
+        if len(entries) == 2:
+            return DRAW
+        entries.sort()
+        material = tuple(rank for rank, _ in entries)
+        found = self.materials.get(material)
+        if found is None:
+            found = self.materials[material] = self.find_table(material)
+        table, flipped = found
+        if table is None:
+            return None
+        if flipped:
+            # Swap the colors and mirror the board top to bottom
+            entries = sorted((rank - 6 if rank >= 6 else rank + 6, square ^ 56) for rank, square in entries)
+            white_to_move = not white_to_move
+        return table.value([square for _, square in entries], white_to_move)
+
+    def find_table(self, material):
+        """Return (table or None, flipped) for a sorted tuple of piece ranks."""
+        white = ''.join(ORDER[rank] for rank in material if rank < 6)
+        black = ''.join(ORDER[rank - 6] for rank in material if rank >= 6)
+        (white, black), flipped = canonical(white, black)
+        return self.table(signature(white, black)), flipped
+
+    def probe(self, board):
+        """Return the table value of a Board position for the side to move, or None if it has no table."""
+        white, black = board.pieces['w'], board.pieces['b']
+        if len(white) + len(black) > self.max_pieces:
+            return None
+        if board.castling:
+            return None
+        if board.en_passant_file() >= 0:
+            # The tables leave the right out, so score the moves including the capture
+            value = self.successors_value(board)
+        else:
+            white_ranks, black_ranks = RANKS['w'], RANKS['b']
+            entries = [(white_ranks[piece.symbol], piece.row * 8 + piece.col) for piece in white]
+            entries += [(black_ranks[piece.symbol], piece.row * 8 + piece.col) for piece in black]
+            value = self.probe_ranks(entries, board.white_turn)
+        if value is None or value == ILLEGAL:
+            return None
+        self.hits += 1
+        return value
+
+    def successors_value(self, board):
+        """Return the value a position has given the table values of its successors.
+
+        Returns None if a successor cannot be probed.
+        """
+        best = None
+        for (r, c), (row, col) in board.get_legal_moves():
+            piece = board.board[r][c]
+            for promotion in PROMOTIONS if piece.symbol == 'P' and row in (0, 7) else 'Q':
+                undo = board.make_move(piece, row, col, promotion)
+                value = self.probe(board)
+                board.unmake_move(undo)
+                if value is None:
+                    return None
+                value = successor_value(value)
+                rank = value_to_score(value, 0)
+                if best is None or rank > best[0]:
+                    best = (rank, value)
+        if best is None:
+            # board.check is only kept up to date by update_game_state, not by make_move
+            king = board.white_king if board.white_turn else board.black_king
+            in_check = board.is_square_under_attack(king[0], king[1], 'b' if board.white_turn else 'w')
+            return LOSS if in_check else DRAW
+        return best[1]
+
+    def probe_score(self, board, ply):
+        """Return the engine score of a position at ply from the root, or None if it has no table."""
+        value = self.probe(board)
+        if value is None:
+            return None
+        return value_to_score(value, ply)
+
+    def best_move(self, board):
+        """Return (move, value) of the best move by the tables, or None if the position has no table.
+
+        Wins are converted as fast as possible and losses resisted as long as
+        possible; value is the table value of board for the side to move.
+        """
+        if self.probe(board) is None:
+            return None
+        best = None
+        for move in board.get_legal_moves():
+            (r, c), (row, col) = move
+            undo = board.make_move(board.board[r][c], row, col)
+            value = self.probe(board)
+            board.unmake_move(undo)
+            if value is None:
+                return None
+            # Rank successors from the mover's point of view: quick wins first, long losses next
+            rank = value_to_score(value, 1)
+            if best is None or -rank > best[0]:
+                best = (-rank, move, successor_value(value))
+        return None if best is None else (best[1], best[2])
+
+
+def value_to_score(value, ply):
+    if value == DRAW:
+        return 0
+    if value < LOSS:
+        return MATE - ply - value
+    return -MATE + ply + value - LOSS
+
+
+def successor_value(value):
+    """Return the value of a position for its side to move from the value of a successor."""
+    if value == DRAW:
+        return DRAW
+    if value >= LOSS:
+        return value - LOSS + 1
+    return LOSS + value + 1
+
+
+def generate_table(task):
+    """Generate the table of a material pair into directory and return its statistics; runs in a worker."""
+    directory, white, black = task
+    start = time.perf_counter()
+    name = signature(white, black)
+    kinds = table_kinds(white, black)
+    children = Tablebase(directory)
+    pieces_count = len(kinds)
+    weights = [SQUARES ** (pieces_count - 1 - index) for index in range(pieces_count)]
+    half = SQUARES ** pieces_count
+    colors = [color for color, _ in kinds]
+    symbols = [symbol for _, symbol in kinds]
+    kings = {color: kinds.index((color, 'K')) for color in 'wb'}
+    own = {color: [index for index, kind in enumerate(kinds) if kind[0] == color] for color in 'wb'}
+
+    # Positions right after a double push that can be answered en passant get
+    # extra entries past the 2 * half stored ones: shadows maps the position
+    # without the right to (entry, position before the push) pairs
+    values = bytearray(2 * half)
+    remaining = bytearray(2 * half)
+    external_loss = bytearray(2 * half)
+    scheduled = bytearray(2 * half)
+    shadows = {}
+    pushed_from = []
+    buckets = {}
+
+    def schedule(index, distance):
+        # Only the shortest distance a position is scheduled at counts
+        if scheduled[index] and scheduled[index] <= distance + 1:
+            return
+        if distance > MAX_DISTANCE:
+            raise ValueError(f'{name}: distance to mate {distance} does not fit the format')
+        scheduled[index] = distance + 1
+        buckets.setdefault(distance, array.array('l')).append(index)
+
+    # Forward pass: mark impossible positions, count the moves that stay in the
+    # table and score the captures and promotions that leave it
+    for side, to_move in enumerate('wb'):
+        other = 'b' if to_move == 'w' else 'w'
+        index = side * half - 1
+        for squares in itertools.product(range(SQUARES), repeat=pieces_count):
+            index += 1
+            occupied = set(squares)
+            if (len(occupied) < pieces_count
+                    or any(symbol == 'P' and square // 8 in (0, 7) for symbol, square in zip(symbols, squares))):
+                values[index] = ILLEGAL
+                continue
+            pieces = list(zip(colors, symbols, squares))
+            if attacked(squares[kings[other]], to_move, pieces, occupied):
+                values[index] = ILLEGAL
+                continue
+
+            legal = 0
+            remaining_moves = 0
+            win = None
+            loss = 0
+            for j in own[to_move]:
+                symbol, square = symbols[j], squares[j]
+                if symbol == 'P':
+                    targets = itertools.chain(pawn_pushes(to_move, square, occupied),
+                                              (t for t in PAWN_ATTACKS[to_move][square] if t in occupied))
+                else:
+                    targets = piece_moves(to_move, symbol, square, occupied)
+                for target in targets:
+                    captured = squares.index(target) if target in occupied else -1
+                    if captured >= 0 and colors[captured] == to_move:
+                        continue
+                    after = [piece for k, piece in enumerate(pieces) if k != captured]
+                    moved = j - 1 if 0 <= captured < j else j
+                    after[moved] = (to_move, symbol, target)
+                    king = target if j == kings[to_move] else squares[kings[to_move]]
+                    if attacked(king, other, after, (occupied - {square}) | {target}):
+                        continue
+                    promotion = symbol == 'P' and target // 8 in (0, 7)
+                    if captured < 0 and not promotion:
+                        legal += 1
+                        remaining_moves += 1
+                        continue
+                    # Captures and promotions lead into smaller tables
+                    for promoted in PROMOTIONS if promotion else symbol:
+                        after[moved] = (to_move, promoted, target)
+                        value = children.probe_pieces(after, to_move == 'b')
+                        if value is None:
+                            raise ValueError(f'{name} needs the table for {after}')
+                        legal += 1
+                        if value >= LOSS:
+                            distance = value - LOSS + 1
+                            win = distance if win is None else min(win, distance)
+                        elif value != DRAW:
+                            # The opponent mates in value plies after this move
+                            loss = max(loss, value)
+                            continue
+                        remaining_moves += 1
+
+            # A pawn of the other side that can have just made a double push,
+            # capturable en passant: the position with that right has the same
+            # moves plus the captures, which leave the table
+            for k in own[other]:
+                if symbols[k] != 'P' or squares[k] // 8 != (4 if other == 'w' else 3):
+                    continue
+                passed = squares[k] - PAWN_FORWARD[other] * 8
+                origin = passed - PAWN_FORWARD[other] * 8
+                if passed in occupied or origin in occupied:
+                    continue
+                captures = 0
+                shadow_remaining = remaining_moves
+                shadow_win = win
+                shadow_loss = loss
+                for j in own[to_move]:
+                    if symbols[j] != 'P' or passed not in PAWN_ATTACKS[to_move][squares[j]]:
+                        continue
+                    after = [piece for i, piece in enumerate(pieces) if i != k]
+                    after[j - 1 if k < j else j] = (to_move, 'P', passed)
+                    if attacked(squares[kings[to_move]], other, after, (occupied - {squares[j], squares[k]}) | {passed}):
+                        continue
+                    value = children.probe_pieces(after, to_move == 'b')
+                    if value is None:
+                        raise ValueError(f'{name} needs the table for {after}')
+                    captures += 1
+                    if value >= LOSS:
+                        distance = value - LOSS + 1
+                        shadow_win = distance if shadow_win is None else min(shadow_win, distance)
+                    elif value != DRAW:
+                        shadow_loss = max(shadow_loss, value)
+                        continue
+                    shadow_remaining += 1
+                if not captures:
+                    continue
+                shadow = len(values)
+                values.append(0)
+                remaining.append(shadow_remaining)
+                external_loss.append(shadow_loss)
+                scheduled.append(0)
+                before = index + (half if side == 0 else -half) + (origin - squares[k]) * weights[k]
+                shadows.setdefault(index, []).append((shadow, before))
+                pushed_from.append(before)
+                if shadow_win is not None:
+                    schedule(shadow, shadow_win)
+                if shadow_remaining == 0:
+                    schedule(shadow, shadow_loss + 1)
+
+            if legal == 0:
+                if attacked(squares[kings[to_move]], other, pieces, occupied):
+                    schedule(index, 0)
+                continue
+            if win is not None:
+                schedule(index, win)
+            remaining[index] = remaining_moves
+            external_loss[index] = loss
+            if remaining_moves == 0:
+                schedule(index, loss + 1)
+
+    # Backward pass: settle positions in order of distance to mate. A position
+    # lost in d makes its predecessors won in d + 1; a position whose moves all
+    # lead to wins for the opponent is lost one ply after the longest of them.
+    # The position before a double push that allows en passant leads to the
+    # extra entry rather than to the stored position; every other move into a
+    # stored position also reaches its extra entries
+    def settled(predecessor, distance):
+        entries = shadows.get(predecessor)
+        for entry in (predecessor,) if entries is None else [predecessor] + [shadow for shadow, _ in entries]:
+            if values[entry]:
+                continue
+            if distance % 2 == 0:
+                schedule(entry, distance + 1)
+            else:
+                remaining[entry] -= 1
+                if remaining[entry] == 0:
+                    schedule(entry, max(distance, external_loss[entry]) + 1)
+
+    distance = 0
+    while buckets:
+        for index in buckets.pop(distance, ()):
+            if values[index]:
+                continue
+            values[index] = distance if distance % 2 else LOSS + distance
+            if index >= 2 * half:
+                settled(pushed_from[index - 2 * half], distance)
+                continue
+            side, rest = divmod(index, half)
+            mover = 'b' if side == 0 else 'w'
+            predecessor_base = (1 - side) * half - side * half
+            squares = []
+            for weight in weights:
+                square, rest = divmod(rest, weight)
+                squares.append(square)
+            occupied = set(squares)
+            before_push = [before for _, before in shadows.get(index, ())]
+            for j in own[mover]:
+                symbol, square = symbols[j], squares[j]
+                if symbol == 'P':
+                    origins = unmove_pawn(mover, square, occupied)
+                else:
+                    origins = (origin for origin in piece_moves(mover, symbol, square, occupied)
+                               if origin not in occupied)
+                for origin in origins:
+                    predecessor = index + predecessor_base + (origin - square) * weights[j]
+                    if predecessor in before_push:
+                        continue
+                    settled(predecessor, distance)
+        distance += 1
+    del values[2 * half:]
+    children.close()
+
+    path = os.path.join(directory, name + EXTENSION)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, pieces_count, name.encode()))
+        f.write(values)
+    os.replace(path + '.tmp', path)
+    wins = sum(1 for value in values if 0 < value < LOSS)
+    losses = sum(1 for value in values if LOSS <= value < ILLEGAL)
+    legal = len(values) - values.count(ILLEGAL)
+    return {
+        'table': name,
+        'positions': legal,
+        'wins': wins,
+        'draws': legal - wins - losses,
+        'losses': losses,
+        'longest_mate': max((value for value in values if value < LOSS), default=0),
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def unmove_pawn(color, square, occupied):
+    """Yield the squares a pawn on square could have come from without capturing."""
+    backward = -PAWN_FORWARD[color] * 8
+    origin = square + backward
+    start_row = 6 if color == 'w' else 1
+    if origin in occupied or origin // 8 in (0, 7):
+        return
+    yield origin
+    if origin // 8 - PAWN_FORWARD[color] == start_row and origin + backward not in occupied:
+        yield origin + backward
+
+
+def materials(max_pieces):
+    """Return the stored (white, black) material pairs of every table with 3 to max_pieces pieces."""
+    pairs = set()
+    for extra in range(1, max_pieces - 1):
+        for pieces in itertools.combinations_with_replacement('QRBNP', extra):
+            for split in range(extra + 1):
+                for white_extra in itertools.combinations(range(extra), split):
+                    white = 'K' + sort_material(pieces[i] for i in white_extra)
+                    black = 'K' + sort_material(pieces[i] for i in range(extra) if i not in white_extra)
+                    pairs.add(canonical(white, black)[0])
+    return sorted(pairs, key=generation_order)
+
+
+def generation_order(pair):
+    # Captures lead to fewer pieces and promotions to fewer pawns, so those come first
+    return len(pair[0] + pair[1]), (pair[0] + pair[1]).count('P'), pair
+
+
+def parse_signature(name):
+    """Return the stored (white, black) material pair of a table name such as KQvKR."""
+    white, _, black = name.upper().partition('V')
+    if (not white.startswith('K') or not black.startswith('K')
+            or any(symbol not in 'QRBNP' for symbol in white[1:] + black[1:])):
+        raise ValueError(f'not a table name: {name!r}')
+    if len(white + black) > MAX_PIECES:
+        raise ValueError(f'{name}: tables have at most {MAX_PIECES} pieces')
+    return canonical(sort_material(white), sort_material(black))[0]
+
+
+def successor_materials(white, black):
+    """Return the stored material pairs a capture or promotion in a table leads to."""
+    pairs = set()
+    for side, (mover, other) in enumerate(((white, black), (black, white))):
+        for index in range(1, len(other)):
+            rest = other[:index] + other[index + 1:]
+            pairs.add((mover, rest) if side == 0 else (rest, mover))
+        for index, symbol in enumerate(mover):
+            if symbol == 'P':
+                for promoted in PROMOTIONS:
+                    changed = sort_material(mover[:index] + promoted + mover[index + 1:])
+                    pairs.add((changed, other) if side == 0 else (other, changed))
+    return {canonical(sort_material(w), sort_material(b))[0] for w, b in pairs if len(w + b) > 2}
+
+
+def required_materials(names):
+    """Return the stored material pairs of the named tables and of every table they lead to."""
+    pending = [parse_signature(name) for name in names]
+    pairs = set()
+    while pending:
+        pair = pending.pop()
+        if pair not in pairs:
+            pairs.add(pair)
+            pending.extend(successor_materials(*pair))
+    return pairs
+
+
+def generate(directory, max_pieces=3, workers=None, force=False, on_table=None, tables=None):
+    """Generate every table with up to max_pieces pieces into directory; return their statistics.
+
+    With tables, a list of names such as KQvKR, only those and the smaller
+    tables they need are generated.
+    """
+    os.makedirs(directory, exist_ok=True)
+    pairs = sorted(required_materials(tables), key=generation_order) if tables else materials(max_pieces)
+    pending = [pair for pair in pairs
+               if force or not os.path.exists(os.path.join(directory, signature(*pair) + EXTENSION))]
+    stats = []
+    workers = workers or os.cpu_count() or 1
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        for _, group in itertools.groupby(pending, key=lambda pair: generation_order(pair)[:2]):
+            tasks = [(directory, white, black) for white, black in group]
+            results = pool.imap_unordered(generate_table, tasks) if pool else map(generate_table, tasks)
+            for result in results:
+                stats.append(result)
+                if on_table is not None:
+                    on_table(result)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return stats
+
+
+def describe(value):
+    if value is None:
+        return 'not in the tables'
+    if value == DRAW:
+        return 'draw'
+    if value < LOSS:
+        return f'win, mate in {(value + 1) // 2}'
+    return 'checkmated' if value == LOSS else f'loss, mated in {(value - LOSS) // 2}'
+
+
+def verify(tablebase, positions=1000, seed=0):
+    """Check random table positions against their successors through Board; return the mismatches."""
+    from chess import Board, FEN_PIECES, ROWS, COLS
+    rng = random.Random(seed)
+    names = sorted(name[:-len(EXTENSION)] for name in os.listdir(tablebase.directory) if name.endswith(EXTENSION))
+    mismatches = []
+    checked = 0
+    while checked < positions and names:
+        white, black = rng.choice(names).split('v')
+        kinds = table_kinds(white, black)
+        squares = rng.sample(range(SQUARES), len(kinds))
+        white_to_move = rng.random() < 0.5
+        value = tablebase.probe_pieces([(color, symbol, square) for (color, symbol), square in zip(kinds, squares)],
+                                       white_to_move)
+        if value == ILLEGAL:
+            continue
+        grid = [[0] * COLS for _ in range(ROWS)]
+        for (color, symbol), square in zip(kinds, squares):
+            grid[square // 8][square % 8] = FEN_PIECES[symbol.lower()](square // 8, square % 8, color)
+        board = Board()
+        board.set_position(grid, white_to_move, 0)
+        expected = tablebase.successors_value(board)
+        checked += 1
+        if expected != value:
+            mismatches.append((board.fen(), value, expected))
+    return checked, mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate and probe endgame tablebases.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    generate_parser = commands.add_parser('generate', help='generate the tables')
+    generate_parser.add_argument('directory', help='directory for the table files')
+    generate_parser.add_argument('--pieces', type=int, choices=(3, 4), default=3, help='largest piece count')
+    generate_parser.add_argument('--tables', nargs='+', metavar='NAME',
+                                 help='generate only these tables (e.g. KQvKR) and the ones they need')
+    generate_parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes')
+    generate_parser.add_argument('--force', action='store_true', help='regenerate existing tables')
+    probe_parser = commands.add_parser('probe', help='show the table value and best move of a position')
+    probe_parser.add_argument('directory', help='directory of the table files')
+    probe_parser.add_argument('--fen', required=True, help='position to probe')
+    verify_parser = commands.add_parser('verify', help='check random positions against the rules engine')
+    verify_parser.add_argument('directory', help='directory of the table files')
+    verify_parser.add_argument('--positions', type=int, default=1000, help='positions to check')
+    verify_parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        def on_table(stats):
+            print(f"{stats['table']:<8} {stats['positions']:>9} positions  +{stats['wins']} ={stats['draws']} "
+                  f"-{stats['losses']}  longest mate {stats['longest_mate']} plies  {stats['seconds']:.1f}s",
+                  flush=True)
+        generate(args.directory, args.pieces, args.workers, args.force, on_table, args.tables)
+        return 0
+
+    tablebase = Tablebase(args.directory)
+    if args.command == 'probe':
+        from chess import Board
+        from notation import move_to_san
+        board = Board(args.fen)
+        start = time.perf_counter()
+        value = tablebase.probe(board)
+        microseconds = (time.perf_counter() - start) * 1e6
+        print(f'{describe(value)} ({microseconds:.1f} us)')
+        best = tablebase.best_move(board)
+        if best is not None:
+            (r, c), (row, col) = best[0]
+            promotion = 'Q' if board.board[r][c].symbol == 'P' and row in (0, 7) else None
+            print(f'best move {move_to_san(board, ((r, c), (row, col), promotion))}')
+        return 0
+
+    checked, mismatches = verify(tablebase, args.positions, args.seed)
+    for fen, value, expected in mismatches[:20]:
+        print(f'{fen}: table says {describe(value)}, successors say {describe(expected)}')
+    print(f'{checked} positions checked, {len(mismatches)} mismatches')
+    return 0 if not mismatches else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
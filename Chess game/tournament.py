@@ -0,0 +1,330 @@
+"""Headless engine-vs-engine tournaments for testing engine changes.
+
+Two engine configurations play each other from randomized openings. Every
+opening is played twice with colors swapped, and the games run on a
+process pool. Finished games are streamed to PGN and/or JSONL. The runner
+reports wins, draws and losses of the first engine, the Elo difference
+with a 95% error margin, and games per minute:
+
+    python tournament.py --engine new:time=0.1,depth=6 --engine old:time=0.1 \\
+        --games 200 --workers 8 --pgn games.pgn --jsonl games.jsonl
+
+Engine settings are time (seconds per move), nodes, depth and hash (MB).
+Games are adjudicated as draws on threefold repetition, the 50-move rule,
+insufficient material or the ply limit. They are adjudicated as wins when
+one side stays ahead by --material-margin centipawns of material for
+--material-plies plies in a row.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from chess import Board, Pawn, Knight, Bishop, ROWS, START_FEN
+from engine import Engine
+from evaluation import PIECE_VALUES
+from notation import legal_moves, move_to_san, move_to_uci, parse_san, parse_uci, push
+from pgn import read_games, format_game
+
+ENGINE_SETTINGS = {'time': ('time_limit', float), 'nodes': ('node_limit', int),
+                   'depth': ('max_depth', int), 'hash': ('hash_mb', int)}
+
+# Engines of the current worker process, keyed by name, color and settings
+worker_engines = {}
+
+
+def parse_engine(text):
+    """Parse 'name:key=value,...' into (name, Engine keyword arguments)."""
+    name, _, settings = text.partition(':')
+    options = {}
+    for item in filter(None, settings.split(',')):
+        key, _, value = item.partition('=')
+        if key not in ENGINE_SETTINGS:
+            raise ValueError(f'Unknown engine setting: {key!r}')
+        option, convert = ENGINE_SETTINGS[key]
+        options[option] = convert(value)
+    return name, options
+
+
+def engine_for(name, color, options):
+    """Return this process's Engine for an entrant playing color.
+
+    Each side of a game gets its own Engine, even in self-play with equal
+    settings, so one side's transposition table, history and killers never
+    feed the other's.
+    """
+    key = (name, color, tuple(sorted(options.items())))
+    if key not in worker_engines:
+        worker_engines[key] = Engine(**options)
+    return worker_engines[key]
+
+
+def random_opening(rng, plies):
+    """Return plies random legal moves from the start position as UCI strings."""
+    board = Board()
+    moves = []
+    for _ in range(plies):
+        choices = legal_moves(board)
+        if not choices:
+            break
+        move = rng.choice(choices)
+        moves.append(move_to_uci(move))
+        push(board, move)
+    return moves
+
+
+def book_openings(path, plies):
+    """Return the (FEN, UCI moves) opening of every game in a PGN file, skipping illegal games.
+
+    An opening is the first plies moves of a game, played from its FEN tag
+    or from the start position.
+    """
+    openings = []
+    for game in read_games(path):
+        fen = game.headers.get('FEN', START_FEN)
+        moves = []
+        try:
+            board = Board(fen)
+            for san in game.moves[:plies]:
+                move = parse_san(board, san)
+                moves.append(move_to_uci(move))
+                push(board, move)
+        except ValueError:
+            continue
+        openings.append((fen, moves))
+    return openings
+
+
+def material(board):
+    """Return White's material minus Black's in centipawns."""
+    return (sum(PIECE_VALUES[piece.symbol] for piece in board.pieces['w'])
+            - sum(PIECE_VALUES[piece.symbol] for piece in board.pieces['b']))
+
+
+def insufficient_material(board):
+    """True for king against king, or king and one minor piece against king."""
+    pieces = [piece for color in 'wb' for piece in board.pieces[color]]
+    minors = [piece for piece in pieces if isinstance(piece, (Knight, Bishop))]
+    return len(pieces) - len(minors) == 2 and len(minors) <= 1
+
+
+def play_game(task):
+    """Play one game and return its record as a dict; runs in a worker process."""
+    game_id, (fen, opening), white, black, rules = task
+    (white_name, white_options), (black_name, black_options) = white, black
+    engines = {'w': engine_for(white_name, 'w', white_options), 'b': engine_for(black_name, 'b', black_options)}
+    for engine in engines.values():
+        engine.new_game()
+
+    board = Board(fen)
+    sans = []
+    material_plies = 0
+    nodes = 0
+    result = termination = None
+    start = time.perf_counter()
+    while True:
+        if board.checkmate:
+            result, termination = ('0-1' if board.white_turn else '1-0'), 'checkmate'
+        elif board.stalemate:
+            result, termination = '1/2-1/2', 'stalemate'
+        elif board.draw_reason is not None:
+            result, termination = '1/2-1/2', board.draw_reason
+        elif insufficient_material(board):
+            result, termination = '1/2-1/2', 'insufficient material'
+        elif len(sans) >= rules['max_plies']:
+            result, termination = '1/2-1/2', 'ply limit'
+        elif material_plies >= rules['material_plies']:
+            result, termination = ('1-0' if material(board) > 0 else '0-1'), 'material'
+        if result is not None:
+            break
+
+        if len(sans) < len(opening):
+            move = parse_uci(board, opening[len(sans)])
+        else:
+            search = engines['w' if board.white_turn else 'b'].search(board)
+            nodes += search.nodes
+            (r, c), (row, col) = search.move
+            promotion = 'Q' if isinstance(board.board[r][c], Pawn) and row in (0, ROWS - 1) else None
+            move = ((r, c), (row, col), promotion)
+
+        sans.append(move_to_san(board, move))
+        push(board, move)
+        material_plies = material_plies + 1 if abs(material(board)) >= rules['material_margin'] else 0
+
+    return {
+        'id': game_id,
+        'white': white_name,
+        'black': black_name,
+        'result': result,
+        'termination': termination,
+        'fen': fen,
+        'opening': opening,
+        'moves': sans,
+        'plies': len(sans),
+        'nodes': nodes,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def elo_difference(wins, draws, losses):
+    """Return the Elo difference implied by a score and its 95% error margin."""
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0, float('inf')
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+
+    def elo(p):
+        p = min(max(p, 1e-6), 1 - 1e-6)
+        return -400 * math.log10(1 / p - 1)
+
+    return elo(score), (elo(score + margin) - elo(score - margin)) / 2
+
+
+class Tournament:
+    """Pairs two engines over a set of openings and collects the results."""
+
+    def __init__(self, first, second, games=100, workers=1, random_plies=4, openings=None, seed=0,
+                 max_plies=400, material_margin=1000, material_plies=10):
+        self.first = first
+        self.second = second
+        self.games = games
+        self.workers = max(1, workers)
+        self.random_plies = random_plies
+        self.openings = openings
+        self.seed = seed
+        self.rules = {'max_plies': max_plies, 'material_margin': material_margin,
+                      'material_plies': material_plies}
+        self.wins = self.draws = self.losses = 0
+        self.plies = 0
+        self.seconds = 0.0
+
+    def tasks(self):
+        rng = random.Random(self.seed)
+        for game_id in range(self.games):
+            if game_id % 2 == 0:
+                if self.openings:
+                    opening = self.openings[(game_id // 2) % len(self.openings)]
+                else:
+                    opening = START_FEN, random_opening(rng, self.random_plies)
+            # Every opening is played twice, with the first engine on each side
+            white, black = (self.first, self.second) if game_id % 2 == 0 else (self.second, self.first)
+            yield game_id, opening, white, black, self.rules
+
+    def record(self, game):
+        """Add a finished game to the score of the first engine."""
+        if game['result'] == '1/2-1/2':
+            self.draws += 1
+        elif (game['result'] == '1-0') == (game['white'] == self.first[0]):
+            self.wins += 1
+        else:
+            self.losses += 1
+        self.plies += game['plies']
+
+    def run(self, on_game=None):
+        """Play every game, calling on_game(record) as each one finishes."""
+        start = time.perf_counter()
+        if self.workers == 1:
+            games = map(play_game, self.tasks())
+            pool = None
+        else:
+            pool = multiprocessing.Pool(self.workers)
+            games = pool.imap_unordered(play_game, self.tasks())
+        try:
+            for game in games:
+                self.record(game)
+                if on_game is not None:
+                    on_game(game)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        self.seconds = time.perf_counter() - start
+        return self.summary()
+
+    def summary(self):
+        played = self.wins + self.draws + self.losses
+        elo, margin = elo_difference(self.wins, self.draws, self.losses)
+        return {
+            'first': self.first[0],
+            'second': self.second[0],
+            'games': played,
+            'wins': self.wins,
+            'draws': self.draws,
+            'losses': self.losses,
+            'score': (self.wins + self.draws / 2) / played if played else 0.0,
+            'elo': round(elo, 1),
+            'elo_margin': round(margin, 1),
+            'seconds': round(self.seconds, 3),
+            'games_per_minute': round(played * 60 / self.seconds, 2) if self.seconds > 0 else 0.0,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play an engine-vs-engine match.')
+    parser.add_argument('--engine', action='append', default=[], metavar='NAME:KEY=VALUE,...',
+                        help='engine settings (time, nodes, depth, hash); give exactly two')
+    parser.add_argument('--games', type=int, default=100, help='number of games (pairs of colors per opening)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--random-plies', type=int, default=4, help='random opening moves before the engines play')
+    parser.add_argument('--openings', metavar='PGN', help='take openings from the games of a PGN file instead')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the random openings')
+    parser.add_argument('--max-plies', type=int, default=400, help='adjudicate a draw after this many plies')
+    parser.add_argument('--material-margin', type=int, default=1000,
+                        help='material lead in centipawns that adjudicates a win')
+    parser.add_argument('--material-plies', type=int, default=10,
+                        help='plies the material lead must last to adjudicate a win')
+    parser.add_argument('--pgn', metavar='PATH', help='append the games to PATH as PGN')
+    parser.add_argument('--jsonl', metavar='PATH', help='append the games to PATH as JSON lines')
+    args = parser.parse_args(argv)
+
+    if len(args.engine) != 2:
+        parser.error('give exactly two --engine options')
+    first, second = (parse_engine(text) for text in args.engine)
+    if first[0] == second[0]:
+        parser.error('the two engines need different names')
+    openings = book_openings(args.openings, args.random_plies) if args.openings else None
+    if args.openings and not openings:
+        parser.error(f'no playable games in {args.openings}')
+    tournament = Tournament(first, second, args.games, args.workers, args.random_plies, openings, args.seed,
+                            args.max_plies, args.material_margin, args.material_plies)
+
+    pgn_file = open(args.pgn, 'a') if args.pgn else None
+    jsonl_file = open(args.jsonl, 'a') if args.jsonl else None
+
+    def on_game(game):
+        if pgn_file:
+            headers = {'Event': 'Tournament', 'Site': '?', 'Date': time.strftime('%Y.%m.%d'),
+                       'Round': game['id'] + 1, 'White': game['white'], 'Black': game['black'],
+                       'Result': game['result'], 'Termination': game['termination']}
+            if game['fen'] != START_FEN:
+                headers.update(SetUp='1', FEN=game['fen'])
+            pgn_file.write(format_game(headers, game['moves'], game['result']))
+            pgn_file.flush()
+        if jsonl_file:
+            jsonl_file.write(json.dumps(game) + '\n')
+            jsonl_file.flush()
+        s = tournament.summary()
+        print(f"game {game['id'] + 1}: {game['white']} - {game['black']} {game['result']} "
+              f"({game['termination']}, {game['plies']} plies)  +{s['wins']} ={s['draws']} -{s['losses']}")
+
+    try:
+        summary = tournament.run(on_game)
+    finally:
+        for f in (pgn_file, jsonl_file):
+            if f:
+                f.close()
+
+    print(f"{summary['first']} vs {summary['second']}: +{summary['wins']} ={summary['draws']} -{summary['losses']} "
+          f"score {summary['score']:.3f}  Elo {summary['elo']:+.1f} +/- {summary['elo_margin']:.1f}  "
+          f"{summary['games_per_minute']} games/min")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
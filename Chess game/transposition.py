@@ -0,0 +1,88 @@
+"""Bounded hash table keyed by 64-bit Zobrist position keys.
+
+The table has a fixed number of buckets derived from a memory cap in MB and
+the estimated size of an entry. With the 'depth' policy a bucket has two
+slots: the first keeps the entry searched deepest and the second always
+takes the newest entry. With the 'always' policy a bucket is a single slot
+that a new entry simply replaces.
+"""
+
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+
+# Rough cost of one stored entry in CPython: the (key, depth, value) tuple,
+# the 64-bit key object and the list slot, with a small value. Used to turn MB
+# into a slot count; tables with bigger values pass their own estimate.
+ENTRY_BYTES = 128
+
+
+class TranspositionTable:
+    def __init__(self, size_mb=16, policy='depth', entry_bytes=ENTRY_BYTES):
+        if policy not in ('depth', 'always'):
+            raise ValueError(f'Unknown replacement policy: {policy!r}')
+        self.policy = policy
+        self.ways = 2 if policy == 'depth' else 1
+        self.entry_bytes = entry_bytes
+        self.resize(size_mb)
+
+    def resize(self, size_mb):
+        """Reallocate the table for a new memory cap, dropping all entries."""
+        self.size_mb = size_mb
+        self.buckets = max(1, int(size_mb * 1024 * 1024) // (self.ways * self.entry_bytes))
+        self.clear()
+
+    def clear(self):
+        self.entries = [None] * (self.ways * self.buckets)
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def probe(self, key):
+        """Return (depth, value) stored for key, or None."""
+        self.probes += 1
+        index = (key % self.buckets) * self.ways
+        entries = self.entries
+        entry = entries[index]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1], entry[2]
+        if self.ways == 1:
+            return None
+        entry = entries[index + 1]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1], entry[2]
+        return None
+
+    def store(self, key, depth, value):
+        """Store value for key, searched to depth, following the replacement policy."""
+        self.stores += 1
+        index = (key % self.buckets) * self.ways
+        entries = self.entries
+        first = entries[index]
+        if self.policy == 'depth' and first is not None and first[0] != key and first[1] > depth:
+            # Keep the deeper entry and put this one in the always-replace slot
+            index += 1
+            first = entries[index]
+        if first is not None and first[0] != key:
+            self.replacements += 1
+        entries[index] = (key, depth, value)
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def filled(self):
+        """Return the fraction of slots in use."""
+        return sum(entry is not None for entry in self.entries) / len(self.entries)
+
+    def stats(self):
+        return {
+            'size_mb': self.size_mb,
+            'slots': len(self.entries),
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hit_rate,
+            'stores': self.stores,
+            'replacements': self.replacements,
+        }
@@ -0,0 +1,308 @@
+"""Universal Chess Interface front-end for the engine.
+
+Run it as the engine command of any UCI GUI or match runner:
+
+    python uci.py
+
+The search runs on its own thread while the main thread keeps reading
+commands, so stop, ponderhit, isready and quit are answered during a
+search. Supported commands: uci, isready, setoption (Hash, Threads,
+Ponder, BookFile, TablebasePath), ucinewgame, position [startpos | fen FEN]
+[moves ...], go [wtime btime winc binc movestogo movetime depth nodes
+infinite ponder], stop, ponderhit and quit. Positions found in the BookFile
+opening book are answered from the book without searching, and the
+search scores endgames in the TablebasePath tables exactly, with any number
+of Threads.
+"""
+import argparse
+import sys
+import threading
+import time
+
+from chess import Board, Pawn, ROWS, START_FEN, square_name
+from engine import Engine, MATE, MAX_PLY
+from book import OpeningBook
+from tablebase import open_tablebase
+from notation import move_to_uci, parse_uci, push
+from parallel import ParallelEngine
+from profiler import profile_to
+
+NAME = 'Chess-game'
+AUTHOR = 'Chess-game contributors'
+
+DEFAULT_HASH_MB = 16
+MAX_HASH_MB = 4096
+MAX_THREADS = 64
+
+# Time kept in hand for communication delays, in seconds
+MOVE_OVERHEAD = 0.05
+# Moves the remaining clock time is spread over when movestogo is not given
+DEFAULT_MOVES_TO_GO = 30
+
+GO_PARAMETERS = ('wtime', 'btime', 'winc', 'binc', 'movestogo', 'movetime', 'depth', 'nodes')
+
+
+def allocate_time(params, white_turn):
+    """Return the seconds to spend on a move from the go parameters, or None for no limit."""
+    if 'movetime' in params:
+        return max(0.0, params['movetime'] / 1000 - MOVE_OVERHEAD)
+    remaining = params.get('wtime' if white_turn else 'btime')
+    if remaining is None:
+        return None
+    remaining /= 1000
+    increment = params.get('winc' if white_turn else 'binc', 0) / 1000
+    budget = remaining / params.get('movestogo', DEFAULT_MOVES_TO_GO) + increment * 0.75
+    return max(0.01, min(budget, remaining / 2 - MOVE_OVERHEAD))
+
+
+def format_score(score):
+    if score >= MATE - MAX_PLY:
+        return f'mate {(MATE - score + 1) // 2}'
+    if score <= -MATE + MAX_PLY:
+        return f'mate -{(MATE + score) // 2}'
+    return f'cp {score}'
+
+
+def pv_to_uci(board, pv):
+    """Return the legal prefix of pv as UCI strings, leaving board unchanged."""
+    moves = []
+    undos = []
+    for (r, c), (row, col) in pv:
+        if ((r, c), (row, col)) not in board.get_legal_moves():
+            break
+        piece = board.board[r][c]
+        promotion = 'q' if isinstance(piece, Pawn) and row in (0, ROWS - 1) else ''
+        moves.append(square_name(r, c) + square_name(row, col) + promotion)
+        undos.append(board.make_move(piece, row, col))
+    for undo in reversed(undos):
+        board.unmake_move(undo)
+    return moves
+
+
+class UciSession:
+    """One UCI conversation: parses commands and drives the engine."""
+
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.hash_mb = DEFAULT_HASH_MB
+        self.threads = 1
+        self.book = None
+        self.tablebase = None
+        self.engine = self.create_engine()
+        self.board = Board()
+        self.search_thread = None
+        self.pondering = False
+        self.infinite = False
+        self.ponder_time = None
+        self.ponder_timer = None
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def create_engine(self):
+        if self.threads > 1:
+            return ParallelEngine(workers=self.threads, time_limit=None, hash_mb=self.hash_mb,
+                                  tablebase=self.tablebase)
+        return Engine(time_limit=None, hash_mb=self.hash_mb, tablebase=self.tablebase)
+
+    def run(self, lines=sys.stdin):
+        """Handle commands from lines until quit or end of input."""
+        for line in lines:
+            if not self.handle(line):
+                break
+        self.stop_search()
+        if isinstance(self.engine, ParallelEngine):
+            self.engine.close()
+
+    def handle(self, line):
+        """Handle one command line; return False on quit."""
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == 'uci':
+            self.send(f'id name {NAME}')
+            self.send(f'id author {AUTHOR}')
+            self.send(f'option name Hash type spin default {DEFAULT_HASH_MB} min 1 max {MAX_HASH_MB}')
+            self.send(f'option name Threads type spin default 1 min 1 max {MAX_THREADS}')
+            self.send('option name Ponder type check default false')
+            self.send('option name BookFile type string default <empty>')
+            self.send('option name TablebasePath type string default <empty>')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'setoption':
+            self.set_option(args)
+        elif command == 'ucinewgame':
+            self.stop_search()
+            self.engine.new_game()
+            self.board = Board()
+        elif command == 'position':
+            self.stop_search()
+            self.set_position(args)
+        elif command == 'go':
+            self.stop_search()
+            self.go(args)
+        elif command == 'stop':
+            self.stop_search()
+        elif command == 'ponderhit':
+            self.ponder_hit()
+        elif command == 'quit':
+            return False
+        return True
+
+    def set_option(self, args):
+        # setoption name <id> [value <x>]
+        if 'name' not in args:
+            return
+        value_index = args.index('value') if 'value' in args else len(args)
+        name = ' '.join(args[args.index('name') + 1:value_index]).lower()
+        value = ' '.join(args[value_index + 1:])
+        self.stop_search()
+        if name == 'bookfile':
+            if self.book is not None:
+                self.book.close()
+            try:
+                self.book = OpeningBook(value) if value and value != '<empty>' else None
+            except OSError as error:
+                self.book = None
+                self.send(f'info string {error}')
+            return
+        if name == 'tablebasepath':
+            if self.tablebase is not None:
+                self.tablebase.close()
+            try:
+                self.tablebase = open_tablebase(value) if value and value != '<empty>' else None
+            except OSError as error:
+                self.tablebase = None
+                self.send(f'info string {error}')
+            if isinstance(self.engine, Engine):
+                self.engine.tablebase = self.tablebase
+            else:
+                # The workers open the tables when they start
+                self.engine.close()
+                self.engine = self.create_engine()
+            return
+        if name not in ('hash', 'threads'):
+            return
+        try:
+            number = int(value)
+        except ValueError:
+            self.send(f'info string Invalid value for {name}: {value!r}')
+            return
+        if name == 'hash':
+            self.hash_mb = min(max(1, number), MAX_HASH_MB)
+        else:
+            self.threads = min(max(1, number), MAX_THREADS)
+        if isinstance(self.engine, ParallelEngine):
+            self.engine.close()
+        self.engine = self.create_engine()
+
+    def set_position(self, args):
+        if args[:1] == ['startpos']:
+            fen, rest = START_FEN, args[1:]
+        elif args[:1] == ['fen']:
+            end = args.index('moves') if 'moves' in args else len(args)
+            fen, rest = ' '.join(args[1:end]), args[end:]
+        else:
+            return
+        board = Board()
+        try:
+            board.load_fen(fen)
+            for text in rest[1:] if rest[:1] == ['moves'] else []:
+                push(board, parse_uci(board, text))
+        except ValueError as error:
+            self.send(f'info string {error}')
+            return
+        self.board = board
+
+    def go(self, args):
+        params = {}
+        for i, token in enumerate(args[:-1]):
+            if token in GO_PARAMETERS:
+                try:
+                    params[token] = int(args[i + 1])
+                except ValueError:
+                    self.send(f'info string Invalid value for {token}: {args[i + 1]!r}')
+                    return
+        self.pondering = 'ponder' in args
+        self.infinite = 'infinite' in args
+        if self.book is not None and not self.pondering and 'infinite' not in args:
+            move = self.book.choose(self.board)
+            if move is not None:
+                self.send(f'bestmove {move_to_uci(move)}')
+                return
+        time_limit = allocate_time(params, self.board.white_turn)
+        if self.pondering or 'infinite' in args:
+            # Search until stop, or until ponderhit starts the clock
+            self.ponder_time = time_limit
+            time_limit = None
+        self.engine.prepare_search()
+        self.search_thread = threading.Thread(
+            target=self.search, args=(time_limit, params.get('nodes'), params.get('depth')), daemon=True)
+        self.search_thread.start()
+
+    def search(self, time_limit, node_limit, max_depth):
+        board = self.board
+        result = self.engine.search(board, time_limit=time_limit, node_limit=node_limit,
+                                    max_depth=max_depth, on_info=lambda info: self.send_info(board, info))
+        if not isinstance(self.engine, Engine):
+            self.send_info(board, result)
+        # UCI does not allow bestmove while pondering until stop or ponderhit,
+        # or in an infinite search until stop, even after a mate or max depth
+        while self.pondering or self.infinite:
+            time.sleep(0.01)
+        moves = pv_to_uci(board, result.pv) if result.move is not None else []
+        if not moves and result.move is not None:
+            moves = pv_to_uci(board, [result.move])
+        if not moves:
+            self.send('bestmove 0000')
+        elif len(moves) > 1:
+            self.send(f'bestmove {moves[0]} ponder {moves[1]}')
+        else:
+            self.send(f'bestmove {moves[0]}')
+
+    def send_info(self, board, info):
+        pv = ' '.join(pv_to_uci(board, info.pv))
+        self.send(f'info depth {info.depth} score {format_score(info.score)} nodes {info.nodes} '
+                  f'nps {info.nps} time {int(info.seconds * 1000)} pv {pv}')
+
+    def ponder_hit(self):
+        """The opponent played the expected move: continue the search against the clock."""
+        self.pondering = False
+        if self.ponder_time is not None and self.search_thread is not None:
+            self.ponder_timer = threading.Timer(self.ponder_time, self.engine.stop)
+            self.ponder_timer.daemon = True
+            self.ponder_timer.start()
+
+    def stop_search(self):
+        """Stop a running search and wait for its bestmove."""
+        if self.search_thread is None:
+            return
+        self.pondering = False
+        self.infinite = False
+        # The search was prepared before its thread started, so the request
+        # holds even if it has not begun searching yet
+        self.engine.stop()
+        self.search_thread.join()
+        self.search_thread = None
+        if self.ponder_timer is not None:
+            self.ponder_timer.cancel()
+            self.ponder_timer = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the engine as a UCI engine on stdin and stdout.')
+    parser.add_argument('--profile', metavar='PATH', help='write a profile of the run to PATH and PATH.pstats')
+    args = parser.parse_args(argv)
+    Board.enable_move_cache()
+    profile_to(args.profile)
+    UciSession().run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())